@@ -1,7 +1,17 @@
 from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from typing import Awaitable, Callable, Optional
 import httpx
+import asyncio
+import math
 import os
+import time
+from snapshot import PartialSnapshot, Snapshot
+from metrics import MetricsMiddleware, metrics_response, registry
+from tracing import TracingMiddleware, exporter as trace_exporter, span
+from response_cache import RESPONSE_CACHE_ENABLED, ResponseCache
+from breaker import CircuitOpenError, FAILURE_STATUSES, RETRY_MAX_ATTEMPTS, breaker_status, get_breaker, retry_budget, wait_before_retry
+from upstream import SERVICES, start_clients, close_clients, get_client, resolve_timeout, request_started, request_finished, pool_stats
 
 # Crear la aplicación FastAPI
 app = FastAPI(
@@ -9,43 +19,211 @@ app = FastAPI(
     description="Puerta principal del sistema de salud - conecta todos los microservicios",
     version="1.0.0"
 )
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TracingMiddleware)
 
-# URLs de los microservicios - compatibles con Docker y desarrollo local
-SERVICES = {
-    "patients": os.getenv("PATIENTS_SERVICE_URL", "http://localhost:8081"),
-    "doctors": os.getenv("DOCTORS_SERVICE_URL", "http://localhost:8082"), 
-    "appointments": os.getenv("APPOINTMENTS_SERVICE_URL", "http://localhost:8083")
-}
+# Latencia de cada intento de llamada a los microservicios (los reintentos cuentan aparte)
+upstream_request_duration_seconds = registry.histogram(
+    "gateway_upstream_request_duration_seconds", "Duración de las llamadas del gateway a cada microservicio", ("service",)
+)
+upstream_requests_total = registry.counter(
+    "gateway_upstream_requests_total", "Llamadas del gateway a cada microservicio por resultado", ("service", "outcome")
+)
+
+@app.on_event("startup")
+async def startup():
+    """Abrir los pools de conexiones hacia los microservicios y arrancar el snapshot del dashboard"""
+    await start_clients()
+    dashboard_snapshot.start()
+    trace_exporter.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Detener los snapshots y cerrar los pools de conexiones"""
+    await dashboard_snapshot.stop()
+    await health_snapshot.stop()
+    await close_clients()
+    await trace_exporter.stop()
+
+# Solo estas peticiones se reintentan: repetirlas no cambia el resultado
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+async def send_upstream(service: str, send: Callable[[], Awaitable[httpx.Response]], idempotent: bool) -> httpx.Response:
+    """Enviar con circuit breaker y, si es idempotente, reintentar con backoff dentro del presupuesto global.
+    Quien llama debe invocar request_finished al terminar con la respuesta"""
+    breaker = get_breaker(service)
+    retry_budget.record_request()
+    attempt = 0
+    while True:
+        try:
+            breaker.allow()
+        except CircuitOpenError as e:
+            raise HTTPException(
+                status_code=503,
+                detail=f"Servicio {service} no disponible temporalmente (circuito abierto)",
+                headers={"Retry-After": str(math.ceil(e.retry_after))}
+            )
+        
+        can_retry = idempotent and attempt < RETRY_MAX_ATTEMPTS
+        request_started(service)
+        started = time.perf_counter()
+        try:
+            # Un span por intento; el hook de httpx lo envía como padre en el traceparent
+            with span(f"call {service}", "CLIENT", service) as upstream_span:
+                upstream_span.set_tag("attempt", attempt)
+                response = await send()
+                upstream_span.name = f"{response.request.method} {response.request.url.path}"
+                upstream_span.set_tag("http.status_code", response.status_code)
+        except httpx.RequestError as e:
+            upstream_request_duration_seconds.observe(time.perf_counter() - started, service)
+            upstream_requests_total.inc(service, type(e).__name__)
+            request_finished(service, error=True)
+            breaker.record_failure()
+            if not (can_retry and retry_budget.try_retry()):
+                raise HTTPException(status_code=503, detail=f"Servicio no disponible: {str(e)}")
+        else:
+            upstream_request_duration_seconds.observe(time.perf_counter() - started, service)
+            upstream_requests_total.inc(service, str(response.status_code))
+            if response.status_code not in FAILURE_STATUSES:
+                breaker.record_success()
+                return response
+            breaker.record_failure()
+            if not (can_retry and retry_budget.try_retry()):
+                return response
+            await response.aclose()
+            request_finished(service, error=True)
+        
+        await wait_before_retry(attempt)
+        attempt += 1
 
-async def proxy_request(service_url: str, path: str, method: str, **kwargs) -> dict:
-    """Función para reenviar peticiones a los microservicios"""
-    url = f"{service_url}{path}"
+async def proxy_request(service: str, path: str, method: str, timeout: Optional[float] = None, **kwargs) -> dict:
+    """Reenviar una petición y decodificar el JSON, solo para rutas que transforman la respuesta"""
+    if method not in ("GET", "POST", "PUT", "PATCH", "DELETE"):
+        raise HTTPException(status_code=405, detail="Método no permitido")
     
+    client = get_client(service)
+    response = await send_upstream(
+        service,
+        lambda: client.request(method, path, timeout=resolve_timeout(path, timeout), **kwargs),
+        method in IDEMPOTENT_METHODS
+    )
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            if method == "GET":
-                response = await client.get(url, **kwargs)
-            elif method == "POST":
-                response = await client.post(url, **kwargs)
-            elif method == "PUT":
-                response = await client.put(url, **kwargs)
-            elif method == "PATCH":
-                response = await client.patch(url, **kwargs)
-            elif method == "DELETE":
-                response = await client.delete(url, **kwargs)
-            else:
-                raise HTTPException(status_code=405, detail="Método no permitido")
-            
-            # Retornar la respuesta del microservicio
-            return {
-                "status_code": response.status_code,
-                "content": response.json() if response.text else {},
-                "headers": dict(response.headers)
-            }
-    except httpx.RequestError as e:
-        raise HTTPException(status_code=503, detail=f"Servicio no disponible: {str(e)}")
+        content = response.json() if response.text else {}
     except Exception as e:
+        request_finished(service, error=True)
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
+    request_finished(service)
+    
+    # Retornar la respuesta del microservicio
+    return {
+        "status_code": response.status_code,
+        "content": content,
+        "headers": dict(response.headers)
+    }
+
+# Cabeceras hop-by-hop que no se reenvían entre cliente, gateway y microservicio
+HOP_BY_HOP_HEADERS = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailers", "transfer-encoding", "upgrade", "host"
+}
+
+# Cabeceras que el servidor del gateway agrega por su cuenta
+GATEWAY_RESPONSE_HEADERS = {"date", "server"}
+
+def filter_headers(headers, excluded: set) -> dict:
+    return {key: value for key, value in headers.items() if key.lower() not in excluded}
+
+async def stream_request(service: str, path: str, request: Request, timeout: Optional[float] = None) -> StreamingResponse:
+    """Reenviar la petición tal cual y devolver los bytes del microservicio sin decodificarlos"""
+    client = get_client(service)
+    upstream_request = client.build_request(
+        request.method,
+        path,
+        params=request.query_params.multi_items(),
+        headers=filter_headers(request.headers, HOP_BY_HOP_HEADERS),
+        content=request.stream() if request.method in ("POST", "PUT", "PATCH") else None,
+        timeout=resolve_timeout(path, timeout)
+    )
+    
+    response = await send_upstream(
+        service,
+        lambda: client.send(upstream_request, stream=True),
+        request.method in IDEMPOTENT_METHODS
+    )
+    
+    async def body():
+        # El cuerpo se copia por bloques, sin cargarlo completo en memoria
+        try:
+            async for chunk in response.aiter_raw():
+                yield chunk
+        finally:
+            await response.aclose()
+            request_finished(service)
+    
+    return StreamingResponse(
+        body(),
+        status_code=response.status_code,
+        headers=filter_headers(response.headers, HOP_BY_HOP_HEADERS | GATEWAY_RESPONSE_HEADERS)
+    )
+
+# Cache de respuestas para rutas de lectura frecuente; TTL en segundos por ruta
+CACHE_TTL_DOCTORS = float(os.getenv("GATEWAY_CACHE_TTL_DOCTORS", "30"))
+CACHE_TTL_DOCTOR = float(os.getenv("GATEWAY_CACHE_TTL_DOCTOR", "60"))
+CACHE_TTL_SPECIALTY = float(os.getenv("GATEWAY_CACHE_TTL_SPECIALTY", "60"))
+
+response_cache = ResponseCache()
+
+# Las validaciones condicionales las resuelve el gateway con su propio ETag
+CONDITIONAL_HEADERS = {"if-none-match", "if-modified-since"}
+# El cuerpo se guarda ya decodificado, estas cabeceras se recalculan
+BODY_HEADERS = {"content-length", "content-encoding"}
+
+async def fetch_for_cache(service: str, path: str, request: Request):
+    client = get_client(service)
+    response = await send_upstream(
+        service,
+        lambda: client.get(
+            path,
+            params=request.query_params.multi_items(),
+            headers=filter_headers(request.headers, HOP_BY_HOP_HEADERS | CONDITIONAL_HEADERS),
+            timeout=resolve_timeout(path)
+        ),
+        True
+    )
+    request_finished(service)
+    return response.status_code, filter_headers(response.headers, HOP_BY_HOP_HEADERS | GATEWAY_RESPONSE_HEADERS | BODY_HEADERS), response.content
+
+async def cached_request(service: str, path: str, request: Request, ttl: float) -> Response:
+    """GET servido desde el cache del gateway, con ETag, Cache-Control y una sola consulta por miss concurrente"""
+    cache_control = request.headers.get("cache-control", "").lower()
+    if not RESPONSE_CACHE_ENABLED or "no-store" in cache_control:
+        return await stream_request(service, path, request)
+    
+    key = (request.method, path, tuple(sorted(request.query_params.multi_items())))
+    entry, cache_status = await response_cache.get_or_fetch(
+        key, service, ttl,
+        lambda: fetch_for_cache(service, path, request),
+        refresh="no-cache" in cache_control or "max-age=0" in cache_control
+    )
+    
+    headers = {**entry.headers, "X-Cache": cache_status}
+    if entry.status_code != 200:
+        return Response(content=entry.body, status_code=entry.status_code, headers=headers)
+    
+    headers.update({
+        "ETag": entry.etag,
+        "Cache-Control": f"max-age={int(entry.max_age)}",
+        "Age": str(int(entry.age))
+    })
+    if etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers={key: value for key, value in headers.items() if key.lower() != "content-type"})
+    return Response(content=entry.body, status_code=entry.status_code, headers=headers)
+
+def purge_after_write(family: str, response: Response) -> Response:
+    """Una escritura exitosa invalida las respuestas cacheadas de esa familia de rutas"""
+    if response.status_code < 400:
+        response_cache.purge(family)
+    return response
 
 @app.get("/")
 def root():
@@ -67,240 +245,320 @@ def root():
         }
     }
 
+# Verificación de salud: sondeos concurrentes con un límite corto y resultado en cache
+HEALTH_PROBE_TIMEOUT = float(os.getenv("GATEWAY_HEALTH_TIMEOUT", "2"))
+HEALTH_CACHE_SECONDS = float(os.getenv("GATEWAY_HEALTH_CACHE_SECONDS", "5"))
+
+async def probe_service(service_name: str) -> dict:
+    """Consultar la readiness de un microservicio y medir cuánto tarda"""
+    started = time.perf_counter()
+    result = {}
+    try:
+        # wait_for limita el sondeo completo; el timeout de httpx aplica a cada fase por separado
+        response = await asyncio.wait_for(
+            get_client(service_name).get("/health/ready", timeout=resolve_timeout("/health", HEALTH_PROBE_TIMEOUT)),
+            timeout=HEALTH_PROBE_TIMEOUT
+        )
+    except (asyncio.TimeoutError, httpx.TimeoutException):
+        result["status"] = "timeout"
+    except httpx.RequestError as e:
+        result["status"] = "unreachable"
+        result["error"] = str(e)
+    else:
+        result["status"] = "healthy" if response.status_code == 200 else "unhealthy"
+        try:
+            result["checks"] = response.json().get("checks", {})
+        except ValueError:
+            pass
+    
+    result["latency_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return result
+
+async def collect_health() -> dict:
+    results = await asyncio.gather(*(probe_service(service_name) for service_name in SERVICES))
+    return {"services": dict(zip(SERVICES, results))}
+
+# Se sirve la copia en cache; pasado el intervalo se refresca en segundo plano y,
+# si ya tiene el doble de edad, la petición espera el sondeo nuevo
+health_snapshot = Snapshot("health", collect_health, HEALTH_CACHE_SECONDS, max_stale=HEALTH_CACHE_SECONDS * 2)
+
 @app.get("/health")
 async def health_check():
     """Verificar la salud de todos los servicios"""
-    health_status = {"gateway": "healthy", "services": {}}
-    
-    for service_name, service_url in SERVICES.items():
-        try:
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                response = await client.get(f"{service_url}/health")
-                if response.status_code == 200:
-                    health_status["services"][service_name] = "healthy"
-                else:
-                    health_status["services"][service_name] = "unhealthy"
-        except:
-            health_status["services"][service_name] = "unreachable"
-    
-    return health_status
+    health_data = await health_snapshot.get()
+    details = health_data.get("services", {})
+    return {
+        "gateway": "healthy",
+        "services": {service_name: detail["status"] for service_name, detail in details.items()},
+        "details": details,
+        "checked_at": health_data.get("timestamp"),
+        "age_seconds": round(health_snapshot.age, 2),
+        "circuit_breakers": breaker_status()
+    }
+
+@app.get("/health/live")
+def liveness_check():
+    """Liveness: el gateway responde, sin consultar a los microservicios"""
+    return {"status": "alive", "service": "api-gateway"}
+
+@app.get("/health/ready")
+async def readiness_check():
+    """Readiness: todos los microservicios y sus bases de datos responden"""
+    health_data = await health_snapshot.get()
+    details = health_data.get("services", {})
+    ready = bool(details) and all(detail["status"] == "healthy" for detail in details.values())
+    content = {
+        "status": "ready" if ready else "not_ready",
+        "services": details,
+        "checked_at": health_data.get("timestamp"),
+        "age_seconds": round(health_snapshot.age, 2)
+    }
+    return JSONResponse(status_code=200 if ready else 503, content=content)
+
+@app.get("/metrics")
+def get_metrics():
+    """Métricas en formato de texto de Prometheus"""
+    return metrics_response()
+
+@app.get("/pool/stats")
+def get_pool_stats():
+    """Estadísticas de los pools de conexiones hacia los microservicios"""
+    return pool_stats()
+
+@app.get("/cache/stats")
+def get_cache_stats():
+    """Estadísticas del cache de respuestas del gateway"""
+    return response_cache.snapshot()
 
 # ==================== PATIENTS ROUTES ====================
 
 @app.get("/api/patients")
 async def get_patients(request: Request):
     """Obtener todos los pacientes"""
-    query_params = dict(request.query_params)
-    result = await proxy_request(SERVICES["patients"], "/patients", "GET", params=query_params)
-    return JSONResponse(content=result["content"], status_code=result["status_code"])
+    return await stream_request("patients", "/patients", request)
 
 @app.post("/api/patients")
 async def create_patient(request: Request):
     """Crear un paciente nuevo"""
-    body = await request.json()
-    result = await proxy_request(SERVICES["patients"], "/patients", "POST", json=body)
-    return JSONResponse(content=result["content"], status_code=result["status_code"])
+    return await stream_request("patients", "/patients", request)
+
+@app.post("/api/patients/bulk")
+async def bulk_create_patients(request: Request):
+    """Importación masiva de pacientes (NDJSON o arreglo JSON)"""
+    return await stream_request("patients", "/patients/bulk", request)
+
+@app.get("/api/patients/export")
+async def export_patients(request: Request):
+    """Exportar pacientes en NDJSON o CSV"""
+    return await stream_request("patients", "/patients/export", request)
 
 @app.get("/api/patients/{patient_id}")
-async def get_patient(patient_id: int):
+async def get_patient(patient_id: int, request: Request):
     """Obtener un paciente específico"""
-    result = await proxy_request(SERVICES["patients"], f"/patients/{patient_id}", "GET")
-    return JSONResponse(content=result["content"], status_code=result["status_code"])
+    return await stream_request("patients", f"/patients/{patient_id}", request)
 
 @app.put("/api/patients/{patient_id}")
 async def update_patient(patient_id: int, request: Request):
     """Actualizar un paciente"""
-    body = await request.json()
-    result = await proxy_request(SERVICES["patients"], f"/patients/{patient_id}", "PUT", json=body)
-    return JSONResponse(content=result["content"], status_code=result["status_code"])
+    return await stream_request("patients", f"/patients/{patient_id}", request)
 
 @app.delete("/api/patients/{patient_id}")
-async def delete_patient(patient_id: int):
+async def delete_patient(patient_id: int, request: Request):
     """Eliminar un paciente"""
-    result = await proxy_request(SERVICES["patients"], f"/patients/{patient_id}", "DELETE")
-    return JSONResponse(content=result["content"], status_code=result["status_code"])
+    return await stream_request("patients", f"/patients/{patient_id}", request)
 
 @app.get("/api/patients/search/{search_term}")
-async def search_patients(search_term: str):
+async def search_patients(search_term: str, request: Request):
     """Buscar pacientes"""
-    result = await proxy_request(SERVICES["patients"], f"/patients/search/{search_term}", "GET")
-    return JSONResponse(content=result["content"], status_code=result["status_code"])
+    return await stream_request("patients", f"/patients/search/{search_term}", request)
 
 @app.get("/api/patients/document/{document_id}")
-async def get_patient_by_document(document_id: str):
+async def get_patient_by_document(document_id: str, request: Request):
     """Obtener paciente por documento"""
-    result = await proxy_request(SERVICES["patients"], f"/patients/document/{document_id}", "GET")
-    return JSONResponse(content=result["content"], status_code=result["status_code"])
+    return await stream_request("patients", f"/patients/document/{document_id}", request)
 
 # ==================== DOCTORS ROUTES ====================
 
 @app.get("/api/doctors")
 async def get_doctors(request: Request):
     """Obtener todos los doctores"""
-    query_params = dict(request.query_params)
-    result = await proxy_request(SERVICES["doctors"], "/doctors", "GET", params=query_params)
-    return JSONResponse(content=result["content"], status_code=result["status_code"])
+    return await cached_request("doctors", "/doctors", request, CACHE_TTL_DOCTORS)
 
 @app.post("/api/doctors")
 async def create_doctor(request: Request):
     """Crear un doctor nuevo"""
-    body = await request.json()
-    result = await proxy_request(SERVICES["doctors"], "/doctors", "POST", json=body)
-    return JSONResponse(content=result["content"], status_code=result["status_code"])
+    return purge_after_write("doctors", await stream_request("doctors", "/doctors", request))
+
+@app.post("/api/doctors/bulk")
+async def bulk_create_doctors(request: Request):
+    """Importación masiva de doctores (NDJSON o arreglo JSON)"""
+    return purge_after_write("doctors", await stream_request("doctors", "/doctors/bulk", request))
 
 @app.get("/api/doctors/{doctor_id}")
-async def get_doctor(doctor_id: int):
+async def get_doctor(doctor_id: int, request: Request):
     """Obtener un doctor específico"""
-    result = await proxy_request(SERVICES["doctors"], f"/doctors/{doctor_id}", "GET")
-    return JSONResponse(content=result["content"], status_code=result["status_code"])
+    return await cached_request("doctors", f"/doctors/{doctor_id}", request, CACHE_TTL_DOCTOR)
 
 @app.put("/api/doctors/{doctor_id}")
 async def update_doctor(doctor_id: int, request: Request):
     """Actualizar un doctor"""
-    body = await request.json()
-    result = await proxy_request(SERVICES["doctors"], f"/doctors/{doctor_id}", "PUT", json=body)
-    return JSONResponse(content=result["content"], status_code=result["status_code"])
+    return purge_after_write("doctors", await stream_request("doctors", f"/doctors/{doctor_id}", request))
 
 @app.delete("/api/doctors/{doctor_id}")
-async def delete_doctor(doctor_id: int):
+async def delete_doctor(doctor_id: int, request: Request):
     """Eliminar un doctor"""
-    result = await proxy_request(SERVICES["doctors"], f"/doctors/{doctor_id}", "DELETE")
-    return JSONResponse(content=result["content"], status_code=result["status_code"])
+    return purge_after_write("doctors", await stream_request("doctors", f"/doctors/{doctor_id}", request))
 
 @app.get("/api/doctors/search/{search_term}")
-async def search_doctors(search_term: str):
+async def search_doctors(search_term: str, request: Request):
     """Buscar doctores"""
-    result = await proxy_request(SERVICES["doctors"], f"/doctors/search/{search_term}", "GET")
-    return JSONResponse(content=result["content"], status_code=result["status_code"])
+    return await stream_request("doctors", f"/doctors/search/{search_term}", request)
 
 @app.get("/api/doctors/specialty/{specialty}")
-async def get_doctors_by_specialty(specialty: str):
+async def get_doctors_by_specialty(specialty: str, request: Request):
     """Obtener doctores por especialidad"""
-    result = await proxy_request(SERVICES["doctors"], f"/doctors/specialty/{specialty}", "GET")
-    return JSONResponse(content=result["content"], status_code=result["status_code"])
+    return await cached_request("doctors", f"/doctors/specialty/{specialty}", request, CACHE_TTL_SPECIALTY)
 
 @app.get("/api/doctors/license/{license_number}")
-async def get_doctor_by_license(license_number: str):
+async def get_doctor_by_license(license_number: str, request: Request):
     """Obtener doctor por licencia"""
-    result = await proxy_request(SERVICES["doctors"], f"/doctors/license/{license_number}", "GET")
-    return JSONResponse(content=result["content"], status_code=result["status_code"])
+    return await stream_request("doctors", f"/doctors/license/{license_number}", request)
+
+@app.get("/api/doctors/{doctor_id}/availability")
+async def get_doctor_availability(doctor_id: int, request: Request):
+    """Turnos libres de un doctor (parámetros from y to)"""
+    return await stream_request("appointments", f"/doctors/{doctor_id}/availability", request)
+
+@app.get("/api/availability")
+async def search_availability(request: Request):
+    """Turnos libres por especialidad (parámetros specialty, from y to)"""
+    return await stream_request("appointments", "/availability", request)
 
 # ==================== APPOINTMENTS ROUTES ====================
 
 @app.get("/api/appointments")
 async def get_appointments(request: Request):
     """Obtener todas las citas"""
-    query_params = dict(request.query_params)
-    result = await proxy_request(SERVICES["appointments"], "/appointments", "GET", params=query_params)
-    return JSONResponse(content=result["content"], status_code=result["status_code"])
+    return await stream_request("appointments", "/appointments", request)
 
 @app.post("/api/appointments")
 async def create_appointment(request: Request):
     """Crear una cita nueva"""
-    body = await request.json()
-    result = await proxy_request(SERVICES["appointments"], "/appointments", "POST", json=body)
-    return JSONResponse(content=result["content"], status_code=result["status_code"])
+    return await stream_request("appointments", "/appointments", request)
+
+@app.post("/api/appointments/batch")
+async def create_appointments_batch(request: Request):
+    """Reservar varias citas de un mismo paciente y doctor"""
+    return await stream_request("appointments", "/appointments/batch", request)
+
+@app.get("/api/appointments/export")
+async def export_appointments(request: Request):
+    """Exportar citas en NDJSON o CSV"""
+    return await stream_request("appointments", "/appointments/export", request)
 
 @app.get("/api/appointments/{appointment_id}")
-async def get_appointment(appointment_id: int):
+async def get_appointment(appointment_id: int, request: Request):
     """Obtener una cita específica"""
-    result = await proxy_request(SERVICES["appointments"], f"/appointments/{appointment_id}", "GET")
-    return JSONResponse(content=result["content"], status_code=result["status_code"])
+    return await stream_request("appointments", f"/appointments/{appointment_id}", request)
 
 @app.put("/api/appointments/{appointment_id}")
 async def update_appointment(appointment_id: int, request: Request):
     """Actualizar una cita"""
-    body = await request.json()
-    result = await proxy_request(SERVICES["appointments"], f"/appointments/{appointment_id}", "PUT", json=body)
-    return JSONResponse(content=result["content"], status_code=result["status_code"])
+    return await stream_request("appointments", f"/appointments/{appointment_id}", request)
 
 @app.delete("/api/appointments/{appointment_id}")
-async def cancel_appointment(appointment_id: int):
+async def cancel_appointment(appointment_id: int, request: Request):
     """Cancelar una cita"""
-    result = await proxy_request(SERVICES["appointments"], f"/appointments/{appointment_id}", "DELETE")
-    return JSONResponse(content=result["content"], status_code=result["status_code"])
+    return await stream_request("appointments", f"/appointments/{appointment_id}", request)
 
 @app.get("/api/appointments/patient/{patient_id}")
-async def get_patient_appointments(patient_id: int):
+async def get_patient_appointments(patient_id: int, request: Request):
     """Obtener citas de un paciente"""
-    result = await proxy_request(SERVICES["appointments"], f"/appointments/patient/{patient_id}", "GET")
-    return JSONResponse(content=result["content"], status_code=result["status_code"])
+    return await stream_request("appointments", f"/appointments/patient/{patient_id}", request)
 
 @app.get("/api/appointments/doctor/{doctor_id}")
-async def get_doctor_appointments(doctor_id: int):
+async def get_doctor_appointments(doctor_id: int, request: Request):
     """Obtener citas de un doctor"""
-    result = await proxy_request(SERVICES["appointments"], f"/appointments/doctor/{doctor_id}", "GET")
-    return JSONResponse(content=result["content"], status_code=result["status_code"])
+    return await stream_request("appointments", f"/appointments/doctor/{doctor_id}", request)
 
 @app.patch("/api/appointments/{appointment_id}/complete")
 async def complete_appointment(appointment_id: int, request: Request):
     """Completar una cita con diagnóstico"""
-    body = await request.json()
-    result = await proxy_request(SERVICES["appointments"], f"/appointments/{appointment_id}/complete", "PATCH", json=body)
-    return JSONResponse(content=result["content"], status_code=result["status_code"])
+    return await stream_request("appointments", f"/appointments/{appointment_id}/complete", request)
 
 # ==================== DASHBOARD Y REPORTES ====================
 
-@app.get("/api/dashboard")
-async def dashboard():
-    """Dashboard con estadísticas del sistema de salud"""
-    dashboard_data = {"title": "Dashboard Sistema de Salud", "timestamp": "2025-06-20"}
+async def build_dashboard() -> dict:
+    """Calcular las estadísticas del dashboard consultando /stats en los tres servicios.
+    Un servicio que falla conserva su último valor bueno; si fallan todos se mantiene el snapshot anterior"""
+    dashboard_data = {"title": "Dashboard Sistema de Salud"}
+    previous = dashboard_snapshot.data or {}
+    services = ("patients", "doctors", "appointments")
     
-    try:
-        # Obtener estadísticas de pacientes
-        patients_result = await proxy_request(SERVICES["patients"], "/patients", "GET", params={"limit": 1000})
-        if patients_result["status_code"] == 200:
-            patients = patients_result["content"]
-            dashboard_data["patients"] = {
-                "total": len(patients),
-                "active": len([p for p in patients if p.get("is_active", False)]),
-                "by_gender": {
-                    "masculino": len([p for p in patients if p.get("gender") == "masculino"]),
-                    "femenino": len([p for p in patients if p.get("gender") == "femenino"])
-                }
-            }
-        
-        # Obtener estadísticas de doctores
-        doctors_result = await proxy_request(SERVICES["doctors"], "/doctors", "GET", params={"limit": 1000})
-        if doctors_result["status_code"] == 200:
-            doctors = doctors_result["content"]
-            dashboard_data["doctors"] = {
-                "total": len(doctors),
-                "available": len([d for d in doctors if d.get("is_available", False)]),
-                "by_specialty": {}
-            }
-            # Contar por especialidad
-            for doctor in doctors:
-                specialty = doctor.get("specialty", "unknown")
-                dashboard_data["doctors"]["by_specialty"][specialty] = dashboard_data["doctors"]["by_specialty"].get(specialty, 0) + 1
-        
-        # Obtener estadísticas de citas
-        appointments_result = await proxy_request(SERVICES["appointments"], "/appointments", "GET", params={"limit": 1000})
-        if appointments_result["status_code"] == 200:
-            appointments = appointments_result["content"]
-            dashboard_data["appointments"] = {
-                "total": len(appointments),
-                "today": 0,  # Se podría calcular con fecha actual
-                "by_status": {}
-            }
-            # Contar por estado
-            for appointment in appointments:
-                status = appointment.get("status", "unknown")
-                dashboard_data["appointments"]["by_status"][status] = dashboard_data["appointments"]["by_status"].get(status, 0) + 1
+    # Cada servicio agrega sus conteos en SQL; se consultan los tres a la vez
+    results = await asyncio.gather(
+        *[proxy_request(service_name, "/stats", "GET") for service_name in services],
+        return_exceptions=True
+    )
+    
+    errors = []
+    stale = []
+    missing = []
+    for service_name, result in zip(services, results):
+        if isinstance(result, Exception):
+            detail = result.detail if isinstance(result, HTTPException) else str(result)
+            errors.append(f"{service_name}: {detail}")
+        elif result["status_code"] == 200:
+            dashboard_data[service_name] = result["content"]
+            continue
+        else:
+            errors.append(f"{service_name}: respuesta {result['status_code']}")
         
-    except Exception as e:
-        dashboard_data["error"] = f"Error obteniendo datos del dashboard: {str(e)}"
+        if service_name in previous:
+            dashboard_data[service_name] = previous[service_name]
+            stale.append(service_name)
+        else:
+            missing.append(service_name)
+    
+    if errors and len(stale) == len(services):
+        raise RuntimeError("; ".join(errors))
+    if stale:
+        dashboard_data["stale"] = stale
+    if errors:
+        dashboard_data["error"] = f"Error obteniendo datos del dashboard: {'; '.join(errors)}"
+    if missing:
+        raise PartialSnapshot(dashboard_data, f"sin datos de {', '.join(missing)}")
     
     return dashboard_data
 
+# Snapshot del dashboard en memoria, refrescado en segundo plano
+DASHBOARD_REFRESH_INTERVAL = float(os.getenv("DASHBOARD_REFRESH_INTERVAL", "15"))
+dashboard_snapshot = Snapshot("dashboard", build_dashboard, DASHBOARD_REFRESH_INTERVAL)
+
+def etag_matches(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    if not if_none_match or not etag:
+        return False
+    candidates = [value.strip().removeprefix("W/") for value in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+@app.get("/api/dashboard")
+async def dashboard(request: Request):
+    """Dashboard con estadísticas del sistema de salud"""
+    dashboard_data = await dashboard_snapshot.get()
+    headers = {"Cache-Control": "no-cache", "Age": str(int(dashboard_snapshot.age))}
+    if dashboard_snapshot.etag:
+        headers["ETag"] = dashboard_snapshot.etag
+    
+    # Las pantallas que refrescan sin cambios reciben un 304 sin cuerpo
+    if etag_matches(request.headers.get("if-none-match"), dashboard_snapshot.etag):
+        return Response(status_code=304, headers=headers)
+    
+    return JSONResponse(content=dashboard_data, headers=headers)
+
 @app.get("/api/reports/monthly")
-async def monthly_report():
-    """Reporte mensual del sistema"""
-    return {
-        "message": "Reporte mensual generado",
-        "period": "Junio 2025",
-        "note": "Funcionalidad disponible - implementación completa requiere análisis de fechas"
-    }
+async def monthly_report(request: Request):
+    """Reporte mensual del sistema (parámetros from y to en formato YYYY-MM)"""
+    return await stream_request("appointments", "/reports/monthly", request)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,122 @@
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+# Configuración del cache de respuestas del gateway
+RESPONSE_CACHE_ENABLED = os.getenv("GATEWAY_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("GATEWAY_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+RESPONSE_CACHE_MAX_ENTRY_BYTES = int(os.getenv("GATEWAY_CACHE_MAX_ENTRY_BYTES", str(1024 * 1024)))
+
+class CachedResponse:
+    def __init__(self, status_code: int, headers: Dict[str, str], body: bytes, ttl: float):
+        self.status_code = status_code
+        self.headers = headers
+        self.body = body
+        self.etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        self.stored_at = time.monotonic()
+        self.expires_at = self.stored_at + ttl
+        self.size = len(body) + sum(len(key) + len(value) for key, value in headers.items())
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.stored_at
+
+    @property
+    def max_age(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+class ResponseCache:
+    """LRU limitado por bytes, con TTL por entrada, purga por familia de rutas y coalescencia de misses"""
+
+    def __init__(self, max_bytes: int = RESPONSE_CACHE_MAX_BYTES, max_entry_bytes: int = RESPONSE_CACHE_MAX_ENTRY_BYTES):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self._entries: "OrderedDict[Hashable, Tuple[str, CachedResponse]]" = OrderedDict()
+        self._bytes = 0
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        # Cada purga cambia la generación: una respuesta pedida antes de la escritura no se guarda
+        self._generations: Dict[str, int] = {}
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "stores": 0, "evictions": 0, "purges": 0, "uncacheable": 0}
+
+    def get(self, key: Hashable) -> Optional[CachedResponse]:
+        item = self._entries.get(key)
+        if item is None:
+            return None
+        if item[1].expires_at <= time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return item[1]
+
+    def _remove(self, key: Hashable):
+        _, entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    def set(self, key: Hashable, family: str, entry: CachedResponse):
+        if entry.size > self.max_entry_bytes:
+            self.stats["uncacheable"] += 1
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (family, entry)
+        self._bytes += entry.size
+        self.stats["stores"] += 1
+        while self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.stats["evictions"] += 1
+
+    def purge(self, family: str):
+        """Descartar todas las respuestas de una familia de rutas (p. ej. doctors) tras una escritura"""
+        self._generations[family] = self._generations.get(family, 0) + 1
+        for key in [key for key, (entry_family, _) in self._entries.items() if entry_family == family]:
+            self._remove(key)
+        self.stats["purges"] += 1
+
+    async def get_or_fetch(self, key: Hashable, family: str, ttl: float,
+                           fetch: Callable[[], Awaitable[Tuple[int, Dict[str, str], bytes]]],
+                           refresh: bool = False) -> Tuple[CachedResponse, str]:
+        """Respuesta desde el cache o del microservicio; las peticiones concurrentes comparten la misma consulta"""
+        if not refresh:
+            entry = self.get(key)
+            if entry is not None:
+                self.stats["hits"] += 1
+                return entry, "HIT"
+
+        if key in self._inflight:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(self._inflight[key]), "COALESCED"
+
+        self.stats["misses"] += 1
+        generation = self._generations.get(family, 0)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            entry = CachedResponse(*await fetch(), ttl)
+        except BaseException as e:
+            # Si la petición que consultaba se cancela, las que esperaban no deben quedar colgadas
+            future.set_exception(e if isinstance(e, Exception) else RuntimeError("Consulta al microservicio cancelada"))
+            future.exception()  # Evitar el aviso si nadie más esperaba
+            raise
+        else:
+            # Solo se guardan respuestas exitosas y pedidas después de la última purga
+            if entry.status_code == 200 and self._generations.get(family, 0) == generation:
+                self.set(key, family, entry)
+            future.set_result(entry)
+            return entry, "MISS"
+        finally:
+            del self._inflight[key]
+
+    def snapshot(self) -> dict:
+        lookups = self.stats["hits"] + self.stats["misses"] + self.stats["coalesced"]
+        return {
+            **self.stats,
+            "enabled": RESPONSE_CACHE_ENABLED,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hit_ratio": round((self.stats["hits"] + self.stats["coalesced"]) / lookups, 4) if lookups else 0.0
+        }
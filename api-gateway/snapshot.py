@@ -0,0 +1,86 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger("api-gateway.snapshot")
+
+class PartialSnapshot(Exception):
+    """El loader obtuvo solo parte de los datos: se sirven, pero se vuelven a pedir en la próxima lectura"""
+
+    def __init__(self, data: dict, reason: str):
+        super().__init__(reason)
+        self.data = data
+
+class Snapshot:
+    """Copia materializada de una respuesta que se refresca en segundo plano (stale-while-revalidate)"""
+
+    def __init__(self, name: str, loader: Callable[[], Awaitable[dict]], interval: float, max_stale: Optional[float] = None):
+        self.name = name
+        self.loader = loader
+        self.interval = interval
+        # Edad a partir de la cual ya no se sirve la copia y se espera el refresco
+        self.max_stale = max_stale
+        self.data: Optional[dict] = None
+        self.etag: Optional[str] = None
+        self.refreshed_at: float = 0.0
+        self.complete = False
+        self._refreshing: Optional[asyncio.Task] = None
+        self._loop_task: Optional[asyncio.Task] = None
+
+    async def refresh(self):
+        """Recalcular el snapshot; si falla se conserva el anterior"""
+        complete = True
+        try:
+            data = await self.loader()
+        except PartialSnapshot as e:
+            # Mejor datos parciales que nada (p. ej. al arrancar antes que los servicios)
+            logger.warning("Snapshot %s incompleto: %s", self.name, e)
+            data, complete = e.data, False
+        except Exception as e:
+            logger.warning("No se pudo refrescar el snapshot %s: %s", self.name, e)
+            return
+
+        # El ETag solo depende de los datos, no de la hora del snapshot
+        etag = '"' + hashlib.sha1(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest() + '"'
+        self.data = {**data, "timestamp": datetime.utcnow().isoformat()}
+        self.etag = etag
+        self.refreshed_at = time.monotonic()
+        self.complete = complete
+
+    def _refresh_in_background(self) -> asyncio.Task:
+        if self._refreshing is None or self._refreshing.done():
+            self._refreshing = asyncio.create_task(self.refresh())
+        return self._refreshing
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.refreshed_at if self.data is not None else 0.0
+
+    async def get(self) -> dict:
+        """Servir desde memoria; solo se espera cuando todavía no hay snapshot o es demasiado viejo"""
+        if self.data is None or (self.max_stale is not None and self.age > self.max_stale):
+            await asyncio.shield(self._refresh_in_background())
+        elif self.age > self.interval or not self.complete:
+            self._refresh_in_background()
+        return self.data or {}
+
+    async def _run(self):
+        while True:
+            await asyncio.shield(self._refresh_in_background())
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self._loop_task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        for task in (self._loop_task, self._refreshing):
+            if task and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
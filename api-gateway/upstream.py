@@ -0,0 +1,128 @@
+import logging
+import os
+from typing import Dict, Optional
+
+import httpx
+
+from tracing import inject_trace_headers
+
+logger = logging.getLogger("api-gateway.upstream")
+
+# URLs de los microservicios - compatibles con Docker y desarrollo local
+SERVICES = {
+    "patients": os.getenv("PATIENTS_SERVICE_URL", "http://localhost:8081"),
+    "doctors": os.getenv("DOCTORS_SERVICE_URL", "http://localhost:8082"),
+    "appointments": os.getenv("APPOINTMENTS_SERVICE_URL", "http://localhost:8083")
+}
+
+# Configuración del pool de conexiones (una por microservicio, vive lo que vive el gateway)
+MAX_CONNECTIONS = int(os.getenv("GATEWAY_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("GATEWAY_MAX_KEEPALIVE_CONNECTIONS", "20"))
+KEEPALIVE_EXPIRY = float(os.getenv("GATEWAY_KEEPALIVE_EXPIRY", "30"))
+HTTP2_ENABLED = os.getenv("GATEWAY_HTTP2", "false").lower() in ("1", "true", "yes")
+DEFAULT_TIMEOUT = float(os.getenv("GATEWAY_TIMEOUT", "30"))
+CONNECT_TIMEOUT = float(os.getenv("GATEWAY_CONNECT_TIMEOUT", "5"))
+
+def _parse_route_timeouts(raw: str) -> Dict[str, float]:
+    """Convierte "/reports=60,/patients/search=5" en {prefijo: segundos}"""
+    timeouts = {}
+    for item in raw.split(","):
+        if "=" not in item:
+            continue
+        prefix, seconds = item.split("=", 1)
+        try:
+            timeouts[prefix.strip()] = float(seconds)
+        except ValueError:
+            logger.warning("Timeout inválido para %s: %s", prefix, seconds)
+    return timeouts
+
+# Timeouts por ruta del microservicio, se usa el prefijo más largo que coincida
+ROUTE_TIMEOUTS = _parse_route_timeouts(os.getenv("GATEWAY_ROUTE_TIMEOUTS", ""))
+
+_clients: Dict[str, httpx.AsyncClient] = {}
+_stats: Dict[str, Dict[str, int]] = {}
+# HTTP/2 realmente usado por los clientes: GATEWAY_HTTP2 y el paquete h2 instalado
+_http2_active = False
+
+def _http2_available() -> bool:
+    if not HTTP2_ENABLED:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logger.warning("GATEWAY_HTTP2 activado pero el paquete 'h2' no está instalado, se usa HTTP/1.1")
+        return False
+    return True
+
+def resolve_timeout(path: str, timeout: Optional[float] = None) -> httpx.Timeout:
+    """Timeout de una petición: explícito, por ruta o el valor por defecto"""
+    if timeout is None:
+        matches = [prefix for prefix in ROUTE_TIMEOUTS if path.startswith(prefix)]
+        timeout = ROUTE_TIMEOUTS[max(matches, key=len)] if matches else DEFAULT_TIMEOUT
+    return httpx.Timeout(timeout, connect=min(CONNECT_TIMEOUT, timeout))
+
+async def start_clients():
+    """Crear un cliente con pool de conexiones por cada microservicio"""
+    global _http2_active
+    http2 = _http2_active = _http2_available()
+    limits = httpx.Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=KEEPALIVE_EXPIRY
+    )
+    for name, url in SERVICES.items():
+        _clients[name] = httpx.AsyncClient(
+            base_url=url,
+            limits=limits,
+            timeout=httpx.Timeout(DEFAULT_TIMEOUT, connect=CONNECT_TIMEOUT),
+            http2=http2,
+            event_hooks={"request": [inject_trace_headers]}
+        )
+        _stats[name] = {"requests": 0, "in_flight": 0, "errors": 0}
+
+async def close_clients():
+    """Cerrar todas las conexiones abiertas al apagar el gateway"""
+    for client in _clients.values():
+        await client.aclose()
+    _clients.clear()
+
+def get_client(service: str) -> httpx.AsyncClient:
+    if service not in _clients:
+        raise KeyError(f"Servicio desconocido o pool no inicializado: {service}")
+    return _clients[service]
+
+def request_started(service: str):
+    _stats[service]["requests"] += 1
+    _stats[service]["in_flight"] += 1
+
+def request_finished(service: str, error: bool = False):
+    _stats[service]["in_flight"] -= 1
+    if error:
+        _stats[service]["errors"] += 1
+
+def pool_stats() -> dict:
+    """Estadísticas de uso de cada pool para dimensionarlo"""
+    stats = {
+        "config": {
+            "max_connections": MAX_CONNECTIONS,
+            "max_keepalive_connections": MAX_KEEPALIVE_CONNECTIONS,
+            "keepalive_expiry": KEEPALIVE_EXPIRY,
+            "http2": _http2_active,
+            "http2_requested": HTTP2_ENABLED,
+            "default_timeout": DEFAULT_TIMEOUT,
+            "route_timeouts": ROUTE_TIMEOUTS
+        },
+        "services": {}
+    }
+    for name, client in _clients.items():
+        # httpx no expone el pool públicamente; se lee del transporte de httpcore
+        pool = getattr(getattr(client, "_transport", None), "_pool", None)
+        connections = list(getattr(pool, "connections", []))
+        idle = len([c for c in connections if c.is_idle()])
+        stats["services"][name] = {
+            **_stats[name],
+            "connections": len(connections),
+            "idle_connections": idle,
+            "active_connections": len(connections) - idle
+        }
+    return stats
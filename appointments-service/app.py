@@ -1,10 +1,24 @@
-from fastapi import FastAPI, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from typing import List, Optional
-from database import get_db, AppointmentDB
-from models import Appointment, AppointmentCreate, AppointmentUpdate, AppointmentComplete
+from fastapi import FastAPI, Depends, HTTPException, Query, Response
+from fastapi.responses import JSONResponse
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, Iterable, List, Optional
+from tracing import TracingMiddleware, exporter as trace_exporter, inject_trace_headers, span
+from metrics import MetricsMiddleware, metrics_response, registry, timed
+from database import get_db, init_db, pool_status, check_database, query_profiler, AppointmentDB, calculate_end_time
+from models import Appointment, AppointmentCreate, AppointmentUpdate, AppointmentComplete, AppointmentBatchCreate, AppointmentBatchResult
+from cache import LookupCache
+from breaker import CircuitOpenError, FAILURE_STATUSES, RETRY_MAX_ATTEMPTS, breaker_status, get_breaker, retry_budget, wait_before_retry
+from pagination import paginate, page_rows, sort_columns
+from export import export_response
+import reports
+import availability
 import httpx
+import asyncio
+import math
+from urllib.parse import quote
 from datetime import datetime, date, time, timedelta
+from time import perf_counter
 import os
 
 app = FastAPI(
@@ -12,31 +26,201 @@ app = FastAPI(
     description="Servicio para manejar citas médicas del sistema de salud",
     version="1.0.0"
 )
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TracingMiddleware)
 
 # URLs de otros servicios - compatibles con Docker y desarrollo local
 PATIENTS_SERVICE_URL = os.getenv("PATIENTS_SERVICE_URL", "http://localhost:8081")
 DOCTORS_SERVICE_URL = os.getenv("DOCTORS_SERVICE_URL", "http://localhost:8082")
 
+# Cache en memoria de pacientes y doctores consultados a los otros servicios
+patient_cache = LookupCache("patients")
+doctor_cache = LookupCache("doctors")
+LOOKUP_CACHES = {"patients": patient_cache, "doctors": doctor_cache}
+
+# Timeouts de las consultas a patients-service y doctors-service (segundos)
+UPSTREAM_TIMEOUT = float(os.getenv("UPSTREAM_TIMEOUT", "5"))
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "2"))
+UPSTREAM_NAMES = {"patients": "pacientes", "doctors": "doctores"}
+
+# Tiempo en llamadas HTTP a los otros servicios y en las consultas de pacientes/doctores
+# (cache incluido), para compararlo con db_query_duration_seconds
+upstream_request_duration_seconds = registry.histogram(
+    "appointments_upstream_request_duration_seconds", "Duración de cada intento de llamada a patients/doctors-service", ("resource",)
+)
+upstream_requests_total = registry.counter(
+    "appointments_upstream_requests_total", "Llamadas a patients/doctors-service por resultado", ("resource", "outcome")
+)
+lookup_duration_seconds = registry.histogram(
+    "appointments_lookup_duration_seconds", "Duración de las consultas de pacientes y doctores, cache incluido", ("call",)
+)
+
+# Cliente compartido: reutiliza conexiones keep-alive entre peticiones
+http_client: Optional[httpx.AsyncClient] = None
+
+def get_http_client() -> httpx.AsyncClient:
+    global http_client
+    if http_client is None:
+        http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(UPSTREAM_TIMEOUT, connect=UPSTREAM_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+            event_hooks={"request": [inject_trace_headers]}
+        )
+    return http_client
+
+async def close_http_client():
+    global http_client
+    if http_client is not None:
+        await http_client.aclose()
+        http_client = None
+
+async def upstream_get(resource: str, url: str, **kwargs) -> httpx.Response:
+    """GET a otro servicio con circuit breaker y reintentos con backoff dentro del presupuesto global.
+    503 si no responde a tiempo o falla, para no confundirlo con un 404"""
+    name = UPSTREAM_NAMES.get(resource, resource)
+    breaker = get_breaker(resource)
+    retry_budget.record_request()
+    attempt = 0
+    while True:
+        try:
+            breaker.allow()
+        except CircuitOpenError as e:
+            raise HTTPException(
+                status_code=503,
+                detail=f"Servicio de {name} no disponible temporalmente",
+                headers={"Retry-After": str(math.ceil(e.retry_after))}
+            )
+        
+        can_retry = attempt < RETRY_MAX_ATTEMPTS
+        started = perf_counter()
+        try:
+            with span(f"GET {resource}", "CLIENT", f"{resource}-service") as upstream_span:
+                upstream_span.set_tag("http.url", url)
+                upstream_span.set_tag("attempt", attempt)
+                response = await get_http_client().get(url, **kwargs)
+                upstream_span.set_tag("http.status_code", response.status_code)
+        except httpx.RequestError as e:
+            upstream_request_duration_seconds.observe(perf_counter() - started, resource)
+            upstream_requests_total.inc(resource, type(e).__name__)
+            breaker.record_failure()
+            if not (can_retry and retry_budget.try_retry()):
+                if isinstance(e, httpx.TimeoutException):
+                    raise HTTPException(status_code=503, detail=f"El servicio de {name} no respondió a tiempo")
+                raise HTTPException(status_code=503, detail=f"Servicio de {name} no disponible")
+        else:
+            upstream_request_duration_seconds.observe(perf_counter() - started, resource)
+            upstream_requests_total.inc(resource, str(response.status_code))
+            if response.status_code not in FAILURE_STATUSES:
+                breaker.record_success()
+                if response.status_code >= 500:
+                    raise HTTPException(status_code=503, detail=f"Servicio de {name} no disponible")
+                return response
+            breaker.record_failure()
+            if not (can_retry and retry_budget.try_retry()):
+                raise HTTPException(status_code=503, detail=f"Servicio de {name} no disponible")
+        
+        await wait_before_retry(attempt)
+        attempt += 1
+
+async def load_resource(service_url: str, resource: str, item_id: int) -> Optional[dict]:
+    """Consultar un paciente o doctor: None si no existe (404), 503 si el servicio falla"""
+    response = await upstream_get(resource, f"{service_url}/{resource}/{item_id}")
+    if response.status_code == 404:
+        return None
+    if response.status_code != 200:
+        raise HTTPException(status_code=503, detail=f"Respuesta inesperada del servicio de {UPSTREAM_NAMES[resource]}")
+    return response.json()
+
+async def load_patient(patient_id: int) -> Optional[dict]:
+    return await load_resource(PATIENTS_SERVICE_URL, "patients", patient_id)
+
+async def load_doctor(doctor_id: int) -> Optional[dict]:
+    return await load_resource(DOCTORS_SERVICE_URL, "doctors", doctor_id)
+
+@timed(lookup_duration_seconds, "get_patient_info")
+async def get_patient_info(patient_id: int) -> Optional[dict]:
+    """Paciente desde el cache o patients-service; None si no existe, 503 si el servicio falla"""
+    return await patient_cache.get_or_load(patient_id, load_patient)
+
+@timed(lookup_duration_seconds, "get_doctor_info")
+async def get_doctor_info(doctor_id: int) -> Optional[dict]:
+    """Doctor desde el cache o doctors-service; None si no existe, 503 si el servicio falla"""
+    return await doctor_cache.get_or_load(doctor_id, load_doctor)
+
+# Para enriquecer respuestas: si el servicio falla la cita se devuelve sin nombres
+@timed(lookup_duration_seconds, "verify_patient_exists")
 async def verify_patient_exists(patient_id: int) -> Optional[dict]:
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f"{PATIENTS_SERVICE_URL}/patients/{patient_id}")
-            if response.status_code == 200:
-                return response.json()
-            return None
-    except:
+        return await get_patient_info(patient_id)
+    except (HTTPException, httpx.HTTPError):
         return None
 
+@timed(lookup_duration_seconds, "verify_doctor_exists")
 async def verify_doctor_exists(doctor_id: int) -> Optional[dict]:
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f"{DOCTORS_SERVICE_URL}/doctors/{doctor_id}")
-            if response.status_code == 200:
-                return response.json()
-            return None
-    except:
+        return await get_doctor_info(doctor_id)
+    except (HTTPException, httpx.HTTPError):
         return None
 
+# Máximo de IDs por consulta masiva a patients-service / doctors-service
+BULK_CHUNK_SIZE = 100
+
+async def fetch_bulk(service_url: str, resource: str, ids: Iterable[int], cache: LookupCache) -> Dict[int, dict]:
+    """Obtener varios pacientes o doctores: primero del cache y el resto con consultas masivas en paralelo.
+    Los IDs de un bloque que falla se omiten del resultado"""
+    found = {}
+    missing = []
+    for item_id in sorted(set(ids)):
+        cached, value = cache.get(item_id)
+        if not cached:
+            missing.append(item_id)
+        elif value is not None:
+            found[item_id] = value
+    if not missing:
+        return found
+    
+    chunks = [missing[i:i + BULK_CHUNK_SIZE] for i in range(0, len(missing), BULK_CHUNK_SIZE)]
+    responses = await asyncio.gather(*[
+        upstream_get(resource, f"{service_url}/{resource}", params={"ids": ",".join(str(i) for i in chunk)})
+        for chunk in chunks
+    ], return_exceptions=True)
+    
+    # Un bloque que falla no descarta los demás: solo sus IDs quedan sin datos y sin cachear,
+    # para volver a pedirlos en la próxima consulta
+    for chunk, response in zip(chunks, responses):
+        if isinstance(response, (httpx.HTTPError, HTTPException)):
+            continue
+        if isinstance(response, BaseException):
+            raise response
+        if response.status_code == 200:
+            chunk_found = {item["id"]: item for item in response.json()}
+            cache.store_many(chunk_found, chunk)
+            found.update(chunk_found)
+    return found
+
+@timed(lookup_duration_seconds, "fetch_patients")
+async def fetch_patients(patient_ids: Iterable[int]) -> Dict[int, dict]:
+    return await fetch_bulk(PATIENTS_SERVICE_URL, "patients", patient_ids, patient_cache)
+
+@timed(lookup_duration_seconds, "fetch_doctors")
+async def fetch_doctors(doctor_ids: Iterable[int]) -> Dict[int, dict]:
+    return await fetch_bulk(DOCTORS_SERVICE_URL, "doctors", doctor_ids, doctor_cache)
+
+def enrich_appointment(appointment: AppointmentDB, patients: Dict[int, dict], doctors: Dict[int, dict]) -> dict:
+    """Agregar nombre del paciente y del doctor a partir de las consultas masivas"""
+    appointment_dict = appointment.__dict__.copy()
+    
+    patient_info = patients.get(appointment.patient_id)
+    doctor_info = doctors.get(appointment.doctor_id)
+    
+    if patient_info:
+        appointment_dict['patient_name'] = patient_info['full_name']
+    if doctor_info:
+        appointment_dict['doctor_name'] = doctor_info['full_name']
+        appointment_dict['doctor_specialty'] = doctor_info['specialty']
+    
+    return appointment_dict
+
 def is_doctor_available(doctor_info: dict, appointment_date: date, appointment_time: time) -> bool:
     # Verificar día de la semana
     weekday_names = ["lunes", "martes", "miercoles", "jueves", "viernes", "sabado", "domingo"]
@@ -53,33 +237,44 @@ def is_doctor_available(doctor_info: dict, appointment_date: date, appointment_t
     except:
         return True  # Si hay error, permitir
 
-def has_scheduling_conflict(db: Session, doctor_id: int, appointment_date: date, appointment_time: time, 
-                           duration: int, exclude_appointment_id: Optional[int] = None) -> bool:
-    # Calcular tiempo de fin de la nueva cita
-    start_datetime = datetime.combine(appointment_date, appointment_time)
-    end_datetime = start_datetime + timedelta(minutes=duration)
+# Órdenes disponibles para paginar con cursor; el id desempata
+SORT_OPTIONS = {
+    "id": [AppointmentDB.id],
+    "appointment_date": [AppointmentDB.appointment_date, AppointmentDB.appointment_time, AppointmentDB.id]
+}
+
+# Estados que ocupan el horario del doctor
+ACTIVE_STATUSES = ["programada", "confirmada", "en_curso"]
+
+async def has_scheduling_conflict(db: AsyncSession, doctor_id: int, appointment_date: date, appointment_time: time, 
+                                 duration: int, exclude_appointment_id: Optional[int] = None) -> bool:
+    end_time = calculate_end_time(appointment_time, duration)
     
-    # Buscar citas existentes del doctor en la misma fecha
-    query = db.query(AppointmentDB).filter(
+    # Solapamiento de intervalos [inicio, fin) resuelto en una sola consulta
+    # sobre el índice (doctor_id, appointment_date, status)
+    query = select(AppointmentDB.id).where(
         AppointmentDB.doctor_id == doctor_id,
         AppointmentDB.appointment_date == appointment_date,
-        AppointmentDB.status.in_(["programada", "confirmada", "en_curso"])
+        AppointmentDB.status.in_(ACTIVE_STATUSES),
+        AppointmentDB.appointment_time < end_time,
+        AppointmentDB.end_time > appointment_time
     )
     
     if exclude_appointment_id:
-        query = query.filter(AppointmentDB.id != exclude_appointment_id)
-    
-    existing_appointments = query.all()
+        query = query.where(AppointmentDB.id != exclude_appointment_id)
     
-    for existing in existing_appointments:
-        existing_start = datetime.combine(appointment_date, existing.appointment_time)
-        existing_end = existing_start + timedelta(minutes=30)  # Asumimos 30 min por defecto
-        
-        # Verificar solapamiento
-        if (start_datetime < existing_end) and (end_datetime > existing_start):
-            return True
-    
-    return False
+    return await db.scalar(select(query.exists()))
+
+@app.on_event("startup")
+async def startup():
+    await init_db()
+    get_http_client()
+    trace_exporter.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await close_http_client()
+    await trace_exporter.stop()
 
 @app.get("/")
 def root():
@@ -87,17 +282,240 @@ def root():
 
 @app.get("/health")
 def health_check():
-    return {"status": "healthy", "service": "appointments"}
+    return {"status": "healthy", "service": "appointments", "upstreams": breaker_status()}
+
+@app.get("/health/live")
+def liveness_check():
+    """Liveness: el proceso responde, sin consultar dependencias"""
+    return {"status": "alive", "service": "appointments"}
+
+@app.get("/health/ready")
+async def readiness_check():
+    """Readiness: el servicio puede atender peticiones porque su base de datos responde"""
+    database = await check_database()
+    ready = database["status"] == "ok"
+    content = {"status": "ready" if ready else "not_ready", "service": "appointments", "checks": {"database": database}}
+    return JSONResponse(status_code=200 if ready else 503, content=content)
+
+@app.get("/metrics")
+def get_metrics():
+    """Métricas en formato de texto de Prometheus"""
+    return metrics_response()
+
+@app.get("/debug/pool")
+def get_pool_status():
+    """Uso del pool de conexiones a la base de datos"""
+    return pool_status()
+
+@app.get("/debug/queries")
+def get_query_profile(
+    limit: int = Query(20, ge=1, le=500),
+    order_by: str = Query("total_ms", pattern="^(total_ms|avg_ms|max_ms|calls|rows|slow_calls)$")
+):
+    """Consultas SQL con más tiempo acumulado (requiere SQL_PROFILER_ENABLED=true)"""
+    return query_profiler.snapshot(limit, order_by)
+
+@app.delete("/debug/queries")
+def reset_query_profile():
+    """Reiniciar las estadísticas del profiler"""
+    query_profiler.reset()
+    return {"message": "Estadísticas de consultas reiniciadas"}
+
+@app.get("/cache/stats")
+def cache_stats():
+    """Contadores de aciertos, fallos y expulsiones del cache de pacientes y doctores"""
+    return {name: cache.snapshot() for name, cache in LOOKUP_CACHES.items()}
+
+@app.delete("/cache/{resource}/{item_id}")
+def invalidate_cache(resource: str, item_id: int):
+    """Descartar un paciente o doctor del cache (lo llaman patients-service y doctors-service)"""
+    cache = LOOKUP_CACHES.get(resource)
+    if not cache:
+        raise HTTPException(status_code=404, detail="Cache no encontrado")
+    
+    cache.invalidate(item_id)
+    return {"message": f"Cache de {resource} invalidado para {item_id}"}
+
+@app.delete("/cache/{resource}")
+def invalidate_cache_many(
+    resource: str,
+    ids: Optional[str] = Query(None, description="IDs separados por coma; sin ids se vacía el cache completo")
+):
+    """Descartar varios pacientes o doctores (importaciones masivas) o todo el cache"""
+    cache = LOOKUP_CACHES.get(resource)
+    if not cache:
+        raise HTTPException(status_code=404, detail="Cache no encontrado")
+    
+    if ids is None:
+        cache.clear()
+        return {"message": f"Cache de {resource} vaciado"}
+    
+    try:
+        id_list = [int(item) for item in ids.split(",") if item.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids debe ser una lista de enteros separados por coma")
+    for item_id in id_list:
+        cache.invalidate(item_id)
+    return {"message": f"Cache de {resource} invalidado para {len(id_list)} IDs"}
+
+@app.get("/stats")
+async def get_stats(
+    date_from: Optional[date] = Query(None, description="Inicio del rango para by_date (por defecto hoy)"),
+    date_to: Optional[date] = Query(None, description="Fin del rango para by_date (por defecto hoy + 6 días)"),
+    db: AsyncSession = Depends(get_db)
+):
+    """Conteos de citas agregados en SQL para el dashboard"""
+    today = date.today()
+    date_from = date_from or today
+    date_to = date_to or date_from + timedelta(days=6)
+    
+    by_status = dict((await db.execute(
+        select(AppointmentDB.status, func.count(AppointmentDB.id)).group_by(AppointmentDB.status)
+    )).all())
+    
+    # Solo el rango pedido, usando el índice de appointment_date
+    by_date = (await db.execute(
+        select(AppointmentDB.appointment_date, func.count(AppointmentDB.id)).where(
+            AppointmentDB.appointment_date >= date_from,
+            AppointmentDB.appointment_date <= date_to
+        ).group_by(AppointmentDB.appointment_date)
+    )).all()
+    by_date = {day.isoformat(): count for day, count in by_date}
+    
+    if date_from <= today <= date_to:
+        today_count = by_date.get(today.isoformat(), 0)
+    else:
+        today_count = await db.scalar(select(func.count(AppointmentDB.id)).where(AppointmentDB.appointment_date == today))
+    
+    return {
+        "total": sum(by_status.values()),
+        "today": today_count,
+        "by_status": by_status,
+        "by_date": by_date
+    }
+
+def parse_month(value: str) -> tuple:
+    try:
+        parsed = datetime.strptime(value, "%Y-%m")
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Mes inválido: {value} (formato YYYY-MM)")
+    return parsed.year, parsed.month
+
+@app.get("/reports/monthly")
+async def monthly_report(
+    from_month: Optional[str] = Query(None, alias="from", description="Mes inicial YYYY-MM (por defecto el mes actual)"),
+    to_month: Optional[str] = Query(None, alias="to", description="Mes final YYYY-MM (por defecto igual al inicial)"),
+    refresh: bool = Query(False, description="Recalcular también los meses terminados"),
+    db: AsyncSession = Depends(get_db)
+):
+    """Reporte de citas por mes, doctor, especialidad y estado con ingresos y tasas de inasistencia"""
+    today = date.today()
+    start = parse_month(from_month) if from_month else (today.year, today.month)
+    end = parse_month(to_month) if to_month else start
+    if start > end:
+        raise HTTPException(status_code=400, detail="El mes inicial debe ser anterior o igual al mes final")
+    
+    months = reports.months_between(start, end)
+    if len(months) > reports.MAX_REPORT_MONTHS:
+        raise HTTPException(status_code=400, detail=f"Máximo {reports.MAX_REPORT_MONTHS} meses por reporte")
+    
+    month_results = [await reports.get_month(db, year, month, refresh) for year, month in months]
+    
+    # La especialidad se consulta al momento: puede cambiar después de cerrado el mes
+    doctor_ids = {doctor_id for result in month_results for doctor_id in result["by_doctor"]}
+    doctors = await fetch_doctors(doctor_ids)
+    
+    return {
+        "period": {"from": month_results[0]["month"], "to": month_results[-1]["month"]},
+        **reports.summarize(month_results, doctors)
+    }
+
+def availability_range(date_from: Optional[date], date_to: Optional[date]) -> tuple:
+    date_from = date_from or date.today()
+    date_to = date_to or date_from + timedelta(days=6)
+    if date_to < date_from:
+        raise HTTPException(status_code=400, detail="La fecha inicial debe ser anterior o igual a la final")
+    if (date_to - date_from).days >= availability.MAX_AVAILABILITY_DAYS:
+        raise HTTPException(status_code=400, detail=f"Máximo {availability.MAX_AVAILABILITY_DAYS} días por consulta")
+    return date_from, date_to
+
+async def fetch_doctors_by_specialty(specialty: str) -> List[dict]:
+    response = await upstream_get("doctors", f"{DOCTORS_SERVICE_URL}/doctors/specialty/{quote(specialty, safe='')}")
+    # El "/" codificado llega decodificado a doctors-service y no coincide con la ruta: no hay doctores
+    if response.status_code == 404:
+        return []
+    if response.status_code != 200:
+        raise HTTPException(status_code=503, detail="Servicio de doctores no disponible")
+    return response.json()
+
+@app.get("/doctors/{doctor_id}/availability")
+async def get_doctor_availability(
+    doctor_id: int,
+    date_from: Optional[date] = Query(None, alias="from", description="Fecha inicial (por defecto hoy)"),
+    date_to: Optional[date] = Query(None, alias="to", description="Fecha final (por defecto 7 días)"),
+    db: AsyncSession = Depends(get_db)
+):
+    """Turnos libres de un doctor según su horario, menos las citas ya reservadas"""
+    date_from, date_to = availability_range(date_from, date_to)
+    
+    doctor_info = await get_doctor_info(doctor_id)
+    if not doctor_info:
+        raise HTTPException(status_code=404, detail="Doctor no encontrado")
+    
+    booked = await availability.booked_intervals(db, [doctor_id], date_from, date_to, ACTIVE_STATUSES)
+    return {
+        "doctor_id": doctor_id,
+        "doctor_name": doctor_info["full_name"],
+        "specialty": doctor_info["specialty"],
+        "slot_duration": doctor_info.get("consultation_duration", 30),
+        "days": availability.free_slots(doctor_info, date_from, date_to, booked)
+    }
+
+@app.get("/availability")
+async def search_availability(
+    specialty: str = Query(..., description="Especialidad a buscar"),
+    date_from: Optional[date] = Query(None, alias="from", description="Fecha inicial (por defecto hoy)"),
+    date_to: Optional[date] = Query(None, alias="to", description="Fecha final (por defecto 7 días)"),
+    db: AsyncSession = Depends(get_db)
+):
+    """Disponibilidad de todos los doctores de una especialidad, ordenados por el primer turno libre"""
+    date_from, date_to = availability_range(date_from, date_to)
+    
+    doctors = await fetch_doctors_by_specialty(specialty)
+    booked = await availability.booked_intervals(db, [doctor["id"] for doctor in doctors], date_from, date_to, ACTIVE_STATUSES)
+    
+    results = []
+    for doctor_info in doctors:
+        days = availability.free_slots(doctor_info, date_from, date_to, booked)
+        if not days:
+            continue
+        results.append({
+            "doctor_id": doctor_info["id"],
+            "doctor_name": doctor_info["full_name"],
+            "specialty": doctor_info["specialty"],
+            "slot_duration": doctor_info.get("consultation_duration", 30),
+            "first_available": f"{days[0]['date']}T{days[0]['slots'][0]}",
+            "days": days
+        })
+    results.sort(key=lambda result: result["first_available"])
+    
+    return {
+        "specialty": specialty,
+        "from": date_from.isoformat(),
+        "to": date_to.isoformat(),
+        "first_available": results[0] if results else None,
+        "doctors": results
+    }
 
 @app.post("/appointments", response_model=Appointment)
-async def create_appointment(appointment: AppointmentCreate, db: Session = Depends(get_db)):
-    # Verificar que el paciente existe
-    patient_info = await verify_patient_exists(appointment.patient_id)
+async def create_appointment(appointment: AppointmentCreate, db: AsyncSession = Depends(get_db)):
+    # Verificar que el paciente y el doctor existen, ambas consultas a la vez
+    patient_info, doctor_info = await asyncio.gather(
+        get_patient_info(appointment.patient_id),
+        get_doctor_info(appointment.doctor_id)
+    )
     if not patient_info:
         raise HTTPException(status_code=400, detail="Paciente no encontrado")
-    
-    # Verificar que el doctor existe
-    doctor_info = await verify_doctor_exists(appointment.doctor_id)
     if not doctor_info:
         raise HTTPException(status_code=400, detail="Doctor no encontrado")
     
@@ -114,7 +532,7 @@ async def create_appointment(appointment: AppointmentCreate, db: Session = Depen
     
     # Verificar conflictos de horario
     consultation_duration = doctor_info.get("consultation_duration", 30)
-    if has_scheduling_conflict(db, appointment.doctor_id, appointment.appointment_date, 
+    if await has_scheduling_conflict(db, appointment.doctor_id, appointment.appointment_date, 
                              appointment.appointment_time, consultation_duration):
         raise HTTPException(
             status_code=400, 
@@ -124,12 +542,14 @@ async def create_appointment(appointment: AppointmentCreate, db: Session = Depen
     # Crear la cita en la base de datos
     db_appointment = AppointmentDB(
         **appointment.dict(),
+        duration=consultation_duration,
+        end_time=calculate_end_time(appointment.appointment_time, consultation_duration),
         total_cost=doctor_info["consultation_fee"],
         status="programada"
     )
     db.add(db_appointment)
-    db.commit()
-    db.refresh(db_appointment)
+    await db.commit()
+    await db.refresh(db_appointment)
     
     # Agregar información del paciente y doctor para la respuesta
     appointment_dict = db_appointment.__dict__.copy()
@@ -139,59 +559,151 @@ async def create_appointment(appointment: AppointmentCreate, db: Session = Depen
     
     return appointment_dict
 
+@app.post("/appointments/batch", response_model=AppointmentBatchResult)
+async def create_appointments_batch(batch: AppointmentBatchCreate, db: AsyncSession = Depends(get_db)):
+    """Reservar varios turnos (p. ej. un plan de tratamiento) validando paciente y doctor una sola vez"""
+    patient_info, doctor_info = await asyncio.gather(
+        get_patient_info(batch.patient_id),
+        get_doctor_info(batch.doctor_id)
+    )
+    if not patient_info:
+        raise HTTPException(status_code=400, detail="Paciente no encontrado")
+    if not doctor_info:
+        raise HTTPException(status_code=400, detail="Doctor no encontrado")
+    
+    consultation_duration = doctor_info.get("consultation_duration", 30)
+    dates = [slot.appointment_date for slot in batch.slots]
+    
+    # Citas existentes del doctor en todo el rango, en una sola consulta
+    booked = await availability.booked_intervals(db, [batch.doctor_id], min(dates), max(dates), ACTIVE_STATUSES)
+    
+    errors = []
+    accepted = []
+    for index, slot in enumerate(batch.slots):
+        end_time = calculate_end_time(slot.appointment_time, consultation_duration)
+        day_intervals = booked.setdefault((batch.doctor_id, slot.appointment_date), [])
+        
+        if slot.appointment_date < date.today():
+            detail = "No se pueden programar citas en fechas pasadas"
+        elif not is_doctor_available(doctor_info, slot.appointment_date, slot.appointment_time):
+            detail = "El doctor no está disponible en ese día y horario"
+        elif any(start < end_time and end > slot.appointment_time for start, end in day_intervals):
+            detail = "El doctor ya tiene una cita programada en ese horario"
+        else:
+            # Los turnos aceptados también ocupan el horario para los siguientes del lote
+            day_intervals.append((slot.appointment_time, end_time))
+            accepted.append((slot, end_time))
+            continue
+        
+        errors.append({
+            "index": index,
+            "appointment_date": slot.appointment_date.isoformat(),
+            "appointment_time": slot.appointment_time.isoformat(),
+            "detail": detail
+        })
+    
+    if errors and batch.mode == "all_or_nothing":
+        raise HTTPException(status_code=400, detail={"message": "Ningún turno fue reservado", "errors": errors})
+    
+    # Todos los turnos válidos en una sola transacción
+    shared = batch.dict(exclude={"slots", "mode"})
+    db_appointments = [
+        AppointmentDB(
+            **shared,
+            appointment_date=slot.appointment_date,
+            appointment_time=slot.appointment_time,
+            duration=consultation_duration,
+            end_time=end_time,
+            total_cost=doctor_info["consultation_fee"],
+            status="programada"
+        )
+        for slot, end_time in accepted
+    ]
+    db.add_all(db_appointments)
+    await db.commit()
+    
+    created = []
+    for db_appointment in db_appointments:
+        appointment_dict = db_appointment.__dict__.copy()
+        appointment_dict['patient_name'] = patient_info['full_name']
+        appointment_dict['doctor_name'] = doctor_info['full_name']
+        appointment_dict['doctor_specialty'] = doctor_info['specialty']
+        created.append(appointment_dict)
+    
+    return {"mode": batch.mode, "created": created, "errors": errors}
+
 @app.get("/appointments", response_model=List[Appointment])
 async def get_appointments(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Cursor X-Next-Cursor de la página anterior"),
+    sort_by: str = Query("id"),
+    order: str = Query("asc", pattern="^(asc|desc)$"),
     patient_id: Optional[int] = Query(None),
     doctor_id: Optional[int] = Query(None),
     status: Optional[str] = Query(None),
     appointment_date: Optional[date] = Query(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    query = db.query(AppointmentDB)
+    query = select(AppointmentDB)
     
     if patient_id:
-        query = query.filter(AppointmentDB.patient_id == patient_id)
+        query = query.where(AppointmentDB.patient_id == patient_id)
     if doctor_id:
-        query = query.filter(AppointmentDB.doctor_id == doctor_id)
+        query = query.where(AppointmentDB.doctor_id == doctor_id)
     if status:
-        query = query.filter(AppointmentDB.status == status)
+        query = query.where(AppointmentDB.status == status)
     if appointment_date:
-        query = query.filter(AppointmentDB.appointment_date == appointment_date)
+        query = query.where(AppointmentDB.appointment_date == appointment_date)
     
-    appointments = query.offset(skip).limit(limit).all()
+    columns = sort_columns(SORT_OPTIONS, sort_by)
+    query = paginate(query, columns, sort_by, limit, skip=skip, cursor=cursor, descending=order == "desc")
+    appointments = page_rows((await db.scalars(query)).all(), columns, sort_by, limit, response, descending=order == "desc")
     
-    # Enriquecer con información de pacientes y doctores
-    enriched_appointments = []
-    for appointment in appointments:
-        appointment_dict = appointment.__dict__.copy()
-        
-        # Obtener información del paciente y doctor
-        patient_info = await verify_patient_exists(appointment.patient_id)
-        doctor_info = await verify_doctor_exists(appointment.doctor_id)
-        
-        if patient_info:
-            appointment_dict['patient_name'] = patient_info['full_name']
-        if doctor_info:
-            appointment_dict['doctor_name'] = doctor_info['full_name']
-            appointment_dict['doctor_specialty'] = doctor_info['specialty']
-        
-        enriched_appointments.append(appointment_dict)
+    # Enriquecer con información de pacientes y doctores: una consulta masiva por servicio
+    patients, doctors = await asyncio.gather(
+        fetch_patients(appointment.patient_id for appointment in appointments),
+        fetch_doctors(appointment.doctor_id for appointment in appointments)
+    )
     
-    return enriched_appointments
+    return [enrich_appointment(appointment, patients, doctors) for appointment in appointments]
+
+@app.get("/appointments/export")
+def export_appointments(
+    export_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+    since: Optional[datetime] = Query(None, description="Solo citas modificadas después de esta fecha (updated_at)"),
+    date_from: Optional[date] = Query(None),
+    date_to: Optional[date] = Query(None),
+    status: Optional[str] = Query(None)
+):
+    """Extracto completo o incremental en NDJSON o CSV, enviado en streaming"""
+    query = select(*AppointmentDB.__table__.c)
+    
+    if since:
+        query = query.where(AppointmentDB.updated_at > since)
+    if date_from:
+        query = query.where(AppointmentDB.appointment_date >= date_from)
+    if date_to:
+        query = query.where(AppointmentDB.appointment_date <= date_to)
+    if status:
+        query = query.where(AppointmentDB.status == status)
+    
+    return export_response(query.order_by(AppointmentDB.id), export_format, "appointments")
 
 @app.get("/appointments/{appointment_id}", response_model=Appointment)
-async def get_appointment(appointment_id: int, db: Session = Depends(get_db)):
-    appointment = db.query(AppointmentDB).filter(AppointmentDB.id == appointment_id).first()
+async def get_appointment(appointment_id: int, db: AsyncSession = Depends(get_db)):
+    appointment = await db.scalar(select(AppointmentDB).where(AppointmentDB.id == appointment_id))
     if not appointment:
         raise HTTPException(status_code=404, detail="Cita no encontrada")
     
     # Enriquecer con información de paciente y doctor
     appointment_dict = appointment.__dict__.copy()
     
-    patient_info = await verify_patient_exists(appointment.patient_id)
-    doctor_info = await verify_doctor_exists(appointment.doctor_id)
+    patient_info, doctor_info = await asyncio.gather(
+        verify_patient_exists(appointment.patient_id),
+        verify_doctor_exists(appointment.doctor_id)
+    )
     
     if patient_info:
         appointment_dict['patient_name'] = patient_info['full_name']
@@ -202,8 +714,8 @@ async def get_appointment(appointment_id: int, db: Session = Depends(get_db)):
     return appointment_dict
 
 @app.put("/appointments/{appointment_id}", response_model=Appointment)
-async def update_appointment(appointment_id: int, appointment_update: AppointmentUpdate, db: Session = Depends(get_db)):
-    db_appointment = db.query(AppointmentDB).filter(AppointmentDB.id == appointment_id).first()
+async def update_appointment(appointment_id: int, appointment_update: AppointmentUpdate, db: AsyncSession = Depends(get_db)):
+    db_appointment = await db.scalar(select(AppointmentDB).where(AppointmentDB.id == appointment_id))
     if not db_appointment:
         raise HTTPException(status_code=404, detail="Cita no encontrada")
     
@@ -220,27 +732,35 @@ async def update_appointment(appointment_id: int, appointment_update: Appointmen
         new_time = update_data.get('appointment_time', db_appointment.appointment_time)
         
         # Verificar disponibilidad del doctor
-        doctor_info = await verify_doctor_exists(db_appointment.doctor_id)
+        doctor_info = await get_doctor_info(db_appointment.doctor_id)
         if doctor_info and not is_doctor_available(doctor_info, new_date, new_time):
             raise HTTPException(status_code=400, detail="El doctor no está disponible en ese nuevo horario")
         
         # Verificar conflictos
-        consultation_duration = doctor_info.get("consultation_duration", 30) if doctor_info else 30
-        if has_scheduling_conflict(db, db_appointment.doctor_id, new_date, new_time, 
+        consultation_duration = doctor_info.get("consultation_duration", db_appointment.duration) if doctor_info else db_appointment.duration
+        if await has_scheduling_conflict(db, db_appointment.doctor_id, new_date, new_time, 
                                  consultation_duration, appointment_id):
             raise HTTPException(status_code=400, detail="Conflicto de horario con otra cita")
+        
+        update_data['duration'] = consultation_duration
+        update_data['end_time'] = calculate_end_time(new_time, consultation_duration)
     
+    previous_date = db_appointment.appointment_date
     for field, value in update_data.items():
         setattr(db_appointment, field, value)
     
     db_appointment.updated_at = datetime.utcnow()
-    db.commit()
-    db.refresh(db_appointment)
+    await db.commit()
+    # La fecha anterior y la nueva pueden caer en meses ya cacheados del reporte
+    reports.invalidate_from(min(previous_date, db_appointment.appointment_date))
+    await db.refresh(db_appointment)
     
     # Enriquecer respuesta
     appointment_dict = db_appointment.__dict__.copy()
-    patient_info = await verify_patient_exists(db_appointment.patient_id)
-    doctor_info = await verify_doctor_exists(db_appointment.doctor_id)
+    patient_info, doctor_info = await asyncio.gather(
+        verify_patient_exists(db_appointment.patient_id),
+        verify_doctor_exists(db_appointment.doctor_id)
+    )
     
     if patient_info:
         appointment_dict['patient_name'] = patient_info['full_name']
@@ -251,8 +771,8 @@ async def update_appointment(appointment_id: int, appointment_update: Appointmen
     return appointment_dict
 
 @app.delete("/appointments/{appointment_id}")
-def cancel_appointment(appointment_id: int, db: Session = Depends(get_db)):
-    db_appointment = db.query(AppointmentDB).filter(AppointmentDB.id == appointment_id).first()
+async def cancel_appointment(appointment_id: int, db: AsyncSession = Depends(get_db)):
+    db_appointment = await db.scalar(select(AppointmentDB).where(AppointmentDB.id == appointment_id))
     if not db_appointment:
         raise HTTPException(status_code=404, detail="Cita no encontrada")
     
@@ -261,12 +781,13 @@ def cancel_appointment(appointment_id: int, db: Session = Depends(get_db)):
     
     db_appointment.status = "cancelada"
     db_appointment.updated_at = datetime.utcnow()
-    db.commit()
+    await db.commit()
+    reports.invalidate_from(db_appointment.appointment_date)
     return {"message": f"Cita {appointment_id} cancelada correctamente"}
 
 @app.patch("/appointments/{appointment_id}/complete")
-def complete_appointment(appointment_id: int, completion_data: AppointmentComplete, db: Session = Depends(get_db)):
-    db_appointment = db.query(AppointmentDB).filter(AppointmentDB.id == appointment_id).first()
+async def complete_appointment(appointment_id: int, completion_data: AppointmentComplete, db: AsyncSession = Depends(get_db)):
+    db_appointment = await db.scalar(select(AppointmentDB).where(AppointmentDB.id == appointment_id))
     if not db_appointment:
         raise HTTPException(status_code=404, detail="Cita no encontrada")
     
@@ -284,56 +805,37 @@ def complete_appointment(appointment_id: int, completion_data: AppointmentComple
     db_appointment.next_appointment_notes = completion_data.next_appointment_notes
     db_appointment.updated_at = datetime.utcnow()
     
-    db.commit()
+    await db.commit()
+    reports.invalidate_from(db_appointment.appointment_date)
     return {"message": f"Cita {appointment_id} completada correctamente"}
 
 @app.get("/appointments/patient/{patient_id}", response_model=List[Appointment])
-async def get_patient_appointments(patient_id: int, db: Session = Depends(get_db)):
+async def get_patient_appointments(patient_id: int, db: AsyncSession = Depends(get_db)):
     # Verificar que el paciente existe
-    patient_info = await verify_patient_exists(patient_id)
+    patient_info = await get_patient_info(patient_id)
     if not patient_info:
         raise HTTPException(status_code=404, detail="Paciente no encontrado")
     
-    appointments = db.query(AppointmentDB).filter(AppointmentDB.patient_id == patient_id).all()
+    appointments = (await db.scalars(select(AppointmentDB).where(AppointmentDB.patient_id == patient_id))).all()
     
-    # Enriquecer con información del doctor
-    enriched_appointments = []
-    for appointment in appointments:
-        appointment_dict = appointment.__dict__.copy()
-        appointment_dict['patient_name'] = patient_info['full_name']
-        
-        doctor_info = await verify_doctor_exists(appointment.doctor_id)
-        if doctor_info:
-            appointment_dict['doctor_name'] = doctor_info['full_name']
-            appointment_dict['doctor_specialty'] = doctor_info['specialty']
-        
-        enriched_appointments.append(appointment_dict)
+    # Enriquecer con información de los doctores en una sola consulta masiva
+    doctors = await fetch_doctors(appointment.doctor_id for appointment in appointments)
     
-    return enriched_appointments
+    return [enrich_appointment(appointment, {patient_id: patient_info}, doctors) for appointment in appointments]
 
 @app.get("/appointments/doctor/{doctor_id}", response_model=List[Appointment])
-async def get_doctor_appointments(doctor_id: int, db: Session = Depends(get_db)):
+async def get_doctor_appointments(doctor_id: int, db: AsyncSession = Depends(get_db)):
     # Verificar que el doctor existe
-    doctor_info = await verify_doctor_exists(doctor_id)
+    doctor_info = await get_doctor_info(doctor_id)
     if not doctor_info:
         raise HTTPException(status_code=404, detail="Doctor no encontrado")
     
-    appointments = db.query(AppointmentDB).filter(AppointmentDB.doctor_id == doctor_id).all()
+    appointments = (await db.scalars(select(AppointmentDB).where(AppointmentDB.doctor_id == doctor_id))).all()
     
-    # Enriquecer con información del paciente
-    enriched_appointments = []
-    for appointment in appointments:
-        appointment_dict = appointment.__dict__.copy()
-        appointment_dict['doctor_name'] = doctor_info['full_name']
-        appointment_dict['doctor_specialty'] = doctor_info['specialty']
-        
-        patient_info = await verify_patient_exists(appointment.patient_id)
-        if patient_info:
-            appointment_dict['patient_name'] = patient_info['full_name']
-        
-        enriched_appointments.append(appointment_dict)
+    # Enriquecer con información de los pacientes en una sola consulta masiva
+    patients = await fetch_patients(appointment.patient_id for appointment in appointments)
     
-    return enriched_appointments
+    return [enrich_appointment(appointment, patients, {doctor_id: doctor_info}) for appointment in appointments]
 
 if __name__ == "__main__":
     import uvicorn
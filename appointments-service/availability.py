@@ -0,0 +1,107 @@
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, Iterable, List, Optional, Tuple
+from datetime import date, datetime, time, timedelta
+from database import AppointmentDB
+
+WEEKDAY_NAMES = ["lunes", "martes", "miercoles", "jueves", "viernes", "sabado", "domingo"]
+
+# Máximo de días por búsqueda de disponibilidad
+MAX_AVAILABILITY_DAYS = 31
+
+def to_minutes(value: time) -> int:
+    return value.hour * 60 + value.minute
+
+def parse_time(value) -> time:
+    return value if isinstance(value, time) else time.fromisoformat(str(value))
+
+class SlotTemplate:
+    """Bitmap de los turnos de un día laboral: el bit i es el turno que empieza en start + i * duration"""
+
+    def __init__(self, doctor_info: dict):
+        self.start = to_minutes(parse_time(doctor_info["start_time"]))
+        end = to_minutes(parse_time(doctor_info["end_time"]))
+        self.duration = doctor_info.get("consultation_duration") or 30
+        self.slot_count = max(0, (end - self.start) // self.duration)
+        self.full_mask = (1 << self.slot_count) - 1
+        self.working_days = set(doctor_info.get("working_days", []))
+
+    def day_mask(self, day: date) -> int:
+        return self.full_mask if WEEKDAY_NAMES[day.weekday()] in self.working_days else 0
+
+    def booked_mask(self, start_minutes: int, end_minutes: int) -> int:
+        """Bits de los turnos que se solapan con el intervalo [inicio, fin)"""
+        first = max(0, (start_minutes - self.start) // self.duration)
+        last = min(self.slot_count, -(-(end_minutes - self.start) // self.duration))
+        if last <= first:
+            return 0
+        return ((1 << (last - first)) - 1) << first
+
+    def slot_times(self, mask: int) -> List[str]:
+        slots = []
+        index = 0
+        while mask:
+            if mask & 1:
+                minutes = self.start + index * self.duration
+                slots.append(f"{minutes // 60:02d}:{minutes % 60:02d}")
+            mask >>= 1
+            index += 1
+        return slots
+
+# Plantillas por doctor; se recalculan si cambia su horario
+_templates: Dict[int, Tuple[tuple, SlotTemplate]] = {}
+
+def get_template(doctor_info: dict) -> SlotTemplate:
+    key = (
+        str(doctor_info["start_time"]), str(doctor_info["end_time"]),
+        doctor_info.get("consultation_duration"), tuple(doctor_info.get("working_days", []))
+    )
+    cached = _templates.get(doctor_info["id"])
+    if cached and cached[0] == key:
+        return cached[1]
+    template = SlotTemplate(doctor_info)
+    _templates[doctor_info["id"]] = (key, template)
+    return template
+
+async def booked_intervals(db: AsyncSession, doctor_ids: Iterable[int], date_from: date, date_to: date,
+                           statuses: List[str]) -> Dict[Tuple[int, date], List[Tuple[time, time]]]:
+    """Intervalos ocupados de varios doctores en un rango, en una sola consulta"""
+    rows = (await db.execute(
+        select(
+            AppointmentDB.doctor_id, AppointmentDB.appointment_date, AppointmentDB.appointment_time, AppointmentDB.end_time
+        ).where(
+            AppointmentDB.doctor_id.in_(list(doctor_ids)),
+            AppointmentDB.appointment_date >= date_from,
+            AppointmentDB.appointment_date <= date_to,
+            AppointmentDB.status.in_(statuses)
+        )
+    )).all()
+
+    intervals: Dict[Tuple[int, date], List[Tuple[time, time]]] = {}
+    for doctor_id, day, start, end in rows:
+        intervals.setdefault((doctor_id, day), []).append((start, end))
+    return intervals
+
+def free_slots(doctor_info: dict, date_from: date, date_to: date,
+               booked: Dict[Tuple[int, date], List[Tuple[time, time]]], now: Optional[datetime] = None) -> List[dict]:
+    """Turnos libres por día: plantilla del día menos los intervalos reservados"""
+    if not doctor_info.get("is_available", True) or not doctor_info.get("is_active", True):
+        return []
+
+    template = get_template(doctor_info)
+    now = now or datetime.now()
+    days = []
+    day = max(date_from, now.date())
+    while day <= date_to:
+        mask = template.day_mask(day)
+        if mask:
+            for start, end in booked.get((doctor_info["id"], day), []):
+                end_minutes = to_minutes(end) if end != time.max else 24 * 60
+                mask &= ~template.booked_mask(to_minutes(start), end_minutes)
+            if day == now.date():
+                # Turnos que ya empezaron hoy no se ofrecen
+                mask &= ~template.booked_mask(0, now.hour * 60 + now.minute + 1)
+            if mask:
+                days.append({"date": day.isoformat(), "slots": template.slot_times(mask)})
+        day += timedelta(days=1)
+    return days
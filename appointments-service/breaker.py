@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import deque
+from typing import Deque, Dict, Tuple
+
+logger = logging.getLogger("appointments-service.breaker")
+
+# Configuración del circuit breaker (uno por servicio)
+BREAKER_FAILURE_RATE = float(os.getenv("BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "10"))
+BREAKER_WINDOW_SECONDS = float(os.getenv("BREAKER_WINDOW_SECONDS", "30"))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "15"))
+BREAKER_HALF_OPEN_CALLS = int(os.getenv("BREAKER_HALF_OPEN_CALLS", "1"))
+
+# Reintentos de peticiones idempotentes y presupuesto global de reintentos
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "2"))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "0.1"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "1.0"))
+RETRY_BUDGET_RATIO = float(os.getenv("RETRY_BUDGET_RATIO", "0.1"))
+RETRY_BUDGET_MIN_PER_SECOND = float(os.getenv("RETRY_BUDGET_MIN_PER_SECOND", "1"))
+
+# Respuestas que cuentan como fallo del servicio. Un 503 no cuenta: el servicio responde
+# y avisa que una dependencia suya no está disponible (tiene su propio circuito)
+FAILURE_STATUSES = {500, 502, 504}
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitOpenError(Exception):
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Circuito abierto para {name}")
+        self.name = name
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """Abre el circuito cuando la tasa de fallos de la ventana supera el umbral; luego prueba con pocas peticiones"""
+
+    def __init__(self, name: str, failure_rate: float = BREAKER_FAILURE_RATE, min_calls: int = BREAKER_MIN_CALLS,
+                 window: float = BREAKER_WINDOW_SECONDS, open_seconds: float = BREAKER_OPEN_SECONDS,
+                 half_open_calls: int = BREAKER_HALF_OPEN_CALLS):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self._half_open_at = 0.0
+        self._probes = 0
+        # (instante, falló) de las llamadas recientes
+        self._calls: Deque[Tuple[float, bool]] = deque()
+        self.stats = {"successes": 0, "failures": 0, "rejected": 0, "opened": 0}
+
+    def _trim(self, now: float):
+        while self._calls and self._calls[0][0] < now - self.window:
+            self._calls.popleft()
+
+    def _current_failure_rate(self) -> float:
+        if not self._calls:
+            return 0.0
+        return sum(1 for _, failed in self._calls if failed) / len(self._calls)
+
+    def allow(self):
+        """Lanzar CircuitOpenError si la llamada no debe intentarse"""
+        now = time.monotonic()
+        if self.state == OPEN:
+            remaining = self.opened_at + self.open_seconds - now
+            if remaining > 0:
+                self.stats["rejected"] += 1
+                raise CircuitOpenError(self.name, remaining)
+            self.state = HALF_OPEN
+            self._probes = 0
+            self._half_open_at = now
+            logger.info("Circuito de %s en half-open, probando", self.name)
+        if self.state == HALF_OPEN:
+            if self._probes >= self.half_open_calls and now - self._half_open_at > self.open_seconds:
+                # Una prueba que nunca terminó (cancelada) no debe dejar el circuito bloqueado
+                self._probes = 0
+                self._half_open_at = now
+            if self._probes >= self.half_open_calls:
+                self.stats["rejected"] += 1
+                raise CircuitOpenError(self.name, self.open_seconds)
+            self._probes += 1
+
+    def record_success(self):
+        self.stats["successes"] += 1
+        if self.state == HALF_OPEN:
+            self._probes = max(0, self._probes - 1)
+            self.state = CLOSED
+            self._calls.clear()
+            logger.info("Circuito de %s cerrado", self.name)
+            return
+        self._record(False)
+
+    def record_failure(self):
+        self.stats["failures"] += 1
+        if self.state == HALF_OPEN:
+            self._probes = max(0, self._probes - 1)
+            self._open()
+            return
+        self._record(True)
+        if self.state == CLOSED and len(self._calls) >= self.min_calls and self._current_failure_rate() >= self.failure_rate:
+            self._open()
+
+    def _record(self, failed: bool):
+        now = time.monotonic()
+        self._calls.append((now, failed))
+        self._trim(now)
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.stats["opened"] += 1
+        logger.warning("Circuito de %s abierto por %.0fs", self.name, self.open_seconds)
+
+    def snapshot(self) -> dict:
+        self._trim(time.monotonic())
+        return {
+            "state": self.state,
+            "failure_rate": round(self._current_failure_rate(), 4),
+            "calls_in_window": len(self._calls),
+            "retry_after": round(max(0.0, self.opened_at + self.open_seconds - time.monotonic()), 2) if self.state == OPEN else 0.0,
+            **self.stats
+        }
+
+class RetryBudget:
+    """Limita los reintentos a una fracción de las peticiones recientes, para no multiplicar la carga"""
+
+    def __init__(self, ratio: float = RETRY_BUDGET_RATIO, min_per_second: float = RETRY_BUDGET_MIN_PER_SECOND,
+                 window: float = 10.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.window = window
+        self._requests: Deque[float] = deque()
+        self._retries: Deque[float] = deque()
+        self.stats = {"retries": 0, "exhausted": 0}
+
+    def _trim(self, now: float):
+        for events in (self._requests, self._retries):
+            while events and events[0] < now - self.window:
+                events.popleft()
+
+    def record_request(self):
+        self._requests.append(time.monotonic())
+
+    def try_retry(self) -> bool:
+        now = time.monotonic()
+        self._trim(now)
+        allowed = self.min_per_second * self.window + self.ratio * len(self._requests)
+        if len(self._retries) >= allowed:
+            self.stats["exhausted"] += 1
+            return False
+        self._retries.append(now)
+        self.stats["retries"] += 1
+        return True
+
+    def snapshot(self) -> dict:
+        self._trim(time.monotonic())
+        return {
+            "ratio": self.ratio,
+            "requests_in_window": len(self._requests),
+            "retries_in_window": len(self._retries),
+            **self.stats
+        }
+
+def backoff_delay(attempt: int) -> float:
+    """Backoff exponencial con jitter completo"""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt)))
+
+async def wait_before_retry(attempt: int):
+    await asyncio.sleep(backoff_delay(attempt))
+
+_breakers: Dict[str, CircuitBreaker] = {}
+retry_budget = RetryBudget()
+
+def get_breaker(name: str) -> CircuitBreaker:
+    if name not in _breakers:
+        _breakers[name] = CircuitBreaker(name)
+    return _breakers[name]
+
+def breaker_status() -> dict:
+    return {
+        "breakers": {name: breaker.snapshot() for name, breaker in _breakers.items()},
+        "retry_budget": retry_budget.snapshot()
+    }
@@ -0,0 +1,109 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+# Configuración del cache de pacientes y doctores
+LOOKUP_CACHE_MAX_SIZE = int(os.getenv("LOOKUP_CACHE_MAX_SIZE", "1000"))
+LOOKUP_CACHE_TTL = float(os.getenv("LOOKUP_CACHE_TTL", "300"))
+LOOKUP_CACHE_NEGATIVE_TTL = float(os.getenv("LOOKUP_CACHE_NEGATIVE_TTL", "30"))
+
+class LookupCache:
+    """Cache LRU en memoria con TTL, cache negativo (404) y coalescencia de consultas concurrentes"""
+
+    def __init__(self, name: str, max_size: int = LOOKUP_CACHE_MAX_SIZE, ttl: float = LOOKUP_CACHE_TTL,
+                 negative_ttl: float = LOOKUP_CACHE_NEGATIVE_TTL):
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        # clave -> (expira_en, valor); valor None significa "no existe"
+        self._entries: "OrderedDict[Hashable, Tuple[float, Optional[dict]]]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._invalidated_inflight = set()
+        self.stats = {
+            "hits": 0, "negative_hits": 0, "misses": 0, "evictions": 0,
+            "expirations": 0, "invalidations": 0, "coalesced": 0
+        }
+
+    def get(self, key: Hashable) -> Tuple[bool, Optional[dict]]:
+        """Retorna (encontrado, valor) sin consultar la red"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.stats["misses"] += 1
+            return False, None
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.stats["expirations"] += 1
+            self.stats["misses"] += 1
+            return False, None
+
+        self._entries.move_to_end(key)
+        self.stats["hits" if value is not None else "negative_hits"] += 1
+        return True, value
+
+    def set(self, key: Hashable, value: Optional[dict]):
+        ttl = self.ttl if value is not None else self.negative_ttl
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def invalidate(self, key: Hashable):
+        self._entries.pop(key, None)
+        if key in self._inflight:
+            # La respuesta en vuelo puede estar desactualizada: no guardarla
+            self._invalidated_inflight.add(key)
+        self.stats["invalidations"] += 1
+
+    def clear(self):
+        self._entries.clear()
+        self._invalidated_inflight.update(self._inflight)
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[Hashable], Awaitable[Optional[dict]]]) -> Optional[dict]:
+        """Leer del cache o cargar una sola vez aunque lleguen varias peticiones a la vez"""
+        found, value = self.get(key)
+        if found:
+            return value
+
+        if key in self._inflight:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(self._inflight[key])
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await loader(key)
+        except BaseException as e:
+            # Si la petición que cargaba se cancela, las que esperaban no deben quedar colgadas
+            future.set_exception(e if isinstance(e, Exception) else RuntimeError("Consulta al microservicio cancelada"))
+            future.exception()  # Evitar el aviso si nadie más esperaba
+            raise
+        else:
+            if key not in self._invalidated_inflight:
+                self.set(key, value)
+            future.set_result(value)
+            return value
+        finally:
+            del self._inflight[key]
+            self._invalidated_inflight.discard(key)
+
+    def store_many(self, found: Dict[Hashable, dict], requested: Iterable[Hashable]):
+        """Guardar el resultado de una consulta masiva; los IDs ausentes se guardan como negativos"""
+        for key in requested:
+            self.set(key, found.get(key))
+
+    def snapshot(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["negative_hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "negative_ttl": self.negative_ttl,
+            "hit_ratio": round((self.stats["hits"] + self.stats["negative_hits"]) / lookups, 4) if lookups else 0.0
+        }
@@ -1,14 +1,34 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, Text, Boolean, DateTime, Date, Time
+from sqlalchemy import inspect, bindparam, Column, Integer, String, Float, Text, Boolean, DateTime, Date, Time, Index
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from datetime import datetime
+from datetime import datetime, date, time, timedelta
+import os
+from db_engine import Database
 
-DATABASE_URL = "sqlite:///./appointments.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+# Engine, pool e instrumentación compartidos con los otros servicios (db_engine.py)
+database = Database(os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./appointments.db"))
+engine = database.engine
+DATABASE_URL = database.url
+IS_SQLITE = database.is_sqlite
+SessionLocal = database.session_factory
+query_profiler = database.profiler
+pool_status = database.pool_status
+check_database = database.check
+get_db = database.session
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Duración asumida para citas creadas antes de guardar la duración
+LEGACY_DURATION = 30
+
+def calculate_end_time(start_time: time, duration: int) -> time:
+    """Hora de fin de una cita; si pasa de medianoche se limita al final del día"""
+    end = datetime.combine(date.min, start_time) + timedelta(minutes=duration)
+    return end.time() if end.date() == date.min else time.max
+
+def default_end_time(context) -> time:
+    params = context.get_current_parameters()
+    return calculate_end_time(params["appointment_time"], params.get("duration") or LEGACY_DURATION)
+
 class AppointmentDB(Base):
     __tablename__ = "appointments"
     
@@ -17,6 +37,8 @@ class AppointmentDB(Base):
     doctor_id = Column(Integer, nullable=False, index=True)
     appointment_date = Column(Date, nullable=False, index=True)
     appointment_time = Column(Time, nullable=False)
+    duration = Column(Integer, nullable=False, default=LEGACY_DURATION)  # Minutos
+    end_time = Column(Time, nullable=False, default=default_end_time)
     appointment_type = Column(String(50), nullable=False)
     priority = Column(String(20), default="normal")
     status = Column(String(20), default="programada")
@@ -28,13 +50,38 @@ class AppointmentDB(Base):
     next_appointment_needed = Column(Boolean, default=False)
     next_appointment_notes = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    
+    # Búsqueda de conflictos: citas activas de un doctor en un día
+    __table_args__ = (
+        Index("ix_appointments_doctor_date_status", "doctor_id", "appointment_date", "status"),
+        Index("ix_appointments_date_time", "appointment_date", "appointment_time"),
+        # Primera visita de cada paciente (pacientes nuevos del reporte mensual)
+        Index("ix_appointments_patient_date", "patient_id", "appointment_date"),
+    )
 
-Base.metadata.create_all(bind=engine)
+def migrate(connection):
+    """Agregar duration/end_time e índices nuevos a bases de datos creadas con un esquema anterior"""
+    table = AppointmentDB.__table__
+    columns = {column["name"] for column in inspect(connection).get_columns("appointments")}
+    if "end_time" not in columns:
+        connection.exec_driver_sql(f"ALTER TABLE appointments ADD COLUMN duration INTEGER DEFAULT {LEGACY_DURATION}")
+        connection.exec_driver_sql("ALTER TABLE appointments ADD COLUMN end_time TIME")
+        
+        rows = connection.execute(table.select().with_only_columns(table.c.id, table.c.appointment_time)).all()
+        if rows:
+            connection.execute(
+                table.update().where(table.c.id == bindparam("row_id")).values(
+                    duration=LEGACY_DURATION, end_time=bindparam("row_end_time")
+                ),
+                [{"row_id": row.id, "row_end_time": calculate_end_time(row.appointment_time, LEGACY_DURATION)} for row in rows]
+            )
+    
+    # create_all no agrega índices nuevos a tablas existentes
+    for index in table.indexes:
+        index.create(bind=connection, checkfirst=True)
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
\ No newline at end of file
+async def init_db():
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+        await connection.run_sync(migrate)
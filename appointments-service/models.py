@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime, date, time
 
 class AppointmentBase(BaseModel):
@@ -15,6 +15,21 @@ class AppointmentBase(BaseModel):
 class AppointmentCreate(AppointmentBase):
     pass
 
+class AppointmentSlot(BaseModel):
+    appointment_date: date = Field(..., description="Fecha de la cita")
+    appointment_time: time = Field(..., description="Hora de la cita")
+
+class AppointmentBatchCreate(BaseModel):
+    patient_id: int = Field(..., description="ID del paciente")
+    doctor_id: int = Field(..., description="ID del doctor")
+    appointment_type: str = Field(..., description="consulta, control, emergencia, etc.")
+    priority: str = Field("normal", description="baja, normal, alta, urgente")
+    reason: str = Field(..., min_length=10, max_length=500, description="Motivo de la consulta")
+    notes: Optional[str] = Field(None, max_length=1000, description="Notas adicionales")
+    slots: List[AppointmentSlot] = Field(..., min_length=1, max_length=100, description="Fechas y horas a reservar")
+    mode: str = Field("all_or_nothing", pattern="^(all_or_nothing|best_effort)$",
+                      description="all_or_nothing: nada se guarda si un turno falla; best_effort: se guardan los válidos")
+
 class AppointmentUpdate(BaseModel):
     appointment_date: Optional[date] = None
     appointment_time: Optional[time] = None
@@ -33,6 +48,8 @@ class AppointmentComplete(BaseModel):
 class Appointment(AppointmentBase):
     id: int
     status: str
+    duration: int = 30
+    end_time: Optional[time] = None
     total_cost: float
     diagnosis: Optional[str] = None
     treatment: Optional[str] = None
@@ -47,4 +64,15 @@ class Appointment(AppointmentBase):
     doctor_specialty: Optional[str] = None
     
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class AppointmentBatchError(BaseModel):
+    index: int
+    appointment_date: date
+    appointment_time: time
+    detail: str
+
+class AppointmentBatchResult(BaseModel):
+    mode: str
+    created: List[Appointment]
+    errors: List[AppointmentBatchError]
@@ -0,0 +1,66 @@
+import base64
+import json
+from datetime import date, datetime, time
+from typing import Any, Dict, List, Optional, Sequence
+
+from fastapi import HTTPException, Response
+from sqlalchemy import tuple_
+from sqlalchemy.sql import Select
+
+# Header con el cursor de la página siguiente (la respuesta sigue siendo una lista)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def _dump(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, (date, datetime, time)) else value
+
+def _load(value: Any, column) -> Any:
+    if value is None:
+        return None
+    python_type = column.type.python_type
+    if python_type in (date, datetime, time):
+        return python_type.fromisoformat(value)
+    return python_type(value)
+
+def encode_cursor(sort_by: str, descending: bool, values: Sequence[Any]) -> str:
+    payload = json.dumps({"s": sort_by, "d": descending, "v": [_dump(value) for value in values]}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, sort_by: str, descending: bool, columns: List) -> List[Any]:
+    """Valores de la última fila vista; el cursor solo vale para el mismo orden y sentido"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if payload["s"] != sort_by or payload["d"] is not descending or len(payload["v"]) != len(columns):
+            raise ValueError
+        return [_load(value, column) for value, column in zip(payload["v"], columns)]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido para este orden")
+
+def sort_columns(sort_options: Dict[str, List], sort_by: str) -> List:
+    if sort_by not in sort_options:
+        raise HTTPException(status_code=400, detail=f"sort_by debe ser uno de: {', '.join(sort_options)}")
+    return sort_options[sort_by]
+
+def paginate(query: Select, columns: List, sort_by: str, limit: int, skip: int = 0,
+             cursor: Optional[str] = None, descending: bool = False) -> Select:
+    """Ordenar por (clave, id) y continuar desde el cursor con un WHERE sobre el índice en vez de OFFSET"""
+    if cursor:
+        after = tuple_(*columns)
+        values = tuple_(*decode_cursor(cursor, sort_by, descending, columns))
+        query = query.where(after < values if descending else after > values)
+    elif skip:
+        query = query.offset(skip)
+
+    order = [column.desc() if descending else column.asc() for column in columns]
+    # Una fila extra indica si hay página siguiente
+    return query.order_by(*order).limit(limit + 1)
+
+def page_rows(rows: Sequence, columns: List, sort_by: str, limit: int, response: Response,
+              descending: bool = False) -> Sequence:
+    """Recortar la fila extra y publicar el cursor de la página siguiente"""
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(
+            sort_by, descending, [getattr(last, column.key) for column in columns]
+        )
+    return rows
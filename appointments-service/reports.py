@@ -0,0 +1,178 @@
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+from typing import Dict, List, Tuple
+from datetime import date
+from database import AppointmentDB
+
+# Estados que cuentan como cita pendiente de atender
+PENDING_STATUSES = ["programada", "confirmada"]
+NO_SHOW_STATUS = "no_asistio"
+CANCELLED_STATUS = "cancelada"
+COMPLETED_STATUS = "completada"
+
+# Máximo de meses por reporte
+MAX_REPORT_MONTHS = 36
+
+# Resultados de meses ya terminados. Pueden cambiar si se completa, cancela o modifica una cita
+# pasada (una pendiente vencida cuenta como inasistencia), por eso se invalidan con invalidate_from
+_finished_months: Dict[Tuple[int, int], dict] = {}
+
+def invalidate_from(day: date):
+    """Descartar los meses en cache desde el de day: cambia ese mes y, por la primera
+    visita de un paciente, también los pacientes nuevos de los meses siguientes"""
+    for key in [key for key in _finished_months if key >= (day.year, day.month)]:
+        del _finished_months[key]
+
+def month_start(year: int, month: int) -> date:
+    return date(year, month, 1)
+
+def next_month(year: int, month: int) -> Tuple[int, int]:
+    return (year + 1, 1) if month == 12 else (year, month + 1)
+
+def months_between(start: Tuple[int, int], end: Tuple[int, int]) -> List[Tuple[int, int]]:
+    months = []
+    current = start
+    while current <= end:
+        months.append(current)
+        current = next_month(*current)
+    return months
+
+async def compute_month(db: AsyncSession, year: int, month: int) -> dict:
+    """Agregar en SQL las citas de un mes (usa el índice de appointment_date)"""
+    first_day = month_start(year, month)
+    next_first_day = month_start(*next_month(year, month))
+    today = date.today()
+    in_month = [AppointmentDB.appointment_date >= first_day, AppointmentDB.appointment_date < next_first_day]
+
+    rows = (await db.execute(
+        select(
+            AppointmentDB.doctor_id,
+            AppointmentDB.status,
+            func.count(AppointmentDB.id),
+            func.coalesce(func.sum(AppointmentDB.total_cost), 0.0)
+        ).where(*in_month).group_by(AppointmentDB.doctor_id, AppointmentDB.status)
+    )).all()
+
+    result = {
+        "month": f"{year:04d}-{month:02d}",
+        "total": 0,
+        "by_status": {},
+        "revenue": 0.0,
+        "expected_revenue": 0.0,
+        "no_shows": 0,
+        "cancelled": 0,
+        "new_patients": 0,
+        "by_doctor": {}
+    }
+    for doctor_id, status, count, cost in rows:
+        doctor = result["by_doctor"].setdefault(doctor_id, {"total": 0, "by_status": {}, "revenue": 0.0})
+        doctor["total"] += count
+        doctor["by_status"][status] = doctor["by_status"].get(status, 0) + count
+        result["total"] += count
+        result["by_status"][status] = result["by_status"].get(status, 0) + count
+
+        if status == COMPLETED_STATUS:
+            doctor["revenue"] += cost
+            result["revenue"] += cost
+        if status == CANCELLED_STATUS:
+            result["cancelled"] += count
+        else:
+            result["expected_revenue"] += cost
+        if status == NO_SHOW_STATUS:
+            result["no_shows"] += count
+
+    # Una cita pendiente cuya fecha ya pasó también cuenta como inasistencia
+    result["no_shows"] += await db.scalar(select(func.count(AppointmentDB.id)).where(
+        *in_month,
+        AppointmentDB.appointment_date < today,
+        AppointmentDB.status.in_(PENDING_STATUSES)
+    ))
+
+    # Pacientes nuevos: tienen una cita no cancelada en el mes y ninguna anterior.
+    # Ambas consultas usan el índice (patient_id, appointment_date)
+    earlier = aliased(AppointmentDB)
+    result["new_patients"] = await db.scalar(select(func.count(func.distinct(AppointmentDB.patient_id))).where(
+        *in_month,
+        AppointmentDB.status != CANCELLED_STATUS,
+        ~select(earlier.id).where(
+            earlier.patient_id == AppointmentDB.patient_id,
+            earlier.appointment_date < first_day,
+            earlier.status != CANCELLED_STATUS
+        ).exists()
+    ))
+
+    return result
+
+async def get_month(db: AsyncSession, year: int, month: int, refresh: bool = False) -> dict:
+    """Mes desde el cache si ya terminó, calculado en otro caso"""
+    today = date.today()
+    finished = (year, month) < (today.year, today.month)
+    key = (year, month)
+
+    if finished and not refresh and key in _finished_months:
+        return _finished_months[key]
+
+    result = await compute_month(db, year, month)
+    if finished:
+        _finished_months[key] = result
+    return result
+
+def rate(part: int, total: int) -> float:
+    return round(part / total, 4) if total else 0.0
+
+def summarize(months: List[dict], doctors: Dict[int, dict]) -> dict:
+    """Combinar los meses y agrupar por doctor y especialidad"""
+    summary = {"total": 0, "by_status": {}, "revenue": 0.0, "expected_revenue": 0.0, "no_shows": 0, "cancelled": 0, "new_patients": 0}
+    by_doctor: Dict[int, dict] = {}
+
+    for month in months:
+        for field in ("total", "revenue", "expected_revenue", "no_shows", "cancelled", "new_patients"):
+            summary[field] += month[field]
+        for status, count in month["by_status"].items():
+            summary["by_status"][status] = summary["by_status"].get(status, 0) + count
+        for doctor_id, stats in month["by_doctor"].items():
+            doctor = by_doctor.setdefault(doctor_id, {"total": 0, "by_status": {}, "revenue": 0.0})
+            doctor["total"] += stats["total"]
+            doctor["revenue"] += stats["revenue"]
+            for status, count in stats["by_status"].items():
+                doctor["by_status"][status] = doctor["by_status"].get(status, 0) + count
+
+    summary["no_show_rate"] = rate(summary["no_shows"], summary["total"])
+    summary["cancel_rate"] = rate(summary["cancelled"], summary["total"])
+
+    doctors_report = []
+    by_specialty: Dict[str, dict] = {}
+    for doctor_id, stats in sorted(by_doctor.items(), key=lambda item: -item[1]["total"]):
+        doctor_info = doctors.get(doctor_id, {})
+        specialty = doctor_info.get("specialty", "desconocida")
+        doctors_report.append({
+            "doctor_id": doctor_id,
+            "doctor_name": doctor_info.get("full_name"),
+            "specialty": specialty,
+            **stats
+        })
+
+        group = by_specialty.setdefault(specialty, {"total": 0, "by_status": {}, "revenue": 0.0})
+        group["total"] += stats["total"]
+        group["revenue"] += stats["revenue"]
+        for status, count in stats["by_status"].items():
+            group["by_status"][status] = group["by_status"].get(status, 0) + count
+
+    return {
+        "summary": summary,
+        "months": [
+            {
+                "month": month["month"],
+                "total": month["total"],
+                "by_status": month["by_status"],
+                "revenue": month["revenue"],
+                "no_show_rate": rate(month["no_shows"], month["total"]),
+                "cancel_rate": rate(month["cancelled"], month["total"]),
+                "new_patients": month["new_patients"]
+            }
+            for month in months
+        ],
+        "by_doctor": doctors_report,
+        "by_specialty": by_specialty
+    }
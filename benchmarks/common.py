@@ -0,0 +1,75 @@
+"""Rutas, puertos y utilidades compartidas por los scripts de benchmark"""
+import json
+import math
+import os
+import subprocess
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_DATA_DIR = Path(__file__).resolve().parent / "data"
+MANIFEST_NAME = "manifest.json"
+
+# Servicio -> (directorio, puerto, archivo de base de datos)
+SERVICES = {
+    "patients": ("patients-service", 8081, "patients.db"),
+    "doctors": ("doctors-service", 8082, "doctors.db"),
+    "appointments": ("appointments-service", 8083, "appointments.db"),
+}
+GATEWAY = ("api-gateway", 8080)
+
+WEEKDAYS = ["lunes", "martes", "miercoles", "jueves", "viernes", "sabado", "domingo"]
+
+def database_path(data_dir: Path, service: str) -> Path:
+    return Path(data_dir).resolve() / SERVICES[service][2]
+
+def database_url(data_dir: Path, service: str) -> str:
+    return f"sqlite:///{database_path(data_dir, service)}"
+
+def service_url(service: str, host: str = "localhost") -> str:
+    port = GATEWAY[1] if service == "gateway" else SERVICES[service][1]
+    return f"http://{host}:{port}"
+
+def load_manifest(data_dir: Path) -> dict:
+    path = Path(data_dir) / MANIFEST_NAME
+    if not path.exists():
+        raise SystemExit(f"No existe {path}: ejecutar primero benchmarks/seed.py")
+    with open(path, encoding="utf-8") as manifest_file:
+        return json.load(manifest_file)
+
+def percentile(sorted_values: Sequence[float], fraction: float) -> float:
+    """Percentil con interpolación lineal sobre valores ya ordenados"""
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * fraction
+    lower = math.floor(position)
+    upper = math.ceil(position)
+    if lower == upper:
+        return sorted_values[lower]
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+def summarize(latencies: List[float], elapsed: float, statuses: Dict[str, int]) -> dict:
+    """p50/p95/p99 en milisegundos, RPS y códigos de estado de una ruta"""
+    values = sorted(latencies)
+    count = len(values)
+    errors = sum(total for status, total in statuses.items() if not status.isdigit() or int(status) >= 500)
+    return {
+        "count": count,
+        "rps": round(count / elapsed, 2) if elapsed else 0.0,
+        "errors": errors,
+        "error_rate": round(errors / count, 4) if count else 0.0,
+        "p50_ms": round(percentile(values, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(values, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(values, 0.99) * 1000, 3),
+        "mean_ms": round(sum(values) / count * 1000, 3) if count else 0.0,
+        "max_ms": round(values[-1] * 1000, 3) if values else 0.0,
+        "statuses": dict(sorted(statuses.items()))
+    }
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return os.getenv("GIT_COMMIT", "desconocido")
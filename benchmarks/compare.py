@@ -0,0 +1,95 @@
+"""Comparar dos resultados de loadtest.py y marcar regresiones por ruta.
+
+    python benchmarks/compare.py benchmarks/results/baseline.json resultados-nuevos.json --threshold 10
+
+Termina con código 1 si alguna ruta empeora más que el umbral, para usarlo en CI.
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+# Métricas comparadas: (nombre, True si un valor mayor es peor)
+METRICS = [("p50_ms", True), ("p95_ms", True), ("p99_ms", True), ("rps", False), ("error_rate", True)]
+
+def load(path: Path) -> dict:
+    with open(path, encoding="utf-8") as result_file:
+        return json.load(result_file)
+
+def change(before: float, after: float) -> float:
+    """Cambio porcentual; infinito si antes era 0 y ahora no"""
+    if before == 0:
+        return 0.0 if after == 0 else float("inf")
+    return (after - before) / before * 100
+
+def compare(baseline: dict, current: dict, threshold: float, min_count: int, max_error_increase: float = 1.0) -> dict:
+    """Diferencias por destino y ruta; una métrica es regresión si empeora más que threshold %"""
+    diff = {"baseline": baseline["meta"], "current": current["meta"], "threshold_pct": threshold, "targets": {}, "regressions": []}
+    for target, current_target in current["targets"].items():
+        baseline_target = baseline["targets"].get(target)
+        if baseline_target is None:
+            continue
+        routes = {"total": (baseline_target["total"], current_target["total"])}
+        routes.update({
+            label: (baseline_target["routes"][label], stats)
+            for label, stats in current_target["routes"].items() if label in baseline_target["routes"]
+        })
+        target_diff = {}
+        for label, (before, after) in routes.items():
+            route_diff = {}
+            # Con pocas muestras los percentiles altos son ruido
+            comparable = before["count"] >= min_count and after["count"] >= min_count
+            for metric, higher_is_worse in METRICS:
+                if metric == "error_rate":
+                    # La tasa de errores se compara en puntos porcentuales, no en cambio relativo
+                    delta = (after[metric] - before[metric]) * 100
+                    worse = delta > max_error_increase
+                else:
+                    delta = change(before[metric], after[metric])
+                    worse = delta > threshold if higher_is_worse else delta < -threshold
+                route_diff[metric] = {"before": before[metric], "after": after[metric], "change_pct": round(delta, 2)}
+                if worse and comparable:
+                    route_diff[metric]["regression"] = True
+                    diff["regressions"].append({"target": target, "route": label, "metric": metric, **route_diff[metric]})
+            target_diff[label] = route_diff
+        diff["targets"][target] = target_diff
+    return diff
+
+def print_table(diff: dict):
+    for target, routes in diff["targets"].items():
+        print(f"\n{target}  ({diff['baseline'].get('revision')} -> {diff['current'].get('revision')})")
+        print(f"  {'ruta':<45} {'p50 ms':>18} {'p95 ms':>18} {'p99 ms':>18} {'rps':>18}")
+        for label, metrics in routes.items():
+            cells = []
+            for metric in ("p50_ms", "p95_ms", "p99_ms", "rps"):
+                item = metrics[metric]
+                mark = " !" if item.get("regression") else "  "
+                cells.append(f"{item['after']:>9} {item['change_pct']:>+6.1f}%{mark}")
+            print(f"  {label:<45} " + " ".join(cells))
+    if diff["regressions"]:
+        print(f"\n{len(diff['regressions'])} regresiones por encima de {diff['threshold_pct']}%:")
+        for item in diff["regressions"]:
+            print(f"  {item['target']} {item['route']} {item['metric']}: {item['before']} -> {item['after']} ({item['change_pct']:+.1f}%)")
+    else:
+        print(f"\nSin regresiones por encima de {diff['threshold_pct']}%")
+
+def main():
+    parser = argparse.ArgumentParser(description="Comparar dos resultados de loadtest.py")
+    parser.add_argument("baseline", type=Path)
+    parser.add_argument("current", type=Path)
+    parser.add_argument("--threshold", type=float, default=10.0, help="Empeoramiento permitido en porcentaje")
+    parser.add_argument("--min-count", type=int, default=100, help="Peticiones mínimas para comparar una ruta")
+    parser.add_argument("--max-error-increase", type=float, default=1.0,
+                        help="Aumento permitido de la tasa de errores, en puntos porcentuales")
+    parser.add_argument("--json", action="store_true", help="Imprimir la comparación como JSON")
+    args = parser.parse_args()
+
+    diff = compare(load(args.baseline), load(args.current), args.threshold, args.min_count, args.max_error_increase)
+    if args.json:
+        print(json.dumps(diff, indent=2, ensure_ascii=False, default=str))
+    else:
+        print_table(diff)
+    sys.exit(1 if diff["regressions"] else 0)
+
+if __name__ == "__main__":
+    main()
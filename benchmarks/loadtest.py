@@ -0,0 +1,256 @@
+"""Prueba de carga con una mezcla configurable de operaciones contra el gateway o los servicios directamente.
+
+Genera un JSON con p50/p95/p99 y RPS por ruta, para guardarlo como línea base y compararlo con compare.py.
+
+    python benchmarks/loadtest.py --start-services --target gateway --concurrency 32 --duration 60 \\
+        --mix list=35,get=35,search=15,book=10,dashboard=5 --output benchmarks/results/baseline.json
+"""
+import argparse
+import asyncio
+import json
+import platform
+import random
+import sys
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from common import DEFAULT_DATA_DIR, SERVICES, WEEKDAYS, git_revision, load_manifest, service_url, summarize
+
+OPERATIONS = ("list", "get", "search", "book", "dashboard")
+DEFAULT_MIX = "list=35,get=35,search=15,book=10,dashboard=5"
+
+# (servicio, método, plantilla de la ruta, generador de (ruta, cuerpo))
+Request = Tuple[str, str, str, Callable[["Workload"], Tuple[str, Optional[dict]]]]
+
+def parse_mix(raw: str) -> Dict[str, float]:
+    """Convierte "list=35,get=35" en pesos por operación"""
+    mix = {}
+    for item in raw.split(","):
+        if not item.strip():
+            continue
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise SystemExit(f"Operación desconocida en --mix: {name} (opciones: {', '.join(OPERATIONS)})")
+        mix[name] = float(weight or 1)
+    if not mix or sum(mix.values()) <= 0:
+        raise SystemExit("--mix no tiene operaciones con peso positivo")
+    return mix
+
+class Workload:
+    """Genera las peticiones de cada operación a partir del manifiesto de seed.py"""
+
+    def __init__(self, manifest: dict, rng: random.Random):
+        self.manifest = manifest
+        self.rng = rng
+        self.today = date.today()
+
+    def patient_id(self) -> int:
+        return self.rng.randint(1, self.manifest["patients"])
+
+    def doctor_id(self) -> int:
+        return self.rng.randint(1, self.manifest["doctors"])
+
+    def appointment_id(self) -> int:
+        return self.rng.randint(1, self.manifest["appointments"])
+
+    def search_term(self) -> str:
+        return self.rng.choice(self.manifest["search_terms"])
+
+    def booking(self) -> dict:
+        """Cita futura dentro del horario del doctor; puede chocar con otra y recibir 400, como en producción"""
+        doctor_id = self.doctor_id()
+        working_days, start, end, duration = self.manifest["doctor_schedules"][doctor_id - 1]
+        while True:
+            day = self.today + timedelta(days=self.rng.randint(1, self.manifest["days_ahead"]))
+            if WEEKDAYS[day.weekday()] in working_days:
+                break
+        start_minutes = int(start[:2]) * 60 + int(start[3:5])
+        end_minutes = int(end[:2]) * 60 + int(end[3:5])
+        slot = start_minutes + self.rng.randrange((end_minutes - start_minutes) // duration) * duration
+        return {
+            "patient_id": self.patient_id(),
+            "doctor_id": doctor_id,
+            "appointment_date": day.isoformat(),
+            "appointment_time": f"{slot // 60:02d}:{slot % 60:02d}:00",
+            "appointment_type": "consulta",
+            "reason": "Consulta de prueba de carga"
+        }
+
+REQUESTS: Dict[str, List[Request]] = {
+    "list": [
+        ("patients", "GET", "/patients", lambda w: ("/patients?limit=50", None)),
+        ("doctors", "GET", "/doctors", lambda w: ("/doctors?limit=50", None)),
+        ("appointments", "GET", "/appointments", lambda w: ("/appointments?limit=50", None)),
+        ("appointments", "GET", "/appointments?status", lambda w: ("/appointments?status=programada&limit=50", None)),
+    ],
+    "get": [
+        ("patients", "GET", "/patients/{id}", lambda w: (f"/patients/{w.patient_id()}", None)),
+        ("doctors", "GET", "/doctors/{id}", lambda w: (f"/doctors/{w.doctor_id()}", None)),
+        ("appointments", "GET", "/appointments/{id}", lambda w: (f"/appointments/{w.appointment_id()}", None)),
+    ],
+    "search": [
+        ("patients", "GET", "/patients/search/{term}", lambda w: (f"/patients/search/{w.search_term()}", None)),
+        ("doctors", "GET", "/doctors/search/{term}", lambda w: (f"/doctors/search/{w.search_term()}", None)),
+        ("doctors", "GET", "/doctors/specialty/{specialty}",
+         lambda w: (f"/doctors/specialty/{w.rng.choice(w.manifest['specialties'])}", None)),
+    ],
+    "book": [
+        ("appointments", "POST", "/appointments", lambda w: ("/appointments", w.booking())),
+    ],
+    "dashboard": [
+        ("gateway", "GET", "/api/dashboard", lambda w: ("/api/dashboard", None)),
+    ],
+}
+# Sin gateway no hay dashboard: se consultan los /stats que el dashboard agrega
+DIRECT_DASHBOARD: List[Request] = [
+    (service, "GET", "/stats", lambda w: ("/stats", None)) for service in SERVICES
+]
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    def record(self, label: str, elapsed: float, status: str):
+        self.latencies[label].append(elapsed)
+        self.statuses[label][status] += 1
+
+    def report(self, elapsed: float) -> dict:
+        routes = {
+            label: summarize(self.latencies[label], elapsed, dict(self.statuses[label]))
+            for label in sorted(self.latencies)
+        }
+        all_statuses = defaultdict(int)
+        for statuses in self.statuses.values():
+            for status, count in statuses.items():
+                all_statuses[status] += count
+        total = summarize([value for values in self.latencies.values() for value in values], elapsed, dict(all_statuses))
+        return {"duration_s": round(elapsed, 2), "total": total, "routes": routes}
+
+def pick_request(target: str, operation: str, rng: random.Random) -> Request:
+    if operation == "dashboard" and target == "services":
+        return rng.choice(DIRECT_DASHBOARD)
+    return rng.choice(REQUESTS[operation])
+
+def resolve(target: str, request: Request, workload: Workload, urls: Dict[str, str]) -> Tuple[str, str, str, Optional[dict]]:
+    """(etiqueta, método, URL, cuerpo) de una petición para el destino elegido"""
+    service, method, template, build = request
+    path, body = build(workload)
+    if target == "gateway":
+        if service != "gateway":
+            path, template = "/api" + path, "/api" + template
+        return f"{method} {template}", method, urls["gateway"] + path, body
+    return f"{method} {service}:{template}", method, urls[service] + path, body
+
+async def worker(client: httpx.AsyncClient, target: str, mix: Dict[str, float], workload: Workload,
+                 urls: Dict[str, str], recorder: Recorder, measure_from: float, stop_at: float):
+    operations = list(mix)
+    weights = [mix[name] for name in operations]
+    while True:
+        now = time.perf_counter()
+        if now >= stop_at:
+            return
+        operation = workload.rng.choices(operations, weights=weights)[0]
+        label, method, url, body = resolve(target, pick_request(target, operation, workload.rng), workload, urls)
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, json=body)
+            await response.aread()
+            status = str(response.status_code)
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        finished = time.perf_counter()
+        # Las peticiones del calentamiento no cuentan
+        if started >= measure_from and finished <= stop_at:
+            recorder.record(label, finished - started, status)
+
+async def run_target(target: str, args, manifest: dict, urls: Dict[str, str]) -> dict:
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=args.timeout) as client:
+        start = time.perf_counter()
+        measure_from = start + args.warmup
+        stop_at = measure_from + args.duration
+        await asyncio.gather(*[
+            worker(client, target, args.mix, Workload(manifest, random.Random(args.seed * 1000 + index)),
+                   urls, recorder, measure_from, stop_at)
+            for index in range(args.concurrency)
+        ])
+    return recorder.report(args.duration)
+
+async def run(args, manifest: dict) -> dict:
+    urls = {"gateway": args.gateway_url, **{service: service_url(service, args.host) for service in SERVICES}}
+    results = {}
+    for target in args.targets:
+        print(f"Carga sobre {target}: {args.concurrency} clientes, {args.duration}s (+{args.warmup}s de calentamiento)",
+              file=sys.stderr)
+        results[target] = await run_target(target, args, manifest, urls)
+        total = results[target]["total"]
+        print(f"  {total['count']} peticiones, {total['rps']} rps, p50 {total['p50_ms']} ms, "
+              f"p95 {total['p95_ms']} ms, p99 {total['p99_ms']} ms, errores {total['errors']}", file=sys.stderr)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga del sistema de salud")
+    parser.add_argument("--target", default="gateway", help="gateway, services o ambos separados por coma")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f"Pesos por operación ({', '.join(OPERATIONS)}), por defecto {DEFAULT_MIX}")
+    parser.add_argument("--concurrency", type=int, default=16, help="Clientes concurrentes")
+    parser.add_argument("--duration", type=float, default=30, help="Segundos medidos por destino")
+    parser.add_argument("--warmup", type=float, default=5, help="Segundos iniciales que no se miden")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--host", default="localhost", help="Host de los servicios para --target services")
+    parser.add_argument("--gateway-url", default=service_url("gateway"))
+    parser.add_argument("--data-dir", type=Path, default=DEFAULT_DATA_DIR, help="Directorio con el manifiesto de seed.py")
+    parser.add_argument("--start-services", action="store_true", help="Levantar los servicios sobre --data-dir")
+    parser.add_argument("--workers", type=int, default=1, help="Procesos uvicorn por servicio con --start-services")
+    parser.add_argument("--label", default="", help="Nombre de la versión medida")
+    parser.add_argument("--output", type=Path, help="Archivo JSON de resultados (por defecto, salida estándar)")
+    args = parser.parse_args()
+
+    args.targets = [target.strip() for target in args.target.split(",") if target.strip()]
+    for target in args.targets:
+        if target not in ("gateway", "services"):
+            raise SystemExit(f"Destino desconocido: {target}")
+    manifest = load_manifest(args.data_dir)
+
+    if args.start_services:
+        from serve import running_services
+        with running_services(args.data_dir.resolve(), args.workers):
+            results = asyncio.run(run(args, manifest))
+    else:
+        results = asyncio.run(run(args, manifest))
+
+    report = {
+        "meta": {
+            "label": args.label,
+            "revision": git_revision(),
+            "timestamp": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "warmup_s": args.warmup,
+            "mix": args.mix,
+            "seed": args.seed,
+            "dataset": {key: manifest[key] for key in ("seed", "patients", "doctors", "appointments")}
+        },
+        "targets": results
+    }
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(output + "\n", encoding="utf-8")
+        print(f"Resultados en {args.output}", file=sys.stderr)
+    else:
+        sys.stdout.write(output + "\n")
+
+if __name__ == "__main__":
+    main()
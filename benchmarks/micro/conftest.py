@@ -0,0 +1,112 @@
+"""Fixtures de los micro-benchmarks de appointments-service.
+
+Se importa el código real del servicio sobre SQLite en memoria; patients-service y
+doctors-service se reemplazan por un transporte de httpx que responde en el mismo proceso.
+"""
+import asyncio
+import os
+import random
+import sys
+from datetime import date, time, timedelta
+from pathlib import Path
+
+import httpx
+import pytest
+
+SERVICE_DIR = Path(__file__).resolve().parents[2] / "appointments-service"
+
+# Antes de importar el servicio: la base y las URLs se leen al importar
+os.environ["DATABASE_URL"] = "sqlite:///:memory:"
+os.environ.setdefault("PATIENTS_SERVICE_URL", "http://patients-service")
+os.environ.setdefault("DOCTORS_SERVICE_URL", "http://doctors-service")
+sys.path.insert(0, str(SERVICE_DIR))
+
+import app as service  # noqa: E402
+from database import AppointmentDB, SessionLocal, calculate_end_time, init_db  # noqa: E402
+
+# Conjunto de datos: DOCTORS doctores con citas en DAYS días hábiles desde FIRST_DAY (lunes)
+DOCTORS = 20
+DAYS = 10
+PATIENTS = 5000
+FIRST_DAY = date(2030, 1, 7)
+WORKDAY_START = time(8, 0)
+WORKDAY_MINUTES = 8 * 60
+
+def working_days():
+    day = FIRST_DAY
+    while True:
+        if day.weekday() < 5:
+            yield day
+        day += timedelta(days=1)
+
+def appointment_rows(per_day: int, seed: int = 7):
+    """Agenda llena: per_day citas contiguas por doctor y día, una de cada cinco cancelada"""
+    rng = random.Random(seed)
+    duration = WORKDAY_MINUTES // per_day
+    days = [day for day, _ in zip(working_days(), range(DAYS))]
+    rows = []
+    for doctor_id in range(1, DOCTORS + 1):
+        for day in days:
+            for slot in range(per_day):
+                start = calculate_end_time(WORKDAY_START, slot * duration)
+                rows.append({
+                    "patient_id": rng.randint(1, PATIENTS),
+                    "doctor_id": doctor_id,
+                    "appointment_date": day,
+                    "appointment_time": start,
+                    "duration": duration,
+                    "end_time": calculate_end_time(start, duration),
+                    "appointment_type": "consulta",
+                    "status": "cancelada" if slot % 5 == 4 else "programada",
+                    "reason": "Control",
+                    "total_cost": 50.0
+                })
+    return rows
+
+def upstream_handler(request: httpx.Request) -> httpx.Response:
+    """Respuestas de /patients?ids= y /doctors?ids= como las de los servicios reales"""
+    resource = request.url.path.strip("/").split("/")[0]
+    ids = [int(item) for item in request.url.params.get("ids", "").split(",") if item]
+    if resource == "patients":
+        return httpx.Response(200, json=[{"id": i, "full_name": f"Paciente {i}"} for i in ids])
+    if resource == "doctors":
+        return httpx.Response(200, json=[
+            {"id": i, "full_name": f"Doctor {i}", "specialty": "Medicina General"} for i in ids
+        ])
+    return httpx.Response(404, json={"detail": "No encontrado"})
+
+@pytest.fixture(scope="session")
+def loop():
+    event_loop = asyncio.new_event_loop()
+    event_loop.run_until_complete(init_db())
+    yield event_loop
+    event_loop.run_until_complete(service.close_http_client())
+    event_loop.close()
+
+@pytest.fixture(scope="session")
+def upstream(loop):
+    """Cliente HTTP del servicio apuntando al transporte en memoria"""
+    service.http_client = httpx.AsyncClient(
+        transport=httpx.MockTransport(upstream_handler),
+        event_hooks={"request": [service.inject_trace_headers]}
+    )
+    return service.http_client
+
+@pytest.fixture(scope="session")
+def session(loop):
+    db = SessionLocal()
+    yield db
+    loop.run_until_complete(db.close())
+
+def seed(loop, db, per_day: int):
+    async def reset():
+        await db.execute(AppointmentDB.__table__.delete())
+        await db.execute(AppointmentDB.__table__.insert(), appointment_rows(per_day))
+        await db.commit()
+    loop.run_until_complete(reset())
+
+@pytest.fixture(scope="module", params=[4, 16, 48], ids=lambda per_day: f"{per_day}_por_dia")
+def appointments_per_day(request, loop, session):
+    """Base con per_day citas por doctor y día; pytest agrupa las pruebas por valor"""
+    seed(loop, session, request.param)
+    return request.param
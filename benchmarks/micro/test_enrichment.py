@@ -0,0 +1,54 @@
+"""Enriquecimiento de GET /appointments con nombres de pacientes y doctores, por tamaño de página"""
+import pytest
+from fastapi import Response
+from sqlalchemy import select
+
+import app as service
+from conftest import seed
+from database import AppointmentDB
+
+PAGE_SIZES = [10, 50, 100]
+
+@pytest.fixture(scope="module")
+def dataset(loop, session):
+    seed(loop, session, 16)
+
+def clear_caches():
+    for cache in service.LOOKUP_CACHES.values():
+        cache.clear()
+
+def list_page(loop, session, page_size: int) -> list:
+    return loop.run_until_complete(service.get_appointments(
+        response=Response(), skip=0, limit=page_size, cursor=None, sort_by="id", order="asc",
+        patient_id=None, doctor_id=None, status=None, appointment_date=None, db=session
+    ))
+
+@pytest.mark.parametrize("page_size", PAGE_SIZES)
+def test_get_appointments_cold_cache(benchmark, loop, session, upstream, dataset, page_size):
+    """Consulta, dos llamadas masivas a los servicios y enriquecimiento, sin nada en cache"""
+    result = benchmark.pedantic(
+        list_page, args=(loop, session, page_size), setup=clear_caches, rounds=200, warmup_rounds=5
+    )
+    assert len(result) == page_size and "doctor_name" in result[0]
+
+@pytest.mark.parametrize("page_size", PAGE_SIZES)
+def test_get_appointments_warm_cache(benchmark, loop, session, upstream, dataset, page_size):
+    """Caso habitual: pacientes y doctores de la página ya están en cache"""
+    list_page(loop, session, page_size)
+    result = benchmark(list_page, loop, session, page_size)
+    assert len(result) == page_size and "patient_name" in result[0]
+
+@pytest.mark.parametrize("page_size", PAGE_SIZES)
+def test_enrich_appointment_loop(benchmark, loop, session, dataset, page_size):
+    """Solo el bucle de enrich_appointment sobre una página ya leída"""
+    appointments = loop.run_until_complete(session.scalars(
+        select(AppointmentDB).order_by(AppointmentDB.id).limit(page_size)
+    )).all()
+    patients = {a.patient_id: {"id": a.patient_id, "full_name": f"Paciente {a.patient_id}"} for a in appointments}
+    doctors = {a.doctor_id: {"id": a.doctor_id, "full_name": f"Doctor {a.doctor_id}", "specialty": "Medicina General"}
+               for a in appointments}
+
+    def enrich():
+        return [service.enrich_appointment(appointment, patients, doctors) for appointment in appointments]
+
+    assert len(benchmark(enrich)) == page_size
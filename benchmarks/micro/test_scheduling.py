@@ -0,0 +1,63 @@
+"""has_scheduling_conflict e is_doctor_available con distintas cargas de agenda"""
+from datetime import time, timedelta
+
+import pytest
+from sqlalchemy import select
+
+import app as service
+from database import AppointmentDB
+from conftest import DOCTORS, FIRST_DAY
+
+DOCTOR_INFO = {
+    "working_days": ["lunes", "martes", "miercoles", "jueves", "viernes"],
+    "start_time": "08:00:00",
+    "end_time": "16:00:00"
+}
+
+# (hora, duración): choca con una cita existente / queda fuera de la agenda del día
+CONFLICT_CASES = {
+    "ocupado": (time(11, 5), 20),
+    "libre": (time(17, 0), 30),
+}
+
+@pytest.mark.parametrize("case", list(CONFLICT_CASES))
+def test_has_scheduling_conflict(benchmark, loop, session, appointments_per_day, case):
+    appointment_time, duration = CONFLICT_CASES[case]
+    doctor_id = DOCTORS // 2
+
+    def check():
+        return loop.run_until_complete(
+            service.has_scheduling_conflict(session, doctor_id, FIRST_DAY, appointment_time, duration)
+        )
+
+    assert benchmark(check) == (case == "ocupado")
+
+def test_has_scheduling_conflict_excluding_itself(benchmark, loop, session, appointments_per_day):
+    """Ruta de actualización: reprogramar una cita a su propio horario no es conflicto"""
+    appointment = loop.run_until_complete(session.scalar(
+        select(AppointmentDB).where(
+            AppointmentDB.doctor_id == 1,
+            AppointmentDB.appointment_date == FIRST_DAY,
+            AppointmentDB.status == "programada"
+        ).order_by(AppointmentDB.id).limit(1)
+    ))
+
+    def check():
+        return loop.run_until_complete(service.has_scheduling_conflict(
+            session, 1, FIRST_DAY, appointment.appointment_time, appointment.duration,
+            exclude_appointment_id=appointment.id
+        ))
+
+    assert benchmark(check) is False
+
+# (fecha, hora): disponible / día no laborable / fuera de horario
+AVAILABILITY_CASES = {
+    "disponible": (FIRST_DAY, time(10, 30)),
+    "dia_libre": (FIRST_DAY + timedelta(days=5), time(10, 30)),
+    "fuera_de_horario": (FIRST_DAY, time(18, 0)),
+}
+
+@pytest.mark.parametrize("case", list(AVAILABILITY_CASES))
+def test_is_doctor_available(benchmark, case):
+    appointment_date, appointment_time = AVAILABILITY_CASES[case]
+    assert benchmark(service.is_doctor_available, DOCTOR_INFO, appointment_date, appointment_time) == (case == "disponible")
@@ -0,0 +1,295 @@
+"""Poblar bases SQLite con volúmenes realistas para las pruebas de carga.
+
+Las tablas se crean con el init_db de cada servicio (índices, FTS y migraciones incluidos)
+y los datos se insertan directamente con sqlite3, en lotes. Los datos dependen solo de --seed.
+
+    python benchmarks/seed.py --patients 100000 --doctors 2000 --appointments 1000000
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+from common import DEFAULT_DATA_DIR, MANIFEST_NAME, ROOT, SERVICES, WEEKDAYS, database_path, database_url
+
+FIRST_NAMES = [
+    "Ana", "Carlos", "María", "José", "Lucía", "Juan", "Valentina", "Andrés", "Camila", "Luis", "Sofía", "Diego",
+    "Isabella", "Santiago", "Daniela", "Miguel", "Gabriela", "Alejandro", "Paula", "Sebastián", "Mariana", "Felipe",
+    "Laura", "Jorge", "Natalia", "Ricardo", "Carolina", "Fernando", "Juliana", "Héctor", "Ángela", "Óscar"
+]
+LAST_NAMES = [
+    "García", "Rodríguez", "Martínez", "López", "González", "Pérez", "Sánchez", "Ramírez", "Torres", "Flórez",
+    "Gómez", "Díaz", "Vargas", "Castro", "Rojas", "Moreno", "Jiménez", "Muñoz", "Ortiz", "Suárez", "Herrera",
+    "Medina", "Aguilar", "Cárdenas", "Restrepo", "Ospina", "Quintero", "Zapata", "Valencia", "Mejía", "Peña", "Ruiz"
+]
+STREETS = ["Calle", "Carrera", "Avenida", "Transversal", "Diagonal"]
+CITIES = ["Bogotá", "Medellín", "Cali", "Barranquilla", "Bucaramanga", "Pereira", "Manizales", "Cartagena"]
+GENDERS = ["femenino", "masculino", "otro"]
+BLOOD_TYPES = ["O+", "O-", "A+", "A-", "B+", "B-", "AB+", "AB-", None]
+CONDITIONS = ["Hipertensión", "Diabetes tipo 2", "Asma", "Migraña", "Hipotiroidismo", None, None, None]
+ALLERGIES = ["Penicilina", "Polen", "Mariscos", "Látex", None, None, None, None]
+SPECIALTIES = [
+    "medicina general", "cardiologia", "pediatria", "dermatologia", "ginecologia", "neurologia", "ortopedia",
+    "oftalmologia", "psiquiatria", "endocrinologia", "gastroenterologia", "urologia"
+]
+SCHEDULES = [
+    (["lunes", "martes", "miercoles", "jueves", "viernes"], "08:00", "17:00"),
+    (["lunes", "martes", "miercoles", "jueves", "viernes"], "07:00", "15:00"),
+    (["lunes", "miercoles", "viernes"], "09:00", "18:00"),
+    (["martes", "jueves", "sabado"], "08:00", "14:00"),
+    (["lunes", "martes", "miercoles", "jueves", "viernes", "sabado"], "10:00", "19:00"),
+]
+DURATIONS = [20, 30, 30, 30, 45]
+APPOINTMENT_TYPES = ["consulta", "consulta", "control", "seguimiento", "emergencia"]
+PRIORITIES = ["normal", "normal", "normal", "baja", "alta", "urgente"]
+REASONS = [
+    "Control de presión arterial", "Dolor de cabeza frecuente", "Revisión de exámenes de laboratorio",
+    "Chequeo general anual", "Dolor en la rodilla derecha", "Seguimiento de tratamiento", "Consulta por alergia",
+    "Renovación de fórmula médica"
+]
+
+BATCH_SIZE = 10000
+
+def sql_time(hour: int, minute: int) -> str:
+    # Mismo formato con el que SQLAlchemy guarda Time y DateTime en SQLite
+    return f"{hour:02d}:{minute:02d}:00.000000"
+
+def sql_datetime(value: datetime) -> str:
+    return value.strftime("%Y-%m-%d %H:%M:%S.%f")
+
+def full_name(rng: random.Random) -> str:
+    return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+def phone(rng: random.Random) -> str:
+    return f"3{rng.randint(0, 999999999):09d}"
+
+def address(rng: random.Random) -> str:
+    return f"{rng.choice(STREETS)} {rng.randint(1, 200)} #{rng.randint(1, 99)}-{rng.randint(1, 99)}, {rng.choice(CITIES)}"
+
+def create_schema(service: str, data_dir: Path):
+    """Crear las tablas con el init_db del propio servicio, en un proceso aparte"""
+    directory = ROOT / SERVICES[service][0]
+    env = {**os.environ, "DATABASE_URL": database_url(data_dir, service)}
+    subprocess.run(
+        [sys.executable, "-c", "import asyncio, database; asyncio.run(database.init_db())"],
+        cwd=directory, env=env, check=True
+    )
+
+def open_database(data_dir: Path, service: str) -> sqlite3.Connection:
+    connection = sqlite3.connect(database_path(data_dir, service))
+    connection.execute("PRAGMA journal_mode=WAL")
+    # Solo durante la carga: si se interrumpe se vuelve a generar
+    connection.execute("PRAGMA synchronous=OFF")
+    return connection
+
+def close_database(connection: sqlite3.Connection):
+    # Estadísticas del planificador con los datos cargados
+    connection.execute("ANALYZE")
+    connection.close()
+
+def insert_batches(connection: sqlite3.Connection, statement: str, rows, label: str, total: int):
+    started = time.perf_counter()
+    batch = []
+    inserted = 0
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            with connection:
+                connection.executemany(statement, batch)
+            inserted += len(batch)
+            batch = []
+            print(f"\r  {label}: {inserted}/{total}", end="", flush=True)
+    if batch:
+        with connection:
+            connection.executemany(statement, batch)
+        inserted += len(batch)
+    print(f"\r  {label}: {inserted}/{total} en {time.perf_counter() - started:.1f}s")
+
+def patient_rows(rng: random.Random, count: int, now: datetime):
+    for i in range(1, count + 1):
+        birth = date(1940, 1, 1) + timedelta(days=rng.randint(0, 365 * 80))
+        created = now - timedelta(days=rng.randint(0, 730), seconds=rng.randint(0, 86399))
+        yield (
+            full_name(rng), f"{10000000 + i}", f"paciente{i}@example.com", phone(rng), birth.isoformat(),
+            rng.choice(GENDERS), rng.choice(BLOOD_TYPES), address(rng), full_name(rng), phone(rng),
+            rng.choice(CONDITIONS), rng.choice(ALLERGIES), None,
+            sql_datetime(created), sql_datetime(created), 1 if rng.random() < 0.97 else 0
+        )
+
+def seed_patients(data_dir: Path, rng: random.Random, count: int, now: datetime):
+    connection = open_database(data_dir, "patients")
+    insert_batches(
+        connection,
+        "INSERT INTO patients (full_name, document_id, email, phone, birth_date, gender, blood_type, address, "
+        "emergency_contact_name, emergency_contact_phone, medical_history, allergies, current_medications, "
+        "created_at, updated_at, is_active) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        patient_rows(rng, count, now), "pacientes", count
+    )
+    close_database(connection)
+
+def build_doctors(rng: random.Random, count: int) -> list:
+    doctors = []
+    for i in range(1, count + 1):
+        working_days, start, end = rng.choice(SCHEDULES)
+        doctors.append({
+            "id": i,
+            "full_name": "Dr. " + full_name(rng),
+            "specialty": rng.choice(SPECIALTIES),
+            "license_number": f"LIC{i:06d}",
+            "working_days": working_days,
+            "start_time": start,
+            "end_time": end,
+            "consultation_duration": rng.choice(DURATIONS),
+            "consultation_fee": float(rng.choice([50000, 80000, 120000, 150000, 200000])),
+            "years_experience": rng.randint(1, 40),
+        })
+    return doctors
+
+def seed_doctors(data_dir: Path, rng: random.Random, doctors: list, now: datetime):
+    connection = open_database(data_dir, "doctors")
+    rows = (
+        (
+            doctor["full_name"], doctor["specialty"], doctor["license_number"], f"doctor{doctor['id']}@example.com",
+            phone(rng), address(rng), json.dumps(doctor["working_days"]),
+            sql_time(*map(int, doctor["start_time"].split(":"))), sql_time(*map(int, doctor["end_time"].split(":"))),
+            doctor["consultation_duration"], doctor["consultation_fee"], doctor["years_experience"], None,
+            1, sql_datetime(now), sql_datetime(now), 1
+        )
+        for doctor in doctors
+    )
+    insert_batches(
+        connection,
+        "INSERT INTO doctors (full_name, specialty, license_number, email, phone, office_address, working_days, "
+        "start_time, end_time, consultation_duration, consultation_fee, years_experience, biography, is_available, "
+        "created_at, updated_at, is_active) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        rows, "doctores", len(doctors)
+    )
+    close_database(connection)
+
+def appointment_rows(rng: random.Random, count: int, patients: int, doctors: list, today: date,
+                     days_back: int, days_ahead: int, now: datetime):
+    # Días hábiles de cada doctor dentro del rango y horarios ya ocupados, para no generar citas solapadas
+    first_day = today - timedelta(days=days_back)
+    days = [first_day + timedelta(days=offset) for offset in range(days_back + days_ahead)]
+    days_by_schedule = {}
+    for doctor in doctors:
+        key = tuple(doctor["working_days"])
+        if key not in days_by_schedule:
+            days_by_schedule[key] = [day for day in days if WEEKDAYS[day.weekday()] in key]
+    capacity = 0
+    for doctor in doctors:
+        start_hour, start_minute = map(int, doctor["start_time"].split(":"))
+        end_hour, end_minute = map(int, doctor["end_time"].split(":"))
+        slots = ((end_hour * 60 + end_minute) - (start_hour * 60 + start_minute)) // doctor["consultation_duration"]
+        capacity += slots * len(days_by_schedule[tuple(doctor["working_days"])])
+    if count > capacity * 0.8:
+        raise SystemExit(f"{count} citas no caben en las agendas de {len(doctors)} doctores (capacidad {capacity})")
+
+    taken = set()
+    generated = 0
+    while generated < count:
+        doctor = doctors[rng.randrange(len(doctors))]
+        day = rng.choice(days_by_schedule[tuple(doctor["working_days"])])
+        start_hour, start_minute = map(int, doctor["start_time"].split(":"))
+        end_hour, end_minute = map(int, doctor["end_time"].split(":"))
+        duration = doctor["consultation_duration"]
+        slots = ((end_hour * 60 + end_minute) - (start_hour * 60 + start_minute)) // duration
+        slot = rng.randrange(slots)
+        key = (doctor["id"], day.toordinal(), slot)
+        if key in taken:
+            continue
+        taken.add(key)
+        start = start_hour * 60 + start_minute + slot * duration
+        end = start + duration
+        if day < today:
+            status = rng.choices(["completada", "cancelada", "no_asistio"], weights=[75, 15, 10])[0]
+        else:
+            status = rng.choices(["programada", "confirmada", "cancelada"], weights=[75, 20, 5])[0]
+        created = datetime.combine(min(day, today), datetime.min.time()) - timedelta(days=rng.randint(1, 30))
+        yield (
+            rng.randint(1, patients), doctor["id"], day.isoformat(), sql_time(start // 60, start % 60), duration,
+            sql_time(end // 60, end % 60), rng.choice(APPOINTMENT_TYPES), rng.choice(PRIORITIES), status,
+            rng.choice(REASONS), doctor["consultation_fee"],
+            "Evolución favorable" if status == "completada" else None,
+            0, sql_datetime(created), sql_datetime(min(now, created + timedelta(days=rng.randint(0, 30))))
+        )
+        generated += 1
+
+def seed_appointments(data_dir: Path, rng: random.Random, count: int, patients: int, doctors: list,
+                      today: date, days_back: int, days_ahead: int, now: datetime):
+    connection = open_database(data_dir, "appointments")
+    insert_batches(
+        connection,
+        "INSERT INTO appointments (patient_id, doctor_id, appointment_date, appointment_time, duration, end_time, "
+        "appointment_type, priority, status, reason, total_cost, diagnosis, next_appointment_needed, "
+        "created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        appointment_rows(rng, count, patients, doctors, today, days_back, days_ahead, now), "citas", count
+    )
+    close_database(connection)
+
+def main():
+    parser = argparse.ArgumentParser(description="Poblar las bases SQLite de los servicios para pruebas de carga")
+    parser.add_argument("--data-dir", type=Path, default=DEFAULT_DATA_DIR, help="Directorio de las bases generadas")
+    parser.add_argument("--patients", type=int, default=100000)
+    parser.add_argument("--doctors", type=int, default=2000)
+    parser.add_argument("--appointments", type=int, default=1000000)
+    parser.add_argument("--days-back", type=int, default=365, help="Días de historial de citas")
+    parser.add_argument("--days-ahead", type=int, default=90, help="Días de citas futuras")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--force", action="store_true", help="Reemplazar bases ya generadas")
+    args = parser.parse_args()
+
+    data_dir = args.data_dir.resolve()
+    data_dir.mkdir(parents=True, exist_ok=True)
+    existing = [database_path(data_dir, service) for service in SERVICES if database_path(data_dir, service).exists()]
+    if existing and not args.force:
+        raise SystemExit(f"Ya existen bases en {data_dir}; usar --force para reemplazarlas")
+    for service in SERVICES:
+        for suffix in ("", "-wal", "-shm"):
+            Path(str(database_path(data_dir, service)) + suffix).unlink(missing_ok=True)
+
+    # Las fechas son relativas a hoy para que las citas futuras sigan siéndolo; el resto depende solo de la semilla
+    today = date.today()
+    now = datetime.combine(today, datetime.min.time())
+    rng = random.Random(args.seed)
+    doctors = build_doctors(rng, args.doctors)
+
+    print(f"Generando datos en {data_dir} (semilla {args.seed})")
+    for service in SERVICES:
+        create_schema(service, data_dir)
+    seed_patients(data_dir, random.Random(args.seed + 1), args.patients, now)
+    seed_doctors(data_dir, random.Random(args.seed + 2), doctors, now)
+    seed_appointments(
+        data_dir, random.Random(args.seed + 3), args.appointments, args.patients, doctors,
+        today, args.days_back, args.days_ahead, now
+    )
+
+    manifest = {
+        "seed": args.seed,
+        "generated_on": today.isoformat(),
+        "patients": args.patients,
+        "doctors": args.doctors,
+        "appointments": args.appointments,
+        "days_ahead": args.days_ahead,
+        "search_terms": sorted({name[:4] for name in FIRST_NAMES + LAST_NAMES}),
+        "specialties": SPECIALTIES,
+        "doctor_schedules": [
+            [doctor["working_days"], doctor["start_time"], doctor["end_time"], doctor["consultation_duration"]]
+            for doctor in doctors
+        ]
+    }
+    with open(data_dir / MANIFEST_NAME, "w", encoding="utf-8") as manifest_file:
+        json.dump(manifest, manifest_file, ensure_ascii=False)
+
+    print("Listo. Para levantar los servicios sobre estas bases: python benchmarks/serve.py")
+    for service in SERVICES:
+        print(f"  {service}: DATABASE_URL={database_url(data_dir, service)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Levantar el gateway y los tres servicios sobre las bases generadas por seed.py.
+
+    python benchmarks/serve.py --data-dir benchmarks/data
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+from common import DEFAULT_DATA_DIR, GATEWAY, ROOT, SERVICES, database_url, service_url
+
+def service_env(data_dir: Path, service: Optional[str], extra: Dict[str, str]) -> Dict[str, str]:
+    env = {
+        **os.environ,
+        "PATIENTS_SERVICE_URL": service_url("patients"),
+        "DOCTORS_SERVICE_URL": service_url("doctors"),
+        "APPOINTMENTS_SERVICE_URL": service_url("appointments"),
+        **extra
+    }
+    if service is not None:
+        env["DATABASE_URL"] = database_url(data_dir, service)
+    return env
+
+def wait_until_ready(timeout: float = 60.0):
+    """Esperar a que el gateway reporte todos los servicios listos"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{service_url('gateway')}/health/ready", timeout=2.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError("Los servicios no quedaron listos a tiempo")
+
+@contextmanager
+def running_services(data_dir: Path, workers: int = 1, extra_env: Optional[Dict[str, str]] = None):
+    """Procesos uvicorn de los cuatro componentes mientras dura el bloque"""
+    extra_env = extra_env or {}
+    # Sin cache de /health/ready, para no esperar a que expire un resultado de antes del arranque
+    extra_env.setdefault("GATEWAY_HEALTH_CACHE_SECONDS", "0")
+    components = [(directory, port, service) for service, (directory, port, _) in SERVICES.items()]
+    components.append((GATEWAY[0], GATEWAY[1], None))
+    processes: List[subprocess.Popen] = []
+    try:
+        for directory, port, service in components:
+            processes.append(subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port),
+                 "--workers", str(workers), "--log-level", "warning", "--no-access-log"],
+                cwd=ROOT / directory,
+                env=service_env(data_dir, service, extra_env)
+            ))
+        wait_until_ready()
+        yield
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+def main():
+    parser = argparse.ArgumentParser(description="Levantar los servicios sobre las bases de benchmark")
+    parser.add_argument("--data-dir", type=Path, default=DEFAULT_DATA_DIR)
+    parser.add_argument("--workers", type=int, default=1, help="Procesos uvicorn por servicio")
+    args = parser.parse_args()
+
+    with running_services(args.data_dir.resolve(), args.workers):
+        print("Servicios listos. Ctrl+C para detenerlos")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,90 @@
-from fastapi import FastAPI, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
+from fastapi import FastAPI, Depends, HTTPException, Query, BackgroundTasks, Request, Response
+from fastapi.responses import JSONResponse
+from pydantic import ValidationError
+from sqlalchemy import func, insert, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
-from database import get_db, DoctorDB
+from tracing import TracingMiddleware, exporter as trace_exporter, inject_trace_headers
+from metrics import MetricsMiddleware, metrics_response
+from database import get_db, init_db, pool_status, check_database, query_profiler, doctor_search, DoctorDB
 from models import Doctor, DoctorCreate, DoctorUpdate
+from pagination import paginate, page_rows, sort_columns
+from bulk import BulkFormatError, iter_records, iter_chunks, new_report, add_error
 from datetime import datetime
 import json
+import httpx
+import os
 
 app = FastAPI(
     title="Doctors Service", 
     description="Servicio para manejar doctores del sistema de salud",
     version="1.0.0"
 )
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TracingMiddleware)
+
+# appointments-service guarda en cache los doctores; se le avisa cuando cambian
+APPOINTMENTS_SERVICE_URL = os.getenv("APPOINTMENTS_SERVICE_URL", "http://localhost:8083")
+
+# Cliente compartido para los avisos de invalidación: reutiliza conexiones keep-alive
+http_client: Optional[httpx.AsyncClient] = None
+
+def get_http_client() -> httpx.AsyncClient:
+    global http_client
+    if http_client is None:
+        http_client = httpx.AsyncClient(timeout=2.0, event_hooks={"request": [inject_trace_headers]})
+    return http_client
+
+async def close_http_client():
+    global http_client
+    if http_client is not None:
+        await http_client.aclose()
+        http_client = None
+
+async def invalidate_appointments_cache(doctor_id: int):
+    """Avisar a appointments-service que descarte su copia del doctor"""
+    try:
+        await get_http_client().delete(f"{APPOINTMENTS_SERVICE_URL}/cache/doctors/{doctor_id}")
+    except httpx.HTTPError:
+        pass
+
+async def invalidate_appointments_cache_many(doctor_ids: List[int]):
+    """Avisar a appointments-service que descarte varios doctores (importación masiva), en bloques de MAX_BULK_IDS"""
+    client = get_http_client()
+    try:
+        for start in range(0, len(doctor_ids), MAX_BULK_IDS):
+            chunk = doctor_ids[start:start + MAX_BULK_IDS]
+            await client.delete(f"{APPOINTMENTS_SERVICE_URL}/cache/doctors", params={"ids": ",".join(str(i) for i in chunk)})
+    except httpx.HTTPError:
+        pass
+
+MAX_BULK_IDS = 500
+
+# Órdenes disponibles para paginar con cursor; el id desempata
+SORT_OPTIONS = {
+    "id": [DoctorDB.id],
+    "full_name": [DoctorDB.full_name, DoctorDB.id]
+}
+
+def parse_ids(ids: str) -> List[int]:
+    try:
+        id_list = list({int(value) for value in ids.split(",") if value.strip()})
+    except ValueError:
+        raise HTTPException(status_code=400, detail="El parámetro ids debe ser una lista de enteros separados por coma")
+    if len(id_list) > MAX_BULK_IDS:
+        raise HTTPException(status_code=400, detail=f"Máximo {MAX_BULK_IDS} IDs por consulta")
+    return id_list
+
+@app.on_event("startup")
+async def startup():
+    await init_db()
+    get_http_client()
+    trace_exporter.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await close_http_client()
+    await trace_exporter.stop()
 
 @app.get("/")
 def root():
@@ -20,15 +94,72 @@ def root():
 def health_check():
     return {"status": "healthy", "service": "doctors"}
 
+@app.get("/health/live")
+def liveness_check():
+    """Liveness: el proceso responde, sin consultar dependencias"""
+    return {"status": "alive", "service": "doctors"}
+
+@app.get("/health/ready")
+async def readiness_check():
+    """Readiness: el servicio puede atender peticiones porque su base de datos responde"""
+    database = await check_database()
+    ready = database["status"] == "ok"
+    content = {"status": "ready" if ready else "not_ready", "service": "doctors", "checks": {"database": database}}
+    return JSONResponse(status_code=200 if ready else 503, content=content)
+
+@app.get("/metrics")
+def get_metrics():
+    """Métricas en formato de texto de Prometheus"""
+    return metrics_response()
+
+@app.get("/debug/pool")
+def get_pool_status():
+    """Uso del pool de conexiones a la base de datos"""
+    return pool_status()
+
+@app.get("/debug/queries")
+def get_query_profile(
+    limit: int = Query(20, ge=1, le=500),
+    order_by: str = Query("total_ms", pattern="^(total_ms|avg_ms|max_ms|calls|rows|slow_calls)$")
+):
+    """Consultas SQL con más tiempo acumulado (requiere SQL_PROFILER_ENABLED=true)"""
+    return query_profiler.snapshot(limit, order_by)
+
+@app.delete("/debug/queries")
+def reset_query_profile():
+    """Reiniciar las estadísticas del profiler"""
+    query_profiler.reset()
+    return {"message": "Estadísticas de consultas reiniciadas"}
+
+@app.get("/stats")
+async def get_stats(db: AsyncSession = Depends(get_db)):
+    """Conteos de doctores agregados en SQL para el dashboard"""
+    rows = (await db.execute(
+        select(DoctorDB.is_active, DoctorDB.is_available, DoctorDB.specialty, func.count(DoctorDB.id)).group_by(
+            DoctorDB.is_active, DoctorDB.is_available, DoctorDB.specialty
+        )
+    )).all()
+    
+    stats = {"total": 0, "active": 0, "available": 0, "unavailable": 0, "by_specialty": {}}
+    for is_active, is_available, specialty, count in rows:
+        stats["total"] += count
+        if not is_active:
+            continue
+        stats["active"] += count
+        stats["available" if is_available else "unavailable"] += count
+        stats["by_specialty"][specialty] = stats["by_specialty"].get(specialty, 0) + count
+    
+    return stats
+
 @app.post("/doctors", response_model=Doctor)
-def create_doctor(doctor: DoctorCreate, db: Session = Depends(get_db)):
+async def create_doctor(doctor: DoctorCreate, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_db)):
     # Verificar si ya existe un doctor con el mismo número de licencia
-    existing_doctor = db.query(DoctorDB).filter(DoctorDB.license_number == doctor.license_number).first()
+    existing_doctor = await db.scalar(select(DoctorDB).where(DoctorDB.license_number == doctor.license_number))
     if existing_doctor:
         raise HTTPException(status_code=400, detail="Ya existe un doctor con ese número de licencia")
     
     # Verificar si ya existe un doctor con el mismo email
-    existing_email = db.query(DoctorDB).filter(DoctorDB.email == doctor.email).first()
+    existing_email = await db.scalar(select(DoctorDB).where(DoctorDB.email == doctor.email))
     if existing_email:
         raise HTTPException(status_code=400, detail="Ya existe un doctor con ese email")
     
@@ -43,8 +174,10 @@ def create_doctor(doctor: DoctorCreate, db: Session = Depends(get_db)):
     
     db_doctor = DoctorDB(**doctor_data)
     db.add(db_doctor)
-    db.commit()
-    db.refresh(db_doctor)
+    await db.commit()
+    await db.refresh(db_doctor)
+    # appointments-service pudo guardar un 404 de este ID antes de que existiera
+    background_tasks.add_task(invalidate_appointments_cache, db_doctor.id)
     
     # Convertir de vuelta para la respuesta
     doctor_dict = db_doctor.__dict__.copy()
@@ -52,25 +185,109 @@ def create_doctor(doctor: DoctorCreate, db: Session = Depends(get_db)):
     
     return doctor_dict
 
+async def import_doctor_chunk(db: AsyncSession, chunk: list, report: dict) -> List[int]:
+    """Validar un bloque, descartar duplicados con una sola consulta e insertarlo en una transacción.
+    Devuelve los IDs creados"""
+    report["received"] += len(chunk)
+    valid = []
+    for row, record in chunk:
+        if isinstance(record, Exception):
+            add_error(report, row, record)
+            continue
+        try:
+            doctor = DoctorCreate.model_validate(record)
+        except ValidationError as e:
+            add_error(report, row, e)
+            continue
+        if doctor.start_time >= doctor.end_time:
+            add_error(report, row, "La hora de inicio debe ser anterior a la hora de fin", "start_time")
+            continue
+        valid.append((row, doctor))
+    
+    if not valid:
+        return []
+    
+    existing = (await db.execute(select(DoctorDB.license_number, DoctorDB.email).where(or_(
+        DoctorDB.license_number.in_([doctor.license_number for _, doctor in valid]),
+        DoctorDB.email.in_([doctor.email for _, doctor in valid])
+    )))).all()
+    licenses = {license_number for license_number, _ in existing}
+    emails = {email for _, email in existing}
+    
+    accepted = []
+    for row, doctor in valid:
+        if doctor.license_number in licenses:
+            add_error(report, row, "Ya existe un doctor con ese número de licencia", "license_number")
+        elif doctor.email in emails:
+            add_error(report, row, "Ya existe un doctor con ese email", "email")
+        else:
+            # También evita duplicados dentro del mismo archivo
+            licenses.add(doctor.license_number)
+            emails.add(doctor.email)
+            doctor_data = doctor.dict()
+            doctor_data['working_days'] = json.dumps(doctor.working_days)
+            accepted.append((row, doctor_data))
+    
+    if not accepted:
+        return []
+    try:
+        created_ids = (await db.execute(insert(DoctorDB).returning(DoctorDB.id), [values for _, values in accepted])).scalars().all()
+        await db.commit()
+        report["created"] += len(accepted)
+        return list(created_ids)
+    except Exception as e:
+        await db.rollback()
+        for row, _ in accepted:
+            add_error(report, row, f"No se pudo insertar el bloque: {e}")
+        return []
+
+@app.post("/doctors/bulk")
+async def bulk_create_doctors(request: Request, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_db)):
+    """Importación masiva desde NDJSON o un arreglo JSON; los errores se reportan por fila"""
+    report = new_report()
+    created_ids = []
+    try:
+        async for chunk in iter_chunks(iter_records(request.stream())):
+            created_ids.extend(await import_doctor_chunk(db, chunk, report))
+    except BulkFormatError as e:
+        # Los bloques anteriores ya quedaron guardados
+        report["format_error"] = str(e)
+    if created_ids:
+        background_tasks.add_task(invalidate_appointments_cache_many, created_ids)
+    return report
+
 @app.get("/doctors", response_model=List[Doctor])
-def get_doctors(
+async def get_doctors(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Cursor X-Next-Cursor de la página anterior"),
+    sort_by: str = Query("id"),
+    order: str = Query("asc", pattern="^(asc|desc)$"),
     specialty: Optional[str] = Query(None),
     available_only: bool = Query(True),
     active_only: bool = Query(True),
-    db: Session = Depends(get_db)
+    ids: Optional[str] = Query(None, description="IDs separados por coma para consulta masiva"),
+    db: AsyncSession = Depends(get_db)
 ):
-    query = db.query(DoctorDB)
+    query = select(DoctorDB)
+    
+    # Consulta masiva por IDs: sin paginación ni filtros de estado
+    if ids:
+        id_list = parse_ids(ids)
+        doctors = (await db.scalars(query.where(DoctorDB.id.in_(id_list)))).all()
+        return [{**doctor.__dict__, 'working_days': json.loads(doctor.working_days)} for doctor in doctors]
     
     if active_only:
-        query = query.filter(DoctorDB.is_active == True)
+        query = query.where(DoctorDB.is_active == True)
     if available_only:
-        query = query.filter(DoctorDB.is_available == True)
+        query = query.where(DoctorDB.is_available == True)
     if specialty:
-        query = query.filter(DoctorDB.specialty.ilike(f"%{specialty}%"))
+        query = query.where(DoctorDB.specialty.ilike(f"%{specialty}%"))
     
-    doctors = query.offset(skip).limit(limit).all()
+    columns = sort_columns(SORT_OPTIONS, sort_by)
+    query = paginate(query, columns, sort_by, limit, skip=skip, cursor=cursor, descending=order == "desc")
+    doctors = page_rows((await db.scalars(query)).all(), columns, sort_by, limit, response, descending=order == "desc")
     
     doctors_with_days = []
     for doctor in doctors:
@@ -81,8 +298,8 @@ def get_doctors(
     return doctors_with_days
 
 @app.get("/doctors/{doctor_id}", response_model=Doctor)
-def get_doctor(doctor_id: int, db: Session = Depends(get_db)):
-    doctor = db.query(DoctorDB).filter(DoctorDB.id == doctor_id).first()
+async def get_doctor(doctor_id: int, db: AsyncSession = Depends(get_db)):
+    doctor = await db.scalar(select(DoctorDB).where(DoctorDB.id == doctor_id))
     if not doctor:
         raise HTTPException(status_code=404, detail="Doctor no encontrado")
     
@@ -92,8 +309,8 @@ def get_doctor(doctor_id: int, db: Session = Depends(get_db)):
     return doctor_dict
 
 @app.put("/doctors/{doctor_id}", response_model=Doctor)
-def update_doctor(doctor_id: int, doctor_update: DoctorUpdate, db: Session = Depends(get_db)):
-    db_doctor = db.query(DoctorDB).filter(DoctorDB.id == doctor_id).first()
+async def update_doctor(doctor_id: int, doctor_update: DoctorUpdate, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_db)):
+    db_doctor = await db.scalar(select(DoctorDB).where(DoctorDB.id == doctor_id))
     if not db_doctor:
         raise HTTPException(status_code=404, detail="Doctor no encontrado")
     
@@ -110,8 +327,9 @@ def update_doctor(doctor_id: int, doctor_update: DoctorUpdate, db: Session = Dep
         setattr(db_doctor, field, value)
     
     db_doctor.updated_at = datetime.utcnow()
-    db.commit()
-    db.refresh(db_doctor)
+    await db.commit()
+    background_tasks.add_task(invalidate_appointments_cache, doctor_id)
+    await db.refresh(db_doctor)
     
     doctor_dict = db_doctor.__dict__.copy()
     doctor_dict['working_days'] = json.loads(db_doctor.working_days)
@@ -119,23 +337,27 @@ def update_doctor(doctor_id: int, doctor_update: DoctorUpdate, db: Session = Dep
     return doctor_dict
 
 @app.delete("/doctors/{doctor_id}")
-def delete_doctor(doctor_id: int, db: Session = Depends(get_db)):
-    db_doctor = db.query(DoctorDB).filter(DoctorDB.id == doctor_id).first()
+async def delete_doctor(doctor_id: int, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_db)):
+    db_doctor = await db.scalar(select(DoctorDB).where(DoctorDB.id == doctor_id))
     if not db_doctor:
         raise HTTPException(status_code=404, detail="Doctor no encontrado")
     
     db_doctor.is_active = False
     db_doctor.updated_at = datetime.utcnow()
-    db.commit()
+    await db.commit()
+    background_tasks.add_task(invalidate_appointments_cache, doctor_id)
     return {"message": f"Doctor {doctor_id} desactivado correctamente"}
 
 @app.get("/doctors/search/{search_term}", response_model=List[Doctor])
-def search_doctors(search_term: str, db: Session = Depends(get_db)):
-    doctors = db.query(DoctorDB).filter(
-        (DoctorDB.full_name.ilike(f"%{search_term}%")) |
-        (DoctorDB.specialty.ilike(f"%{search_term}%")) |
-        (DoctorDB.license_number.ilike(f"%{search_term}%"))
-    ).filter(DoctorDB.is_active == True).all()
+async def search_doctors(
+    search_term: str,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_db)
+):
+    # Búsqueda por prefijo y sin acentos ("cardio" encuentra "Cardiología"), ordenada por relevancia
+    query = doctor_search.query(search_term).where(DoctorDB.is_active == True)
+    doctors = (await db.scalars(query.offset(skip).limit(limit))).all()
     
     doctors_with_days = []
     for doctor in doctors:
@@ -146,12 +368,12 @@ def search_doctors(search_term: str, db: Session = Depends(get_db)):
     return doctors_with_days
 
 @app.get("/doctors/specialty/{specialty}", response_model=List[Doctor])
-def get_doctors_by_specialty(specialty: str, db: Session = Depends(get_db)):
-    doctors = db.query(DoctorDB).filter(
+async def get_doctors_by_specialty(specialty: str, db: AsyncSession = Depends(get_db)):
+    doctors = (await db.scalars(select(DoctorDB).where(
         DoctorDB.specialty.ilike(f"%{specialty}%"),
         DoctorDB.is_active == True,
         DoctorDB.is_available == True
-    ).all()
+    ))).all()
     
     doctors_with_days = []
     for doctor in doctors:
@@ -162,21 +384,22 @@ def get_doctors_by_specialty(specialty: str, db: Session = Depends(get_db)):
     return doctors_with_days
 
 @app.patch("/doctors/{doctor_id}/availability")
-def toggle_availability(doctor_id: int, available: bool, db: Session = Depends(get_db)):
-    db_doctor = db.query(DoctorDB).filter(DoctorDB.id == doctor_id).first()
+async def toggle_availability(doctor_id: int, available: bool, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_db)):
+    db_doctor = await db.scalar(select(DoctorDB).where(DoctorDB.id == doctor_id))
     if not db_doctor:
         raise HTTPException(status_code=404, detail="Doctor no encontrado")
     
     db_doctor.is_available = available
     db_doctor.updated_at = datetime.utcnow()
-    db.commit()
+    await db.commit()
+    background_tasks.add_task(invalidate_appointments_cache, doctor_id)
     
     status = "disponible" if available else "no disponible"
     return {"message": f"Doctor {doctor_id} marcado como {status}"}
 
 @app.get("/doctors/license/{license_number}", response_model=Doctor)
-def get_doctor_by_license(license_number: str, db: Session = Depends(get_db)):
-    doctor = db.query(DoctorDB).filter(DoctorDB.license_number == license_number).first()
+async def get_doctor_by_license(license_number: str, db: AsyncSession = Depends(get_db)):
+    doctor = await db.scalar(select(DoctorDB).where(DoctorDB.license_number == license_number))
     if not doctor:
         raise HTTPException(status_code=404, detail="Doctor no encontrado")
     
@@ -1,12 +1,21 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, Text, Boolean, DateTime, Time
+from sqlalchemy import Column, Integer, String, Float, Text, Boolean, DateTime, Time
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
 from datetime import datetime
+import os
+from db_engine import Database
+from search import SearchIndex
 
-DATABASE_URL = "sqlite:///./doctors.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+# Engine, pool e instrumentación compartidos con los otros servicios (db_engine.py)
+database = Database(os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./doctors.db"))
+engine = database.engine
+DATABASE_URL = database.url
+IS_SQLITE = database.is_sqlite
+SessionLocal = database.session_factory
+query_profiler = database.profiler
+pool_status = database.pool_status
+check_database = database.check
+get_db = database.session
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 class DoctorDB(Base):
@@ -31,11 +40,10 @@ class DoctorDB(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     is_active = Column(Boolean, default=True)
 
-Base.metadata.create_all(bind=engine)
+# Búsqueda por nombre, especialidad y número de licencia; el nombre pesa más en el ranking, luego la licencia
+doctor_search = SearchIndex(DoctorDB, ["full_name", "specialty", "license_number"], [10.0, 3.0, 5.0])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
\ No newline at end of file
+async def init_db():
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+        await connection.run_sync(doctor_search.setup)
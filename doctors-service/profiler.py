@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import os
+import re
+import time
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from sqlalchemy import event
+
+logger = logging.getLogger("doctors-service.profiler")
+
+# Profiler de consultas SQL, apagado por defecto
+SQL_PROFILER_ENABLED = os.getenv("SQL_PROFILER_ENABLED", "false").lower() in ("1", "true", "yes")
+SQL_SLOW_QUERY_MS = float(os.getenv("SQL_SLOW_QUERY_MS", "100"))
+SQL_PROFILER_MAX_STATEMENTS = int(os.getenv("SQL_PROFILER_MAX_STATEMENTS", "500"))
+SQL_EXPLAIN_SLOW_QUERIES = os.getenv("SQL_EXPLAIN_SLOW_QUERIES", "true").lower() in ("1", "true", "yes")
+
+# Sentencias a las que se les puede pedir el plan sin ejecutarlas
+EXPLAINABLE = ("SELECT", "UPDATE", "DELETE", "WITH")
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"\$\d+|%\(\w+\)s|%s|(?<![:\w]):\w+")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_SPACES = re.compile(r"\s+")
+
+@lru_cache(maxsize=2048)
+def fingerprint(statement: str) -> str:
+    """Sentencia sin valores literales, para agrupar consultas que solo cambian de parámetros.
+    Las listas IN de largo variable quedan como IN (...)"""
+    normalized = _STRING.sub("?", statement)
+    normalized = _PLACEHOLDER.sub("?", normalized)
+    normalized = _NUMBER.sub("?", normalized)
+    normalized = _IN_LIST.sub("IN (...)", normalized)
+    return _SPACES.sub(" ", normalized).strip()
+
+def _row_count(cursor) -> Optional[int]:
+    # Con SELECT el rowcount de DB-API no dice nada; los adaptadores asíncronos ya
+    # traen todas las filas al ejecutar (salvo con cursor de servidor, p. ej. en exportaciones)
+    if cursor.description is None:
+        return cursor.rowcount if cursor.rowcount >= 0 else None
+    rows = getattr(cursor, "_rows", None)
+    if rows is not None and not getattr(cursor, "server_side", False):
+        return len(rows)
+    return None
+
+class QueryProfiler:
+    """Agrega duración y filas por fingerprint de sentencia y registra las consultas lentas con su plan"""
+
+    def __init__(self, slow_query_ms: float = SQL_SLOW_QUERY_MS, max_statements: int = SQL_PROFILER_MAX_STATEMENTS):
+        self.slow_query_ms = slow_query_ms
+        self.max_statements = max_statements
+        self.engine = None
+        self._stats: Dict[str, dict] = {}
+        # Fingerprint -> tarea que está pidiendo el plan (la referencia evita que se recolecte)
+        self._explaining: Dict[str, asyncio.Task] = {}
+        self.slow_queries = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.engine is not None
+
+    def attach(self, engine):
+        self.engine = engine
+        event.listen(engine.sync_engine, "before_cursor_execute", self._before_execute)
+        event.listen(engine.sync_engine, "after_cursor_execute", self._after_execute)
+        event.listen(engine.sync_engine, "handle_error", self._discard_timer)
+
+    def _before_execute(self, connection, cursor, statement, parameters, context, executemany):
+        connection.info.setdefault("profiler_started", []).append(time.perf_counter())
+
+    def _discard_timer(self, exception_context):
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("profiler_started"):
+            connection.info["profiler_started"].pop()
+
+    def _after_execute(self, connection, cursor, statement, parameters, context, executemany):
+        elapsed_ms = (time.perf_counter() - connection.info["profiler_started"].pop()) * 1000
+        if statement.lstrip()[:7].upper() == "EXPLAIN":
+            return
+        key = fingerprint(statement)
+        rows = _row_count(cursor)
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._new_entry(key)
+        stats["calls"] += 1
+        stats["total_ms"] += elapsed_ms
+        stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+        if rows is not None:
+            stats["rows"] += rows
+        stats["last_seen"] = time.time()
+
+        if elapsed_ms >= self.slow_query_ms:
+            self.slow_queries += 1
+            stats["slow_calls"] += 1
+            logger.warning("Consulta lenta (%.1f ms, %s filas): %s", elapsed_ms, rows if rows is not None else "?", key)
+            if SQL_EXPLAIN_SLOW_QUERIES and not executemany and stats["plan"] is None:
+                self._schedule_explain(key, statement, parameters)
+
+    def _new_entry(self, key: str) -> dict:
+        if len(self._stats) >= self.max_statements:
+            # Descartar la sentencia que menos tiempo acumula para dejar lugar a la nueva
+            del self._stats[min(self._stats, key=lambda item: self._stats[item]["total_ms"])]
+        stats = {"calls": 0, "total_ms": 0.0, "max_ms": 0.0, "rows": 0, "slow_calls": 0, "last_seen": 0.0, "plan": None}
+        self._stats[key] = stats
+        return stats
+
+    def _schedule_explain(self, key: str, statement: str, parameters):
+        if key in self._explaining or not statement.lstrip().upper().startswith(EXPLAINABLE):
+            return
+        # El plan se pide en otra conexión: no se puede ejecutar nada más dentro de este evento
+        try:
+            self._explaining[key] = asyncio.get_running_loop().create_task(self._explain(key, statement, parameters))
+        except RuntimeError:
+            pass
+
+    async def _explain(self, key: str, statement: str, parameters):
+        prefix = "EXPLAIN QUERY PLAN " if self.engine.dialect.name == "sqlite" else "EXPLAIN "
+        try:
+            async with self.engine.connect() as connection:
+                result = await connection.exec_driver_sql(prefix + statement, parameters)
+                rows = result.all()
+        except Exception as e:
+            logger.warning("No se pudo obtener el plan de %s: %s", key, e)
+            return
+        finally:
+            self._explaining.pop(key, None)
+
+        # SQLite devuelve (id, parent, notused, detail); PostgreSQL una línea de texto por fila
+        plan = [str(row[-1]) for row in rows]
+        if key in self._stats:
+            self._stats[key]["plan"] = plan
+        logger.warning("Plan de la consulta lenta %s:\n  %s", key, "\n  ".join(plan))
+
+    def top(self, limit: int = 20, order_by: str = "total_ms") -> List[dict]:
+        entries = [
+            {
+                "statement": key,
+                **stats,
+                "total_ms": round(stats["total_ms"], 3),
+                "max_ms": round(stats["max_ms"], 3),
+                "avg_ms": round(stats["total_ms"] / stats["calls"], 3) if stats["calls"] else 0.0
+            }
+            for key, stats in self._stats.items()
+        ]
+        entries.sort(key=lambda entry: entry[order_by], reverse=True)
+        return entries[:limit]
+
+    def reset(self):
+        self._stats.clear()
+        self.slow_queries = 0
+
+    def snapshot(self, limit: int = 20, order_by: str = "total_ms") -> dict:
+        return {
+            "enabled": self.enabled,
+            "slow_query_ms": self.slow_query_ms,
+            "statements": len(self._stats),
+            "slow_queries": self.slow_queries,
+            "queries": self.top(limit, order_by)
+        }
@@ -1,20 +1,95 @@
-from fastapi import FastAPI, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
+from fastapi import FastAPI, Depends, HTTPException, Query, BackgroundTasks, Request, Response
+from fastapi.responses import JSONResponse
+from pydantic import ValidationError
+from sqlalchemy import func, insert, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
-from database import get_db, PatientDB
+from tracing import TracingMiddleware, exporter as trace_exporter, inject_trace_headers
+from metrics import MetricsMiddleware, metrics_response
+from database import get_db, init_db, pool_status, check_database, query_profiler, patient_search, PatientDB
 from models import Patient, PatientCreate, PatientUpdate
-from datetime import datetime, date
+from pagination import paginate, page_rows, sort_columns
+from bulk import BulkFormatError, iter_records, iter_chunks, new_report, add_error
+from export import export_response
+from datetime import datetime, date, time, timedelta
+import httpx
+import os
 
 app = FastAPI(
     title="Patients Service", 
     description="Servicio para manejar pacientes del sistema de salud",
     version="1.0.0"
 )
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TracingMiddleware)
 
 def calculate_age(birth_date: date) -> int:
     today = date.today()
     return today.year - birth_date.year - ((today.month, today.day) < (birth_date.month, birth_date.day))
 
+# appointments-service guarda en cache los pacientes; se le avisa cuando cambian
+APPOINTMENTS_SERVICE_URL = os.getenv("APPOINTMENTS_SERVICE_URL", "http://localhost:8083")
+
+# Cliente compartido para los avisos de invalidación: reutiliza conexiones keep-alive
+http_client: Optional[httpx.AsyncClient] = None
+
+def get_http_client() -> httpx.AsyncClient:
+    global http_client
+    if http_client is None:
+        http_client = httpx.AsyncClient(timeout=2.0, event_hooks={"request": [inject_trace_headers]})
+    return http_client
+
+async def close_http_client():
+    global http_client
+    if http_client is not None:
+        await http_client.aclose()
+        http_client = None
+
+async def invalidate_appointments_cache(patient_id: int):
+    """Avisar a appointments-service que descarte su copia del paciente"""
+    try:
+        await get_http_client().delete(f"{APPOINTMENTS_SERVICE_URL}/cache/patients/{patient_id}")
+    except httpx.HTTPError:
+        pass
+
+async def invalidate_appointments_cache_many(patient_ids: List[int]):
+    """Avisar a appointments-service que descarte varios pacientes (importación masiva), en bloques de MAX_BULK_IDS"""
+    client = get_http_client()
+    try:
+        for start in range(0, len(patient_ids), MAX_BULK_IDS):
+            chunk = patient_ids[start:start + MAX_BULK_IDS]
+            await client.delete(f"{APPOINTMENTS_SERVICE_URL}/cache/patients", params={"ids": ",".join(str(i) for i in chunk)})
+    except httpx.HTTPError:
+        pass
+
+MAX_BULK_IDS = 500
+
+# Órdenes disponibles para paginar con cursor; el id desempata
+SORT_OPTIONS = {
+    "id": [PatientDB.id],
+    "full_name": [PatientDB.full_name, PatientDB.id]
+}
+
+def parse_ids(ids: str) -> List[int]:
+    try:
+        id_list = list({int(value) for value in ids.split(",") if value.strip()})
+    except ValueError:
+        raise HTTPException(status_code=400, detail="El parámetro ids debe ser una lista de enteros separados por coma")
+    if len(id_list) > MAX_BULK_IDS:
+        raise HTTPException(status_code=400, detail=f"Máximo {MAX_BULK_IDS} IDs por consulta")
+    return id_list
+
+@app.on_event("startup")
+async def startup():
+    await init_db()
+    get_http_client()
+    trace_exporter.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await close_http_client()
+    await trace_exporter.stop()
+
 @app.get("/")
 def root():
     return {"message": "Patients Service funcionando correctamente! 🏥"}
@@ -23,15 +98,70 @@ def root():
 def health_check():
     return {"status": "healthy", "service": "patients"}
 
+@app.get("/health/live")
+def liveness_check():
+    """Liveness: el proceso responde, sin consultar dependencias"""
+    return {"status": "alive", "service": "patients"}
+
+@app.get("/health/ready")
+async def readiness_check():
+    """Readiness: el servicio puede atender peticiones porque su base de datos responde"""
+    database = await check_database()
+    ready = database["status"] == "ok"
+    content = {"status": "ready" if ready else "not_ready", "service": "patients", "checks": {"database": database}}
+    return JSONResponse(status_code=200 if ready else 503, content=content)
+
+@app.get("/metrics")
+def get_metrics():
+    """Métricas en formato de texto de Prometheus"""
+    return metrics_response()
+
+@app.get("/debug/pool")
+def get_pool_status():
+    """Uso del pool de conexiones a la base de datos"""
+    return pool_status()
+
+@app.get("/debug/queries")
+def get_query_profile(
+    limit: int = Query(20, ge=1, le=500),
+    order_by: str = Query("total_ms", pattern="^(total_ms|avg_ms|max_ms|calls|rows|slow_calls)$")
+):
+    """Consultas SQL con más tiempo acumulado (requiere SQL_PROFILER_ENABLED=true)"""
+    return query_profiler.snapshot(limit, order_by)
+
+@app.delete("/debug/queries")
+def reset_query_profile():
+    """Reiniciar las estadísticas del profiler"""
+    query_profiler.reset()
+    return {"message": "Estadísticas de consultas reiniciadas"}
+
+@app.get("/stats")
+async def get_stats(db: AsyncSession = Depends(get_db)):
+    """Conteos de pacientes agregados en SQL para el dashboard"""
+    rows = (await db.execute(
+        select(PatientDB.is_active, PatientDB.gender, func.count(PatientDB.id)).group_by(PatientDB.is_active, PatientDB.gender)
+    )).all()
+    
+    stats = {"total": 0, "active": 0, "inactive": 0, "by_gender": {}}
+    for is_active, gender, count in rows:
+        stats["total"] += count
+        if is_active:
+            stats["active"] += count
+            stats["by_gender"][gender] = stats["by_gender"].get(gender, 0) + count
+        else:
+            stats["inactive"] += count
+    
+    return stats
+
 @app.post("/patients", response_model=Patient)
-def create_patient(patient: PatientCreate, db: Session = Depends(get_db)):
+async def create_patient(patient: PatientCreate, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_db)):
     # Verificar si ya existe un paciente con el mismo documento
-    existing_patient = db.query(PatientDB).filter(PatientDB.document_id == patient.document_id).first()
+    existing_patient = await db.scalar(select(PatientDB).where(PatientDB.document_id == patient.document_id))
     if existing_patient:
         raise HTTPException(status_code=400, detail="Ya existe un paciente con ese número de documento")
     
     # Verificar si ya existe un paciente con el mismo email
-    existing_email = db.query(PatientDB).filter(PatientDB.email == patient.email).first()
+    existing_email = await db.scalar(select(PatientDB).where(PatientDB.email == patient.email))
     if existing_email:
         raise HTTPException(status_code=400, detail="Ya existe un paciente con ese email")
     
@@ -42,8 +172,10 @@ def create_patient(patient: PatientCreate, db: Session = Depends(get_db)):
     # Crear el paciente en la base de datos
     db_patient = PatientDB(**patient.dict())
     db.add(db_patient)
-    db.commit()
-    db.refresh(db_patient)
+    await db.commit()
+    await db.refresh(db_patient)
+    # appointments-service pudo guardar un 404 de este ID antes de que existiera
+    background_tasks.add_task(invalidate_appointments_cache, db_patient.id)
     
     # Agregar la edad calculada antes de retornar
     patient_dict = db_patient.__dict__.copy()
@@ -51,25 +183,107 @@ def create_patient(patient: PatientCreate, db: Session = Depends(get_db)):
     
     return patient_dict
 
+async def import_patient_chunk(db: AsyncSession, chunk: list, report: dict) -> List[int]:
+    """Validar un bloque, descartar duplicados con una sola consulta e insertarlo en una transacción.
+    Devuelve los IDs creados"""
+    report["received"] += len(chunk)
+    valid = []
+    for row, record in chunk:
+        if isinstance(record, Exception):
+            add_error(report, row, record)
+            continue
+        try:
+            patient = PatientCreate.model_validate(record)
+        except ValidationError as e:
+            add_error(report, row, e)
+            continue
+        if patient.birth_date >= date.today():
+            add_error(report, row, "La fecha de nacimiento debe ser anterior a hoy", "birth_date")
+            continue
+        valid.append((row, patient))
+    
+    if not valid:
+        return []
+    
+    existing = (await db.execute(select(PatientDB.document_id, PatientDB.email).where(or_(
+        PatientDB.document_id.in_([patient.document_id for _, patient in valid]),
+        PatientDB.email.in_([patient.email for _, patient in valid])
+    )))).all()
+    documents = {document_id for document_id, _ in existing}
+    emails = {email for _, email in existing}
+    
+    accepted = []
+    for row, patient in valid:
+        if patient.document_id in documents:
+            add_error(report, row, "Ya existe un paciente con ese número de documento", "document_id")
+        elif patient.email in emails:
+            add_error(report, row, "Ya existe un paciente con ese email", "email")
+        else:
+            # También evita duplicados dentro del mismo archivo
+            documents.add(patient.document_id)
+            emails.add(patient.email)
+            accepted.append((row, patient.dict()))
+    
+    if not accepted:
+        return []
+    try:
+        created_ids = (await db.execute(insert(PatientDB).returning(PatientDB.id), [values for _, values in accepted])).scalars().all()
+        await db.commit()
+        report["created"] += len(accepted)
+        return list(created_ids)
+    except Exception as e:
+        await db.rollback()
+        for row, _ in accepted:
+            add_error(report, row, f"No se pudo insertar el bloque: {e}")
+        return []
+
+@app.post("/patients/bulk")
+async def bulk_create_patients(request: Request, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_db)):
+    """Importación masiva desde NDJSON o un arreglo JSON; los errores se reportan por fila"""
+    report = new_report()
+    created_ids = []
+    try:
+        async for chunk in iter_chunks(iter_records(request.stream())):
+            created_ids.extend(await import_patient_chunk(db, chunk, report))
+    except BulkFormatError as e:
+        # Los bloques anteriores ya quedaron guardados
+        report["format_error"] = str(e)
+    if created_ids:
+        background_tasks.add_task(invalidate_appointments_cache_many, created_ids)
+    return report
+
 @app.get("/patients", response_model=List[Patient])
-def get_patients(
+async def get_patients(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Cursor X-Next-Cursor de la página anterior"),
+    sort_by: str = Query("id"),
+    order: str = Query("asc", pattern="^(asc|desc)$"),
     active_only: bool = Query(True),
     blood_type: Optional[str] = Query(None),
     gender: Optional[str] = Query(None),
-    db: Session = Depends(get_db)
+    ids: Optional[str] = Query(None, description="IDs separados por coma para consulta masiva"),
+    db: AsyncSession = Depends(get_db)
 ):
-    query = db.query(PatientDB)
+    query = select(PatientDB)
+    
+    # Consulta masiva por IDs: sin paginación ni filtros de estado
+    if ids:
+        id_list = parse_ids(ids)
+        patients = (await db.scalars(query.where(PatientDB.id.in_(id_list)))).all()
+        return [{**patient.__dict__, 'age': calculate_age(patient.birth_date)} for patient in patients]
     
     if active_only:
-        query = query.filter(PatientDB.is_active == True)
+        query = query.where(PatientDB.is_active == True)
     if blood_type:
-        query = query.filter(PatientDB.blood_type == blood_type)
+        query = query.where(PatientDB.blood_type == blood_type)
     if gender:
-        query = query.filter(PatientDB.gender == gender)
+        query = query.where(PatientDB.gender == gender)
     
-    patients = query.offset(skip).limit(limit).all()
+    columns = sort_columns(SORT_OPTIONS, sort_by)
+    query = paginate(query, columns, sort_by, limit, skip=skip, cursor=cursor, descending=order == "desc")
+    patients = page_rows((await db.scalars(query)).all(), columns, sort_by, limit, response, descending=order == "desc")
     
     patients_with_age = []
     for patient in patients:
@@ -79,9 +293,31 @@ def get_patients(
     
     return patients_with_age
 
+@app.get("/patients/export")
+def export_patients(
+    export_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+    since: Optional[datetime] = Query(None, description="Solo pacientes modificados después de esta fecha (updated_at)"),
+    date_from: Optional[date] = Query(None, description="Creados desde esta fecha"),
+    date_to: Optional[date] = Query(None, description="Creados hasta esta fecha"),
+    active_only: bool = Query(False)
+):
+    """Extracto completo o incremental en NDJSON o CSV, enviado en streaming"""
+    query = select(*PatientDB.__table__.c)
+    
+    if since:
+        query = query.where(PatientDB.updated_at > since)
+    if date_from:
+        query = query.where(PatientDB.created_at >= datetime.combine(date_from, time.min))
+    if date_to:
+        query = query.where(PatientDB.created_at < datetime.combine(date_to + timedelta(days=1), time.min))
+    if active_only:
+        query = query.where(PatientDB.is_active == True)
+    
+    return export_response(query.order_by(PatientDB.id), export_format, "patients")
+
 @app.get("/patients/{patient_id}", response_model=Patient)
-def get_patient(patient_id: int, db: Session = Depends(get_db)):
-    patient = db.query(PatientDB).filter(PatientDB.id == patient_id).first()
+async def get_patient(patient_id: int, db: AsyncSession = Depends(get_db)):
+    patient = await db.scalar(select(PatientDB).where(PatientDB.id == patient_id))
     if not patient:
         raise HTTPException(status_code=404, detail="Paciente no encontrado")
     
@@ -91,8 +327,8 @@ def get_patient(patient_id: int, db: Session = Depends(get_db)):
     return patient_dict
 
 @app.put("/patients/{patient_id}", response_model=Patient)
-def update_patient(patient_id: int, patient_update: PatientUpdate, db: Session = Depends(get_db)):
-    db_patient = db.query(PatientDB).filter(PatientDB.id == patient_id).first()
+async def update_patient(patient_id: int, patient_update: PatientUpdate, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_db)):
+    db_patient = await db.scalar(select(PatientDB).where(PatientDB.id == patient_id))
     if not db_patient:
         raise HTTPException(status_code=404, detail="Paciente no encontrado")
     
@@ -102,8 +338,9 @@ def update_patient(patient_id: int, patient_update: PatientUpdate, db: Session =
         setattr(db_patient, field, value)
     
     db_patient.updated_at = datetime.utcnow()
-    db.commit()
-    db.refresh(db_patient)
+    await db.commit()
+    background_tasks.add_task(invalidate_appointments_cache, patient_id)
+    await db.refresh(db_patient)
     
     patient_dict = db_patient.__dict__.copy()
     patient_dict['age'] = calculate_age(db_patient.birth_date)
@@ -111,23 +348,27 @@ def update_patient(patient_id: int, patient_update: PatientUpdate, db: Session =
     return patient_dict
 
 @app.delete("/patients/{patient_id}")
-def delete_patient(patient_id: int, db: Session = Depends(get_db)):
-    db_patient = db.query(PatientDB).filter(PatientDB.id == patient_id).first()
+async def delete_patient(patient_id: int, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_db)):
+    db_patient = await db.scalar(select(PatientDB).where(PatientDB.id == patient_id))
     if not db_patient:
         raise HTTPException(status_code=404, detail="Paciente no encontrado")
     
     db_patient.is_active = False
     db_patient.updated_at = datetime.utcnow()
-    db.commit()
+    await db.commit()
+    background_tasks.add_task(invalidate_appointments_cache, patient_id)
     return {"message": f"Paciente {patient_id} desactivado correctamente"}
 
 @app.get("/patients/search/{search_term}", response_model=List[Patient])
-def search_patients(search_term: str, db: Session = Depends(get_db)):
-    patients = db.query(PatientDB).filter(
-        (PatientDB.full_name.ilike(f"%{search_term}%")) |
-        (PatientDB.document_id.ilike(f"%{search_term}%")) |
-        (PatientDB.email.ilike(f"%{search_term}%"))
-    ).filter(PatientDB.is_active == True).all()
+async def search_patients(
+    search_term: str,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_db)
+):
+    # Búsqueda por prefijo y sin acentos ("jose per" encuentra "José Pérez"), ordenada por relevancia
+    query = patient_search.query(search_term).where(PatientDB.is_active == True)
+    patients = (await db.scalars(query.offset(skip).limit(limit))).all()
     
     patients_with_age = []
     for patient in patients:
@@ -138,8 +379,8 @@ def search_patients(search_term: str, db: Session = Depends(get_db)):
     return patients_with_age
 
 @app.get("/patients/document/{document_id}", response_model=Patient)
-def get_patient_by_document(document_id: str, db: Session = Depends(get_db)):
-    patient = db.query(PatientDB).filter(PatientDB.document_id == document_id).first()
+async def get_patient_by_document(document_id: str, db: AsyncSession = Depends(get_db)):
+    patient = await db.scalar(select(PatientDB).where(PatientDB.document_id == document_id))
     if not patient:
         raise HTTPException(status_code=404, detail="Paciente no encontrado")
     
@@ -149,14 +390,15 @@ def get_patient_by_document(document_id: str, db: Session = Depends(get_db)):
     return patient_dict
 
 @app.patch("/patients/{patient_id}/activate")
-def activate_patient(patient_id: int, db: Session = Depends(get_db)):
-    db_patient = db.query(PatientDB).filter(PatientDB.id == patient_id).first()
+async def activate_patient(patient_id: int, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_db)):
+    db_patient = await db.scalar(select(PatientDB).where(PatientDB.id == patient_id))
     if not db_patient:
         raise HTTPException(status_code=404, detail="Paciente no encontrado")
     
     db_patient.is_active = True
     db_patient.updated_at = datetime.utcnow()
-    db.commit()
+    await db.commit()
+    background_tasks.add_task(invalidate_appointments_cache, patient_id)
     return {"message": f"Paciente {patient_id} activado correctamente"}
 
 if __name__ == "__main__":
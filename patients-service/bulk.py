@@ -0,0 +1,111 @@
+import json
+import os
+from typing import AsyncIterator, List, Tuple
+
+from pydantic import ValidationError
+
+# Filas que se validan e insertan juntas, en una sola transacción
+BULK_IMPORT_CHUNK_SIZE = int(os.getenv("BULK_IMPORT_CHUNK_SIZE", "1000"))
+
+_decoder = json.JSONDecoder()
+
+class BulkFormatError(ValueError):
+    pass
+
+async def iter_records(stream: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, object]]:
+    """Leer (fila, objeto) de un cuerpo NDJSON o de un arreglo JSON sin cargarlo entero en memoria"""
+    buffer = ""
+    position = 0
+    is_array = None
+    row = 0
+    finished = False
+    pending = b""
+
+    async for chunk in stream:
+        # Un carácter UTF-8 puede quedar partido entre dos chunks
+        pending += chunk
+        try:
+            text = pending.decode("utf-8")
+            pending = b""
+        except UnicodeDecodeError as e:
+            if e.end < len(pending):
+                raise BulkFormatError("El cuerpo no es UTF-8 válido")
+            text = pending[:e.start].decode("utf-8")
+            pending = pending[e.start:]
+        buffer = buffer[position:] + text
+        position = 0
+
+        while True:
+            # Saltar espacios, saltos de línea y separadores
+            while position < len(buffer) and (buffer[position].isspace() or (is_array and buffer[position] == ",")):
+                position += 1
+            if position >= len(buffer):
+                break
+
+            if is_array is None:
+                is_array = buffer[position] == "["
+                if is_array:
+                    position += 1
+                    continue
+            if finished:
+                raise BulkFormatError("Contenido después del final del arreglo")
+            if is_array and buffer[position] == "]":
+                finished = True
+                position += 1
+                continue
+
+            try:
+                value, end = _decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError as e:
+                # Puede ser un objeto incompleto: esperar más datos, salvo que la línea ya esté completa
+                if not is_array and "\n" in buffer[position:]:
+                    line_end = buffer.index("\n", position)
+                    yield row, BulkFormatError(f"JSON inválido: {e.msg}")
+                    row += 1
+                    position = line_end + 1
+                    continue
+                break
+            yield row, value
+            row += 1
+            position = end
+
+    rest = buffer[position:].strip()
+    if pending or (is_array and rest):
+        raise BulkFormatError("El cuerpo termina con un registro incompleto")
+    if rest:
+        yield row, BulkFormatError("JSON inválido en la última línea")
+    elif is_array and not finished:
+        raise BulkFormatError("Falta el cierre del arreglo")
+
+async def iter_chunks(records: AsyncIterator[Tuple[int, object]], size: int = BULK_IMPORT_CHUNK_SIZE) -> AsyncIterator[List[Tuple[int, object]]]:
+    chunk = []
+    try:
+        async for record in records:
+            chunk.append(record)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+    except BulkFormatError:
+        # Procesar lo que se alcanzó a leer antes del error de formato
+        if chunk:
+            yield chunk
+        raise
+    if chunk:
+        yield chunk
+
+def validation_errors(error: Exception) -> List[dict]:
+    """Errores de una fila en un formato que se puede serializar"""
+    if isinstance(error, ValidationError):
+        return [
+            {"field": ".".join(str(part) for part in item["loc"]), "message": item["msg"]}
+            for item in error.errors()
+        ]
+    return [{"field": None, "message": str(error)}]
+
+def new_report() -> dict:
+    return {"received": 0, "created": 0, "failed": 0, "errors": []}
+
+def add_error(report: dict, row: int, error, field: str = None):
+    errors = validation_errors(error) if isinstance(error, Exception) else [{"field": field, "message": error}]
+    report["errors"].append({"row": row, "errors": errors})
+    report["failed"] += 1
@@ -1,12 +1,21 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, Boolean, DateTime, Date
+from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, Date
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
 from datetime import datetime
+import os
+from db_engine import Database
+from search import SearchIndex
 
-DATABASE_URL = "sqlite:///./patients.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+# Engine, pool e instrumentación compartidos con los otros servicios (db_engine.py)
+database = Database(os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./patients.db"))
+engine = database.engine
+DATABASE_URL = database.url
+IS_SQLITE = database.is_sqlite
+SessionLocal = database.session_factory
+query_profiler = database.profiler
+pool_status = database.pool_status
+check_database = database.check
+get_db = database.session
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 class PatientDB(Base):
@@ -27,14 +36,19 @@ class PatientDB(Base):
     allergies = Column(Text, nullable=True)
     current_medications = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     is_active = Column(Boolean, default=True)
 
-Base.metadata.create_all(bind=engine)
+# Búsqueda por nombre y documento; el nombre pesa más en el ranking
+patient_search = SearchIndex(PatientDB, ["full_name", "document_id", "email"], [10.0, 5.0, 1.0])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
\ No newline at end of file
+def create_missing_indexes(connection):
+    """create_all no agrega índices nuevos a tablas que ya existen"""
+    for index in PatientDB.__table__.indexes:
+        index.create(bind=connection, checkfirst=True)
+
+async def init_db():
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+        await connection.run_sync(create_missing_indexes)
+        await connection.run_sync(patient_search.setup)
@@ -0,0 +1,202 @@
+"""Engine asíncrono con pool de conexiones, ajustes de SQLite e instrumentación (métricas, trazas y profiler).
+
+Se comparte entre los tres microservicios: las copias deben ser idénticas
+(lo verifica scripts/check_shared_modules.py), y lo propio de cada servicio queda en database.py.
+"""
+import asyncio
+import os
+from time import perf_counter
+
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from metrics import registry
+from profiler import SQL_PROFILER_ENABLED, QueryProfiler
+from tracing import start_child_span
+
+def async_database_url(url: str) -> str:
+    """Usar el driver asíncrono que corresponda: aiosqlite para SQLite, asyncpg para PostgreSQL"""
+    if url.startswith("sqlite://"):
+        return url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    if url.startswith("postgresql://"):
+        return url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    if url.startswith("postgres://"):
+        return url.replace("postgres://", "postgresql+asyncpg://", 1)
+    return url
+
+# Pool de conexiones
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# En un archivo SQLite local la conexión no se corta: el ping solo agregaría una consulta por checkout.
+# None: activado salvo en SQLite
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING")
+
+# Ajustes de SQLite aplicados en cada conexión nueva
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+# Tiempo máximo para la verificación de la base de datos en /health/ready
+DB_HEALTH_TIMEOUT = float(os.getenv("DB_HEALTH_TIMEOUT", "2"))
+
+# Un span por consulta SQL dentro de las trazas que se registran
+TRACE_MAX_STATEMENT_LENGTH = 500
+
+# Duración de las consultas SQL por tipo de sentencia
+db_query_duration_seconds = registry.histogram(
+    "db_query_duration_seconds", "Duración de las consultas a la base de datos", ("operation",)
+)
+
+def _operation(statement: str) -> str:
+    words = statement.split(None, 1)
+    return words[0].upper() if words else "OTHER"
+
+class Database:
+    """Engine, sesiones y estado del pool de un servicio"""
+
+    def __init__(self, url: str):
+        self.url = async_database_url(url)
+        self.is_sqlite = self.url.startswith("sqlite")
+        self.engine = create_async_engine(self.url, **self.engine_options())
+        self.session_factory = async_sessionmaker(self.engine, autoflush=False, expire_on_commit=False)
+        self.pool_metrics = {
+            "connects": 0, "checkouts": 0, "checkins": 0, "waits": 0, "wait_seconds_total": 0.0, "wait_seconds_max": 0.0
+        }
+
+        sync_engine = self.engine.sync_engine
+        event.listen(sync_engine, "connect", self._on_connect)
+        event.listen(sync_engine, "checkout", self._on_checkout)
+        event.listen(sync_engine, "checkin", self._on_checkin)
+        event.listen(sync_engine, "before_cursor_execute", self._before_execute)
+        event.listen(sync_engine, "after_cursor_execute", self._after_execute)
+        event.listen(sync_engine, "handle_error", self._on_error)
+
+        # Profiler de consultas (opcional): fingerprint, duración, filas y plan de las lentas
+        self.profiler = QueryProfiler()
+        if SQL_PROFILER_ENABLED:
+            self.profiler.attach(self.engine)
+
+    def engine_options(self) -> dict:
+        if self.is_sqlite and ":memory:" in self.url:
+            return {}
+        pre_ping = not self.is_sqlite if DB_POOL_PRE_PING is None else DB_POOL_PRE_PING.lower() in ("1", "true", "yes")
+        return {
+            # aiosqlite usa NullPool por defecto; un pool conserva las conexiones con sus PRAGMA y su cache
+            "poolclass": AsyncAdaptedQueuePool,
+            "pool_size": DB_POOL_SIZE,
+            "max_overflow": DB_MAX_OVERFLOW,
+            "pool_timeout": DB_POOL_TIMEOUT,
+            "pool_recycle": DB_POOL_RECYCLE,
+            "pool_pre_ping": pre_ping
+        }
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        self.pool_metrics["connects"] += 1
+        if not self.is_sqlite:
+            return
+        # WAL permite lectores concurrentes con un escritor; busy_timeout espera en vez de fallar con database is locked
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.close()
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        self.pool_metrics["checkouts"] += 1
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        self.pool_metrics["checkins"] += 1
+
+    def _before_execute(self, connection, cursor, statement, parameters, context, executemany):
+        connection.info.setdefault("query_started", []).append(perf_counter())
+        query_span = start_child_span(f"db {_operation(statement)}", "CLIENT", self.engine.dialect.name)
+        if query_span is not None:
+            query_span.set_tag("db.statement", statement[:TRACE_MAX_STATEMENT_LENGTH])
+        connection.info.setdefault("query_spans", []).append(query_span)
+
+    def _after_execute(self, connection, cursor, statement, parameters, context, executemany):
+        started = connection.info["query_started"].pop()
+        db_query_duration_seconds.observe(perf_counter() - started, _operation(statement))
+        query_span = connection.info["query_spans"].pop()
+        if query_span is not None:
+            # rowcount es -1 cuando el driver no lo conoce (SELECT en SQLite)
+            if cursor.rowcount >= 0:
+                query_span.set_tag("db.rows", cursor.rowcount)
+            query_span.finish()
+
+    def _on_error(self, exception_context):
+        # Una consulta que falla no llega a after_cursor_execute
+        connection = exception_context.connection
+        if connection is None:
+            return
+        if connection.info.get("query_started"):
+            connection.info["query_started"].pop()
+        if connection.info.get("query_spans"):
+            query_span = connection.info["query_spans"].pop()
+            if query_span is not None:
+                query_span.finish(exception_context.original_exception)
+
+    def record_checkout_wait(self, seconds: float):
+        self.pool_metrics["waits"] += 1
+        self.pool_metrics["wait_seconds_total"] += seconds
+        self.pool_metrics["wait_seconds_max"] = max(self.pool_metrics["wait_seconds_max"], seconds)
+
+    def pool_exhausted(self) -> bool:
+        """Todas las conexiones permitidas están en uso: el próximo checkout espera en la cola del pool"""
+        pool = self.engine.sync_engine.pool
+        if not hasattr(pool, "checkedout") or DB_MAX_OVERFLOW < 0:
+            return False
+        return pool.checkedout() >= DB_POOL_SIZE + DB_MAX_OVERFLOW
+
+    def pool_status(self) -> dict:
+        """Estado del pool: conexiones en uso, libres, overflow y tiempos de espera"""
+        pool = self.engine.sync_engine.pool
+        metrics = self.pool_metrics
+        status = {
+            "pool_class": type(pool).__name__,
+            "size": DB_POOL_SIZE,
+            "max_overflow": DB_MAX_OVERFLOW,
+            **metrics,
+            "wait_seconds_avg": metrics["wait_seconds_total"] / metrics["waits"] if metrics["waits"] else 0.0
+        }
+        for name in ("checkedout", "checkedin", "overflow"):
+            if hasattr(pool, name):
+                status[name] = getattr(pool, name)()
+        return status
+
+    async def _ping(self):
+        async with self.engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+
+    async def check(self) -> dict:
+        """Ejecutar una consulta trivial para confirmar que la base de datos responde"""
+        started = perf_counter()
+        error = None
+        try:
+            # El límite incluye la espera por una conexión libre del pool
+            await asyncio.wait_for(self._ping(), timeout=DB_HEALTH_TIMEOUT)
+        except asyncio.TimeoutError:
+            error = "Tiempo de espera agotado"
+        except Exception as e:
+            error = str(e)
+
+        result = {"status": "error" if error else "ok", "latency_ms": round((perf_counter() - started) * 1000, 2)}
+        if error:
+            result["error"] = error
+        return result
+
+    async def session(self):
+        """Dependencia de FastAPI: una sesión por petición"""
+        async with self.session_factory() as db:
+            # Solo se mide la espera cuando el pool está agotado; si no, la conexión se toma
+            # al ejecutar la primera consulta y su tiempo es el de conectar, no el de esperar
+            if self.pool_exhausted():
+                started = perf_counter()
+                await db.connection()
+                self.record_checkout_wait(perf_counter() - started)
+            yield db
@@ -0,0 +1,64 @@
+import csv
+import io
+import json
+import os
+from datetime import date, datetime, time
+from typing import AsyncIterator
+
+from fastapi.responses import StreamingResponse
+from sqlalchemy.sql import Select
+
+from database import SessionLocal
+
+# Filas por lote leídas del cursor del servidor
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+def _json_value(value):
+    if isinstance(value, (date, datetime, time)):
+        return value.isoformat()
+    raise TypeError(f"Tipo no serializable: {type(value).__name__}")
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, (date, datetime, time)):
+        return value.isoformat()
+    return value
+
+async def stream_rows(query: Select, export_format: str) -> AsyncIterator[bytes]:
+    """Leer por lotes desde un cursor del servidor y convertir cada lote sin guardar la tabla en memoria"""
+    # Sesión propia: la de la petición se cierra antes de que termine el streaming
+    async with SessionLocal() as db:
+        result = await db.stream(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        columns = list(result.keys())
+
+        if export_format == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(columns)
+            yield buffer.getvalue().encode()
+
+        async for rows in result.partitions():
+            if export_format == "csv":
+                buffer.seek(0)
+                buffer.truncate()
+                writer.writerows([[_csv_value(value) for value in row] for row in rows])
+                yield buffer.getvalue().encode()
+            else:
+                yield "".join(
+                    json.dumps(dict(zip(columns, row)), default=_json_value, ensure_ascii=False) + "\n" for row in rows
+                ).encode()
+
+def export_response(query: Select, export_format: str, name: str) -> StreamingResponse:
+    # Hora de inicio: el cliente la usa como since del siguiente extracto incremental
+    started_at = datetime.utcnow().isoformat()
+    return StreamingResponse(
+        stream_rows(query, export_format),
+        media_type=EXPORT_FORMATS[export_format],
+        headers={
+            "Content-Disposition": f'attachment; filename="{name}.{export_format}"',
+            "X-Export-Started-At": started_at
+        }
+    )
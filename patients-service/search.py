@@ -0,0 +1,113 @@
+import logging
+import re
+from typing import List, Sequence
+
+from sqlalchemy import column, func, literal, literal_column, or_, select, table
+from sqlalchemy.sql import Select
+
+logger = logging.getLogger("patients-service.search")
+
+class SearchIndex:
+    """Índice de búsqueda: FTS5 en SQLite, pg_trgm en PostgreSQL, ILIKE si ninguno está disponible"""
+
+    def __init__(self, model, columns: Sequence[str], weights: Sequence[float]):
+        self.model = model
+        self.table = model.__tablename__
+        self.columns = list(columns)
+        self.weights = list(weights)
+        self.fts_table = f"{self.table}_fts"
+        self.backend = "ilike"
+
+    def setup(self, connection):
+        """Crear el índice y los triggers que lo mantienen (se ejecuta con run_sync al iniciar)"""
+        dialect = connection.dialect.name
+        try:
+            if dialect == "sqlite":
+                self._setup_fts5(connection)
+                self.backend = "fts5"
+            elif dialect == "postgresql":
+                self._setup_trigram(connection)
+                self.backend = "trigram"
+        except Exception as e:
+            logger.warning("Índice de búsqueda no disponible en %s, se usa ILIKE: %s", self.table, e)
+            self.backend = "ilike"
+
+    def _setup_fts5(self, connection):
+        exists = connection.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (self.fts_table,)
+        ).first()
+        columns = ", ".join(self.columns)
+        new_values = ", ".join(f"new.{column}" for column in self.columns)
+        old_values = ", ".join(f"old.{column}" for column in self.columns)
+
+        # Tabla de contenido externo: el texto vive en la tabla original, FTS5 solo guarda el índice.
+        # remove_diacritics 2 hace que "Jose" encuentre "José"
+        connection.exec_driver_sql(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.fts_table} USING fts5("
+            f"{columns}, content='{self.table}', content_rowid='id', "
+            f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+        connection.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS {self.fts_table}_ai AFTER INSERT ON {self.table} BEGIN "
+            f"INSERT INTO {self.fts_table}(rowid, {columns}) VALUES (new.id, {new_values}); END"
+        )
+        connection.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS {self.fts_table}_ad AFTER DELETE ON {self.table} BEGIN "
+            f"INSERT INTO {self.fts_table}({self.fts_table}, rowid, {columns}) VALUES ('delete', old.id, {old_values}); END"
+        )
+        connection.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS {self.fts_table}_au AFTER UPDATE OF {columns} ON {self.table} BEGIN "
+            f"INSERT INTO {self.fts_table}({self.fts_table}, rowid, {columns}) VALUES ('delete', old.id, {old_values}); "
+            f"INSERT INTO {self.fts_table}(rowid, {columns}) VALUES (new.id, {new_values}); END"
+        )
+        if not exists:
+            # Indexar las filas que ya existían antes de crear el índice
+            connection.exec_driver_sql(f"INSERT INTO {self.fts_table}({self.fts_table}) VALUES ('rebuild')")
+
+    def _setup_trigram(self, connection):
+        connection.exec_driver_sql("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        connection.exec_driver_sql("CREATE EXTENSION IF NOT EXISTS unaccent")
+        # unaccent() no es IMMUTABLE y no se puede usar en un índice sin este envoltorio
+        connection.exec_driver_sql(
+            "CREATE OR REPLACE FUNCTION search_unaccent(text) RETURNS text AS "
+            "$$ SELECT public.unaccent('public.unaccent', $1) $$ LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT"
+        )
+        document = " || ' ' || ".join(self.columns)
+        connection.exec_driver_sql(
+            f"CREATE INDEX IF NOT EXISTS ix_{self.table}_search_trgm ON {self.table} "
+            f"USING gin (search_unaccent(lower({document})) gin_trgm_ops)"
+        )
+
+    @staticmethod
+    def terms(search_term: str) -> List[str]:
+        return re.findall(r"\w+", search_term.lower())
+
+    def query(self, search_term: str) -> Select:
+        """Filas que coinciden con todos los términos (por prefijo), ordenadas por relevancia"""
+        terms = self.terms(search_term)
+        query = select(self.model)
+        if not terms:
+            return query.where(literal(False))
+
+        if self.backend == "fts5":
+            fts = table(self.fts_table, column("rowid"))
+            fts_ref = literal_column(self.fts_table)
+            # Cada término entre comillas y con * para buscar por prefijo; todos deben coincidir
+            match = " ".join(f'"{term}"*' for term in terms)
+            return query.join(fts, fts.c.rowid == self.model.id).where(
+                fts_ref.op("MATCH")(match)
+            ).order_by(func.bm25(fts_ref, *self.weights), self.model.id)
+
+        if self.backend == "trigram":
+            # Misma expresión que el índice para que PostgreSQL lo use
+            text = getattr(self.model, self.columns[0])
+            for name in self.columns[1:]:
+                text = text + literal_column("' '") + getattr(self.model, name)
+            document = func.search_unaccent(func.lower(text))
+            for term in terms:
+                query = query.where(document.like("%" + func.search_unaccent(term) + "%"))
+            return query.order_by(func.similarity(document, func.search_unaccent(" ".join(terms))).desc(), self.model.id)
+
+        for term in terms:
+            query = query.where(or_(*[getattr(self.model, name).ilike(f"%{term}%") for name in self.columns]))
+        return query.order_by(self.model.id)
@@ -0,0 +1,264 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Deque, List, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger("patients-service.tracing")
+
+# Nombre con el que aparecen los spans de esta app
+SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "patients-service")
+
+# Fracción de las trazas nuevas que se registran; las que llegan con traceparent
+# respetan la decisión de quien llama, así una traza queda completa o no queda
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.1"))
+
+# Destino de los spans: "file", "collector" o vacío (solo se propagan los IDs)
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "").lower()
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.ndjson")
+TRACE_COLLECTOR_URL = os.getenv("TRACE_COLLECTOR_URL", "http://localhost:9411/api/v2/spans")
+TRACE_FLUSH_INTERVAL = float(os.getenv("TRACE_FLUSH_INTERVAL", "2"))
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "10000"))
+
+TRACING_ENABLED = TRACE_EXPORTER in ("file", "collector")
+
+REQUEST_ID_HEADER = "X-Request-ID"
+TRACE_ID_HEADER = "X-Trace-Id"
+_ID_HEADERS = {REQUEST_ID_HEADER.lower().encode(), TRACE_ID_HEADER.lower().encode()}
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+_REQUEST_ID = re.compile(r"^[\w.:-]{1,128}$")
+
+def _new_id(bits: int) -> str:
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+class Span:
+    """Una operación dentro de una traza; se exporta en formato Zipkin v2 al terminar"""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "sampled", "request_id",
+                 "remote_service", "tags", "timestamp", "_started")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], sampled: bool, request_id: str,
+                 kind: Optional[str] = None, remote_service: Optional[str] = None):
+        self.trace_id = trace_id
+        self.span_id = _new_id(64)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.sampled = sampled
+        self.request_id = request_id
+        self.remote_service = remote_service
+        self.tags = {}
+        self.timestamp = time.time()
+        self._started = time.perf_counter()
+
+    @property
+    def recording(self) -> bool:
+        return self.sampled and TRACING_ENABLED
+
+    def set_tag(self, key: str, value):
+        if self.recording:
+            self.tags[key] = str(value)
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def finish(self, error: Optional[BaseException] = None):
+        if not self.recording:
+            return
+        if error is not None:
+            self.tags["error"] = str(error) or type(error).__name__
+        exporter.add(self.to_zipkin(time.perf_counter() - self._started))
+
+    def to_zipkin(self, duration: float) -> dict:
+        span = {
+            "traceId": self.trace_id,
+            "id": self.span_id,
+            "name": self.name,
+            "timestamp": int(self.timestamp * 1_000_000),
+            "duration": max(1, int(duration * 1_000_000)),
+            "localEndpoint": {"serviceName": SERVICE_NAME},
+            "tags": {**self.tags, "request_id": self.request_id}
+        }
+        if self.parent_id:
+            span["parentId"] = self.parent_id
+        if self.kind:
+            span["kind"] = self.kind
+        if self.remote_service:
+            span["remoteEndpoint"] = {"serviceName": self.remote_service}
+        return span
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+def start_span(name: str, kind: Optional[str] = None, remote_service: Optional[str] = None) -> Span:
+    """Span hijo del actual o, si no hay ninguno, inicio de una traza nueva"""
+    parent = _current_span.get()
+    if parent is None:
+        trace_id = _new_id(128)
+        return Span(name, trace_id, None, random.random() < TRACE_SAMPLE_RATE, trace_id, kind, remote_service)
+    return Span(name, parent.trace_id, parent.span_id, parent.sampled, parent.request_id, kind, remote_service)
+
+@contextmanager
+def span(name: str, kind: Optional[str] = None, remote_service: Optional[str] = None):
+    """Span que queda como actual mientras dura el bloque; las llamadas httpx dentro llevan su traceparent"""
+    current = start_span(name, kind, remote_service)
+    token = _current_span.set(current)
+    error = None
+    try:
+        yield current
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        _current_span.reset(token)
+        current.finish(error)
+
+def start_child_span(name: str, kind: Optional[str] = None, remote_service: Optional[str] = None) -> Optional[Span]:
+    """Span hijo solo si la traza actual se registra; para operaciones muy frecuentes como las consultas SQL"""
+    parent = _current_span.get()
+    if parent is None or not parent.recording:
+        return None
+    return start_span(name, kind, remote_service)
+
+def parse_traceparent(value: Optional[str]) -> Optional[Tuple[str, str, bool]]:
+    """(trace_id, span_id del padre, sampled) de un header traceparent W3C válido"""
+    match = _TRACEPARENT.match(value.strip().lower()) if value else None
+    if not match or match.group(1) == "0" * 32 or match.group(2) == "0" * 16:
+        return None
+    return match.group(1), match.group(2), bool(int(match.group(3), 16) & 1)
+
+async def inject_trace_headers(request: httpx.Request):
+    """Event hook de httpx: propagar la traza y el request ID a todas las llamadas salientes"""
+    current = _current_span.get()
+    if current is not None:
+        request.headers["traceparent"] = current.traceparent()
+        request.headers[REQUEST_ID_HEADER] = current.request_id
+
+class TracingMiddleware:
+    """Middleware ASGI: continúa la traza de quien llama (traceparent) o inicia una nueva, y devuelve el request ID"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = {key.decode("latin-1").lower(): value.decode("latin-1") for key, value in scope["headers"]}
+        parent = parse_traceparent(headers.get("traceparent"))
+        if parent:
+            trace_id, parent_id, sampled = parent
+        else:
+            trace_id, parent_id, sampled = _new_id(128), None, random.random() < TRACE_SAMPLE_RATE
+        request_id = headers.get(REQUEST_ID_HEADER.lower(), "")
+        if not _REQUEST_ID.match(request_id):
+            request_id = trace_id
+
+        server_span = Span(f"{scope['method']} {scope['path']}", trace_id, parent_id, sampled, request_id, "SERVER")
+        token = _current_span.set(server_span)
+
+        async def send_with_ids(message):
+            if message["type"] == "http.response.start":
+                # Reemplazar los que vengan de un microservicio cuando la respuesta se reenvía tal cual
+                message["headers"] = [
+                    (key, value) for key, value in message.get("headers", []) if key.lower() not in _ID_HEADERS
+                ] + [
+                    (REQUEST_ID_HEADER.lower().encode(), request_id.encode()),
+                    (TRACE_ID_HEADER.lower().encode(), trace_id.encode())
+                ]
+                server_span.set_tag("http.status_code", message["status"])
+            await send(message)
+
+        error = None
+        try:
+            await self.app(scope, receive, send_with_ids)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            # La plantilla de la ruta agrupa mejor que la URL con IDs
+            route = scope.get("route")
+            if getattr(route, "path", None):
+                server_span.name = f"{scope['method']} {route.path}"
+            server_span.set_tag("http.path", scope["path"])
+            _current_span.reset(token)
+            server_span.finish(error)
+
+class SpanExporter:
+    """Acumula los spans terminados y los envía por lotes en segundo plano"""
+
+    def __init__(self):
+        # Si el destino no responde se descartan los más viejos en vez de crecer sin límite
+        self._buffer: Deque[dict] = deque(maxlen=TRACE_BUFFER_SIZE)
+        self._task: Optional[asyncio.Task] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self.stats = {"exported": 0, "dropped": 0, "errors": 0}
+
+    def add(self, span_data: dict):
+        if len(self._buffer) == self._buffer.maxlen:
+            self.stats["dropped"] += 1
+        self._buffer.append(span_data)
+
+    def _drain(self) -> List[dict]:
+        batch = list(self._buffer)
+        self._buffer.clear()
+        return batch
+
+    @staticmethod
+    def _write_file(batch: List[dict]):
+        with open(TRACE_FILE, "a", encoding="utf-8") as trace_file:
+            trace_file.writelines(json.dumps(item, ensure_ascii=False) + "\n" for item in batch)
+
+    async def flush(self):
+        batch = self._drain()
+        if not batch:
+            return
+        try:
+            if TRACE_EXPORTER == "file":
+                await asyncio.to_thread(self._write_file, batch)
+            else:
+                if self._client is None:
+                    self._client = httpx.AsyncClient(timeout=5.0)
+                response = await self._client.post(TRACE_COLLECTOR_URL, json=batch)
+                response.raise_for_status()
+            self.stats["exported"] += len(batch)
+        except Exception as e:
+            self.stats["errors"] += 1
+            self.stats["dropped"] += len(batch)
+            logger.warning("No se pudieron exportar %d spans: %s", len(batch), e)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(TRACE_FLUSH_INTERVAL)
+            await self.flush()
+
+    def start(self):
+        if TRACING_ENABLED and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+exporter = SpanExporter()
@@ -0,0 +1,81 @@
+"""Verificar que los módulos copiados en varios servicios sean idénticos salvo el nombre del servicio.
+
+Cada servicio se construye con su propio directorio como contexto de Docker, así que los módulos
+comunes (metrics.py, tracing.py, profiler.py, db_engine.py, ...) viven copiados en cada uno.
+Un cambio en uno de ellos debe copiarse a todos; este script falla si alguna copia difiere.
+
+    python scripts/check_shared_modules.py          # código de salida 1 si hay diferencias
+    python scripts/check_shared_modules.py --sync metrics.py --from patients-service
+"""
+import argparse
+import difflib
+import sys
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List
+
+ROOT = Path(__file__).resolve().parent.parent
+SERVICES = ["api-gateway", "patients-service", "doctors-service", "appointments-service"]
+
+# Módulos propios de cada servicio aunque tengan el mismo nombre
+PER_SERVICE = {"app.py", "database.py", "models.py"}
+
+PLACEHOLDER = "{service}"
+
+def normalize(text: str, service: str) -> str:
+    """El nombre del servicio (loggers, nombre por defecto en las trazas) no cuenta como diferencia"""
+    return text.replace(service, PLACEHOLDER)
+
+def shared_modules() -> Dict[str, List[str]]:
+    """Módulo -> servicios que tienen una copia, para los que están en más de uno"""
+    copies = defaultdict(list)
+    for service in SERVICES:
+        for path in sorted((ROOT / service).glob("*.py")):
+            if path.name not in PER_SERVICE:
+                copies[path.name].append(service)
+    return {name: services for name, services in sorted(copies.items()) if len(services) > 1}
+
+def check() -> int:
+    differences = 0
+    for name, services in shared_modules().items():
+        reference = services[0]
+        expected = normalize((ROOT / reference / name).read_text(encoding="utf-8"), reference)
+        for service in services[1:]:
+            actual = normalize((ROOT / service / name).read_text(encoding="utf-8"), service)
+            if actual == expected:
+                continue
+            differences += 1
+            sys.stdout.writelines(difflib.unified_diff(
+                expected.splitlines(keepends=True), actual.splitlines(keepends=True),
+                fromfile=f"{reference}/{name}", tofile=f"{service}/{name}"
+            ))
+        print(f"{name}: {', '.join(services)}", file=sys.stderr)
+    if differences:
+        print(f"\n{differences} copias difieren; copiar el cambio a todas con --sync", file=sys.stderr)
+    return 1 if differences else 0
+
+def sync(name: str, source: str):
+    """Copiar un módulo de un servicio a los demás que lo tienen, cambiando el nombre del servicio"""
+    services = shared_modules().get(name)
+    if not services or source not in services:
+        raise SystemExit(f"{name} no es un módulo compartido de {source}")
+    template = normalize((ROOT / source / name).read_text(encoding="utf-8"), source)
+    for service in services:
+        if service != source:
+            (ROOT / service / name).write_text(template.replace(PLACEHOLDER, service), encoding="utf-8")
+            print(f"{service}/{name} actualizado", file=sys.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description="Verificar las copias de los módulos compartidos entre servicios")
+    parser.add_argument("--sync", metavar="MODULO", help="Copiar este módulo desde --from a los demás servicios")
+    parser.add_argument("--from", dest="source", metavar="SERVICIO", help="Servicio con la versión correcta")
+    args = parser.parse_args()
+
+    if args.sync:
+        if not args.source:
+            parser.error("--sync requiere --from")
+        sync(args.sync, args.source)
+    sys.exit(check())
+
+if __name__ == "__main__":
+    main()